@@ -0,0 +1,569 @@
+"""
+Generate a synthetic xonfinance dataset of any size into a local MongoDB.
+
+Writes referentially consistent users, planning projects, execution projects, RABs with
+categorized rab_items, multi-item bahan transactions with suppliers (plus the other
+transaction categories), the inventory those purchases produce, warehouse withdrawals
+against it, tasks and notifications. Activity is skewed with a Zipf-like distribution
+(--skew 0 is uniform): a few projects get most transactions, a few items and suppliers
+most purchases. The same --seed gives the same data, with dates relative to now.
+
+Documents go in with bulk inserts; afterwards the server's own index and backfill setup
+builds the derived collections (supplier_price_history, suppliers, inventory ledger).
+
+Needs a local mongod. The data collections and the collections derived from them are dropped
+and recreated; other collections in the target database are left alone.
+
+Usage: python backend/benchmarks/generate_data.py [--projects 200] [--transactions 100000] [--skew 1.1]
+"""
+import argparse
+import asyncio
+import bisect
+import importlib
+import itertools
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+INSERT_BATCH_SIZE = 5000
+DATA_COLLECTIONS = [
+    "users", "planning_projects", "projects", "rabs", "rab_items", "transactions",
+    "inventory", "warehouse_transactions", "tasks", "notifications"
+]
+# Built by the server from the data collections; dropped too so the setup rebuilds them for the new data
+DERIVED_COLLECTIONS = [
+    "supplier_price_history", "suppliers", "inventory_events", "inventory_snapshots",
+    "inventory_valuations", "inventory_valuation_layers", "rab_revisions", "rab_write_locks",
+    "collection_versions", "cache_entries"
+]
+
+PROJECT_TYPES = ["interior", "arsitektur"]
+CITIES = ["Jakarta", "Bandung", "Surabaya", "Bekasi", "Tangerang", "Depok", "Bogor", "Semarang", "Yogyakarta", "Denpasar"]
+PROJECT_KINDS = ["Rumah Tinggal", "Ruko", "Kantor", "Kafe", "Apartemen", "Klinik", "Gudang", "Villa", "Toko", "Sekolah"]
+CLIENT_NAMES = ["Budi", "Siti", "Andi", "Dewi", "Rudi", "Ayu", "Hendra", "Rina", "Agus", "Maya", "Joko", "Lina"]
+USER_ROLES = ["accounting", "site_supervisor", "drafter", "employee", "employee", "employee"]
+
+# RAB category -> work items as (description, unit, base unit price)
+RAB_WORK_ITEMS = {
+    "persiapan": [("Pembersihan lokasi", "LS", 2500000), ("Pengukuran dan bouwplank", "M", 35000), ("Direksi keet", "LS", 5000000)],
+    "struktur": [("Pondasi batu kali", "M3", 950000), ("Sloof beton 15/20", "M3", 4200000), ("Kolom beton 15/15", "M3", 4500000), ("Balok ring", "M3", 4300000)],
+    "dinding": [("Pasangan bata ringan", "M2", 145000), ("Plesteran", "M2", 65000), ("Acian", "M2", 35000)],
+    "lantai": [("Keramik 60x60", "M2", 185000), ("Granit 60x60", "M2", 320000), ("Screed lantai", "M2", 75000)],
+    "plafon": [("Rangka hollow", "M2", 95000), ("Gypsum board 9mm", "M2", 85000), ("List profil", "M", 45000)],
+    "finishing": [("Cat dinding interior", "M2", 38000), ("Cat dinding eksterior", "M2", 48000), ("Kusen aluminium", "M", 225000), ("Pintu panel", "Unit", 1850000)],
+    "mekanikal": [("Instalasi air bersih", "Titik", 450000), ("Instalasi air kotor", "Titik", 525000), ("Closet duduk", "Unit", 2100000)],
+    "elektrikal": [("Instalasi titik lampu", "Titik", 275000), ("Instalasi stop kontak", "Titik", 295000), ("Panel listrik", "Unit", 3500000)],
+}
+
+# Purchasable materials as (name, unit, base unit price); specs multiply them into a large catalog
+MATERIALS = [
+    ("Semen", "sak", 65000), ("Pasir", "m3", 280000), ("Batu split", "m3", 320000), ("Besi beton", "batang", 95000),
+    ("Bata ringan", "m3", 720000), ("Keramik", "dus", 145000), ("Granit", "dus", 310000), ("Cat tembok", "pail", 850000),
+    ("Gypsum board", "lembar", 78000), ("Hollow galvalum", "batang", 42000), ("Pipa PVC", "batang", 68000),
+    ("Kabel NYM", "roll", 720000), ("Triplek", "lembar", 155000), ("HPL", "lembar", 285000), ("Lem kayu", "kg", 45000),
+    ("Paku", "kg", 22000), ("Sekrup gypsum", "box", 38000), ("Kawat bendrat", "kg", 25000), ("Mortar instan", "sak", 95000),
+    ("Waterproofing", "pail", 650000), ("Lampu LED", "pcs", 55000), ("Stop kontak", "pcs", 35000), ("Kran air", "pcs", 85000),
+]
+SPECS = ["", "Tipe A", "Tipe B", "Premium", "Ekonomis", "Grade 1", "Grade 2", "Putih", "Abu-abu", "Hitam", "40x40", "60x60", "10mm", "12mm", "1/2 inch", "3/4 inch"]
+TOOLS = [("Bor listrik", "unit", 950000), ("Gerinda", "unit", 650000), ("Tangga aluminium", "unit", 1250000),
+         ("Mesin molen", "unit", 8500000), ("Scaffolding", "set", 450000), ("Waterpass", "unit", 175000)]
+SUPPLIER_PREFIXES = ["Toko Bangunan", "TB", "Depo", "UD", "CV", "Toko Besi", "Mitra", "Sentral"]
+SUPPLIER_NAMES = ["Jaya", "Makmur", "Sejahtera", "Abadi", "Sumber Rejeki", "Karya", "Mandiri", "Sentosa", "Berkah", "Maju"]
+
+# Share of non-bahan transactions per category
+OTHER_CATEGORIES = {"upah": 0.35, "alat": 0.1, "vendor": 0.15, "operasional": 0.2, "kas_masuk": 0.2}
+TASK_TITLES = ["Survey lokasi", "Gambar kerja", "Revisi desain", "Pengecoran", "Pemasangan keramik", "Pengecatan",
+               "Instalasi listrik", "Serah terima", "Cek material", "Laporan mingguan"]
+NOTIFICATION_TYPES = ["info", "info", "info", "success", "warning", "error"]
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights 1/rank^skew for rng.choices; rank 1 is the most popular"""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def new_id(rng):
+    """uuid4-style id drawn from rng, so a seed also reproduces ids"""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def pick(rng, population, cum_weights):
+    return rng.choices(population, cum_weights=cum_weights)[0]
+
+
+def random_date(rng, now, days):
+    return now - timedelta(minutes=rng.randint(0, days * 24 * 60))
+
+
+async def insert_batched(collection, docs):
+    for start in range(0, len(docs), INSERT_BATCH_SIZE):
+        await collection.insert_many(docs[start:start + INSERT_BATCH_SIZE], ordered=False)
+
+
+class BatchWriter:
+    """Buffers generated documents per collection and flushes them with insert_many"""
+
+    def __init__(self, db):
+        self.db = db
+        self.buffers = {}
+        self.counts = {}
+
+    async def add(self, name, doc):
+        buffer = self.buffers.setdefault(name, [])
+        buffer.append(doc)
+        if len(buffer) >= INSERT_BATCH_SIZE:
+            await self.flush(name)
+
+    async def flush(self, name=None):
+        for key in [name] if name else list(self.buffers):
+            buffer = self.buffers.get(key)
+            if buffer:
+                await self.db[key].insert_many(buffer, ordered=False)
+                self.counts[key] = self.counts.get(key, 0) + len(buffer)
+                self.buffers[key] = []
+
+
+def build_catalogs(options, rng):
+    """Material, tool and supplier catalogs of the requested cardinality, most popular first"""
+    materials = [
+        (f"{name} {spec}".strip(), unit, round(price * rng.uniform(0.7, 1.5), -2))
+        for spec in SPECS for name, unit, price in MATERIALS
+    ][:options.items]
+    names = list(itertools.product(SUPPLIER_PREFIXES, SUPPLIER_NAMES))
+    suppliers = [
+        f"{prefix} {name}" + (f" {idx // len(names) + 1}" if idx >= len(names) else "")
+        for idx, (prefix, name) in zip(range(options.suppliers), itertools.cycle(names))
+    ]
+    rng.shuffle(materials)
+    rng.shuffle(suppliers)
+    return {"materials": materials, "tools": list(TOOLS), "suppliers": suppliers}
+
+
+def generate_users(options, rng, now):
+    users = [{
+        "id": "synthetic-admin", "email": "admin@synthetic.local", "username": "admin", "name": "Synthetic Admin",
+        "role": "admin", "roles": ["admin"], "created_at": now - timedelta(days=options.days)
+    }]
+    for idx in range(options.users):
+        role = USER_ROLES[idx % len(USER_ROLES)]
+        users.append({
+            "id": new_id(rng), "email": f"user{idx}@synthetic.local", "username": f"user{idx}",
+            "name": f"{CLIENT_NAMES[idx % len(CLIENT_NAMES)]} {idx}", "role": role, "roles": [role],
+            "created_at": now - timedelta(days=options.days)
+        })
+    return users
+
+
+def generate_projects(options, rng, now, admin_email):
+    """
+    Planning projects and execution projects, linked both ways where approved
+    - --approved-ratio of planning projects are approved into an execution project
+    - The remaining execution projects (up to --projects) were created directly, without planning
+    """
+    planning, projects = [], []
+    for idx in range(options.planning_projects):
+        project_type = rng.choice(PROJECT_TYPES)
+        created_at = random_date(rng, now, options.days)
+        planning.append({
+            "id": new_id(rng),
+            "name": f"{rng.choice(PROJECT_KINDS)} {rng.choice(CLIENT_NAMES)} {idx}",
+            "type": project_type,
+            "description": f"Proyek {project_type} sintetis",
+            "location": rng.choice(CITIES),
+            "project_value": round(rng.lognormvariate(20, 0.8), -5),
+            "status": "planning",
+            "design_progress": rng.randint(0, 100),
+            "created_by": admin_email,
+            "created_at": created_at,
+            "approved_at": None,
+            "execution_project_id": None
+        })
+
+    approved = rng.sample(planning, min(options.projects, int(len(planning) * options.approved_ratio)))
+    for plan in approved:
+        approved_at = min(now, plan["created_at"] + timedelta(days=rng.randint(7, 60)))
+        project = {
+            "id": new_id(rng),
+            "name": plan["name"],
+            "type": plan["type"],
+            "description": plan["description"],
+            "contract_date": approved_at,
+            "duration": rng.choice([30, 60, 90, 120, 180]),
+            "location": plan["location"],
+            "project_value": plan["project_value"],
+            "status": rng.choice(["active", "active", "active", "waiting", "completed"]),
+            "design_progress": plan["design_progress"],
+            "planning_project_id": plan["id"],
+            "created_by": admin_email,
+            "created_at": approved_at
+        }
+        plan.update({"status": "approved", "approved_at": approved_at, "execution_project_id": project["id"]})
+        projects.append(project)
+
+    for plan in planning:
+        if plan["status"] == "planning" and rng.random() < 0.1:
+            plan["status"] = "rejected"
+
+    for idx in range(len(projects), options.projects):
+        project_type = rng.choice(PROJECT_TYPES)
+        created_at = random_date(rng, now, options.days)
+        projects.append({
+            "id": new_id(rng),
+            "name": f"{rng.choice(PROJECT_KINDS)} {rng.choice(CLIENT_NAMES)} X{idx}",
+            "type": project_type,
+            "description": f"Proyek {project_type} sintetis",
+            "contract_date": created_at,
+            "duration": rng.choice([30, 60, 90, 120, 180]),
+            "location": rng.choice(CITIES),
+            "project_value": round(rng.lognormvariate(20, 0.8), -5),
+            "status": rng.choice(["active", "active", "waiting", "completed"]),
+            "design_progress": 100,
+            "planning_project_id": None,
+            "created_by": admin_email,
+            "created_at": created_at
+        })
+    return planning, projects
+
+
+async def generate_rabs(writer, options, rng, planning, admin_email):
+    """
+    One RAB per planning project, with a header item per category and its work items
+    - Approved RABs point at the execution project, the others at their planning project
+    - subtotal, tax_amount, total_price and category_totals match the items exactly
+    """
+    for plan in planning:
+        rab_id = new_id(rng)
+        project_id = plan["execution_project_id"] or plan["id"]
+        tax_percentage = rng.choice([0, 11, 11, 11])
+        categories = rng.sample(list(RAB_WORK_ITEMS), rng.randint(3, len(RAB_WORK_ITEMS)))
+        category_totals = {}
+        for category_idx, category in enumerate(categories):
+            await writer.add("rab_items", {
+                "id": new_id(rng), "rab_id": rab_id, "project_id": project_id, "category": category,
+                "item_number": chr(ord("A") + category_idx), "description": category.upper(), "unit": "",
+                "volume": 0, "unit_price": 0, "total_price": 0, "is_category": True, "created_at": plan["created_at"]
+            })
+            for item_idx in range(rng.randint(1, options.rab_items)):
+                description, unit, price = RAB_WORK_ITEMS[category][item_idx % len(RAB_WORK_ITEMS[category])]
+                volume = round(rng.uniform(1, 250), 2) if unit != "LS" else 1
+                unit_price = round(price * rng.uniform(0.85, 1.25), -2)
+                total_price = round(volume * unit_price, 2)
+                category_totals[category] = category_totals.get(category, 0) + total_price
+                await writer.add("rab_items", {
+                    "id": new_id(rng), "rab_id": rab_id, "project_id": project_id, "category": category,
+                    "item_number": str(item_idx + 1), "description": description, "unit": unit, "volume": volume,
+                    "unit_price": unit_price, "total_price": total_price, "is_category": False,
+                    "created_at": plan["created_at"]
+                })
+
+        subtotal = sum(category_totals.values())
+        rate = tax_percentage / 100
+        status = {"approved": "approved", "rejected": "rejected"}.get(plan["status"], rng.choice(["draft", "bidding_process"]))
+        await writer.add("rabs", {
+            "id": rab_id,
+            "project_id": project_id,
+            "project_name": plan["name"],
+            "project_type": plan["type"],
+            "client_name": rng.choice(CLIENT_NAMES),
+            "location": plan["location"],
+            "status": status,
+            "discount": 0.0,
+            "tax": tax_percentage,
+            "tax_percentage": tax_percentage,
+            "subtotal": subtotal,
+            "tax_amount": subtotal * rate,
+            "total_price": subtotal + subtotal * rate,
+            "category_totals": category_totals,
+            "revision": 0,
+            "price_list_id": None,
+            "created_by": admin_email,
+            "created_at": plan["created_at"],
+            "approved_at": plan["approved_at"],
+            "rejected_reason": "Anggaran klien tidak mencukupi" if status == "rejected" else None
+        })
+
+
+def purchase_items(options, rng, catalogs, weights):
+    """Item lines of one bahan purchase; a purchase usually comes from a single supplier"""
+    supplier = pick(rng, catalogs["suppliers"], weights["suppliers"])
+    items = []
+    lines = dict.fromkeys(pick(rng, catalogs["materials"], weights["materials"]) for _ in range(rng.randint(1, options.max_items)))
+    for name, unit, price in lines:
+        if rng.random() < 0.2:
+            supplier = pick(rng, catalogs["suppliers"], weights["suppliers"])
+        quantity = float(rng.randint(1, 100))
+        unit_price = round(price * rng.uniform(0.9, 1.15), -2)
+        items.append({
+            "description": name,
+            "quantity": quantity,
+            "unit": unit,
+            "unit_price": unit_price,
+            "total": quantity * unit_price,
+            "status": "out_warehouse" if rng.random() < 0.1 else "receiving",
+            "supplier": supplier if rng.random() > options.no_supplier_ratio else None
+        })
+    return items
+
+
+def stock_line(rng, inventory, receipts, transaction, project, name, unit, quantity, unit_price, status):
+    """
+    Apply one purchased line to the inventory document it lands in, as create_transaction does
+    - Warehouse receipts are also kept per inventory id as (date, quantity) for the withdrawals
+    """
+    key = (name, transaction["category"], project["id"])
+    item = inventory.get(key)
+    if not item:
+        item = inventory[key] = {
+            "id": new_id(rng), "item_name": name, "category": transaction["category"],
+            "quantity_in_warehouse": 0.0, "quantity_out_warehouse": 0.0, "quantity": 0.0,
+            "unit": unit, "unit_price": unit_price, "total_value": 0.0, "project_id": project["id"],
+            "project_type": project.get("type", "arsitektur"), "transaction_id": transaction["id"],
+            "status": "Tersedia", "reorder_level": None,
+            "created_at": transaction["transaction_date"], "updated_at": transaction["transaction_date"]
+        }
+    field = "quantity_in_warehouse" if status == "receiving" else "quantity_out_warehouse"
+    item[field] += quantity
+    if status == "receiving":
+        receipts.setdefault(item["id"], []).append((transaction["transaction_date"], quantity))
+    item["quantity"] += quantity
+    if transaction["transaction_date"] >= item["updated_at"]:
+        item["unit_price"] = unit_price
+        item["updated_at"] = transaction["transaction_date"]
+    if transaction["transaction_date"] < item["created_at"]:
+        item.update({"created_at": transaction["transaction_date"], "transaction_id": transaction["id"]})
+
+
+async def generate_transactions(writer, options, rng, now, projects, catalogs, admin_email):
+    """
+    Transactions spread over projects with Zipf skew; returns the inventory they produce and its warehouse receipts
+    - --bahan-ratio of them are multi-item bahan purchases, the rest upah/alat/vendor/operasional/kas_masuk
+    - bahan items and alat purchases are stocked per (item_name, category, project_id)
+    """
+    weights = {
+        "projects": zipf_weights(len(projects), options.skew),
+        "materials": zipf_weights(len(catalogs["materials"]), options.skew),
+        "suppliers": zipf_weights(len(catalogs["suppliers"]), options.skew)
+    }
+    other_categories = list(OTHER_CATEGORIES)
+    other_weights = list(itertools.accumulate(OTHER_CATEGORIES.values()))
+    inventory = {}
+    receipts = {}
+
+    for _ in range(options.transactions):
+        project = pick(rng, projects, weights["projects"])
+        start = project["created_at"]
+        transaction_date = start + (now - start) * rng.random()
+        category = "bahan" if rng.random() < options.bahan_ratio else pick(rng, other_categories, other_weights)
+        transaction = {
+            "id": new_id(rng), "project_id": project["id"], "category": category, "items": [],
+            "quantity": None, "unit": None, "status": None, "receipt": None, "created_by": admin_email,
+            "transaction_date": transaction_date, "created_at": transaction_date
+        }
+
+        if category == "bahan":
+            items = purchase_items(options, rng, catalogs, weights)
+            transaction.update({
+                "description": f"Pembelian material {items[0]['description']}" + (f" dan {len(items) - 1} lainnya" if len(items) > 1 else ""),
+                "amount": sum(item["total"] for item in items),
+                "items": items
+            })
+            for item in items:
+                stock_line(rng, inventory, receipts, transaction, project, item["description"], item["unit"], item["quantity"], item["unit_price"], item["status"])
+        elif category == "alat":
+            name, unit, price = rng.choice(catalogs["tools"])
+            quantity = float(rng.randint(1, 5))
+            unit_price = round(price * rng.uniform(0.9, 1.15), -2)
+            transaction.update({
+                "description": name, "amount": quantity * unit_price, "quantity": quantity, "unit": unit, "status": "receiving"
+            })
+            stock_line(rng, inventory, receipts, transaction, project, name, unit, quantity, unit_price, "receiving")
+        elif category == "kas_masuk":
+            transaction.update({
+                "description": f"Termin pembayaran {project['name']}",
+                "amount": round((project.get("project_value") or 0) * rng.choice([0.1, 0.2, 0.3]), -3)
+            })
+        else:
+            transaction.update({
+                "description": f"{category.capitalize()} {project['name']}",
+                "amount": round(rng.lognormvariate(14.5, 1.0), -3)
+            })
+        await writer.add("transactions", transaction)
+
+    for item in inventory.values():
+        item["total_value"] = item["quantity"] * item["unit_price"]
+    return list(inventory.values()), receipts
+
+
+async def generate_warehouse_transactions(writer, options, rng, now, inventory, receipts, projects_by_id, admin_email):
+    """
+    Withdrawals from warehouse stock, never taking an item below zero at any point in time
+    - Dates are drawn after the item's first receipt, then replayed in date order against what was received by then
+    - Updates the inventory in place
+    """
+    stocked = [item for item in inventory if receipts.get(item["id"])]
+    if not stocked:
+        return
+    received = {}
+    for item in stocked:
+        lots = sorted(receipts[item["id"]])
+        received[item["id"]] = ([date for date, _ in lots], list(itertools.accumulate(quantity for _, quantity in lots)))
+
+    weights = zipf_weights(len(stocked), options.skew)
+    draws = []
+    for _ in range(options.warehouse_transactions):
+        item = pick(rng, stocked, weights)
+        first_receipt = received[item["id"]][0][0]
+        draws.append((first_receipt + (now - first_receipt) * rng.random(), item))
+    draws.sort(key=lambda draw: draw[0])
+
+    withdrawn = {}
+    for created_at, item in draws:
+        dates, cumulative = received[item["id"]]
+        available = cumulative[bisect.bisect_right(dates, created_at) - 1] - withdrawn.get(item["id"], 0.0)
+        if available < 1:
+            continue
+        quantity = float(rng.randint(1, max(1, int(available * 0.3))))
+        withdrawn[item["id"]] = withdrawn.get(item["id"], 0.0) + quantity
+        usage_type = rng.choices(["production", "return", "adjustment"], weights=[85, 10, 5])[0]
+        await writer.add("warehouse_transactions", {
+            "id": new_id(rng), "inventory_id": item["id"], "item_name": item["item_name"],
+            "quantity": quantity, "unit": item["unit"], "project_id": item["project_id"],
+            "project_name": projects_by_id[item["project_id"]]["name"], "usage_type": usage_type,
+            "category": item["category"], "notes": None, "created_by": admin_email, "created_at": created_at
+        })
+        item["quantity_in_warehouse"] -= quantity
+        item["quantity"] -= quantity
+        item["total_value"] = item["quantity"] * item["unit_price"]
+        item["updated_at"] = max(item["updated_at"], created_at)
+        if item["quantity_in_warehouse"] <= 0 and item["quantity_out_warehouse"] <= 0:
+            item["status"] = "Habis"
+
+
+async def generate_tasks_and_notifications(writer, options, rng, now, projects, users):
+    """Tasks per project (skewed like transactions) and notifications per user, some read"""
+    project_weights = zipf_weights(len(projects), options.skew)
+    staff = [user for user in users if user["role"] != "admin"] or users
+    for _ in range(options.tasks):
+        project = pick(rng, projects, project_weights)
+        assignee = rng.choice(staff)
+        created_at = project["created_at"] + (now - project["created_at"]) * rng.random()
+        duration_days = rng.randint(1, 30)
+        completed = rng.random() < 0.5
+        await writer.add("tasks", {
+            "id": new_id(rng), "project_id": project["id"], "title": rng.choice(TASK_TITLES),
+            "description": None, "assigned_to": assignee["id"], "role": assignee["role"],
+            "status": "completed" if completed else rng.choice(["pending", "in_progress"]),
+            "priority": rng.choice(["low", "medium", "medium", "high"]), "completed": completed,
+            "start_date": created_at, "duration_days": duration_days,
+            "due_date": created_at + timedelta(days=duration_days),
+            "completed_at": created_at + timedelta(days=rng.randint(1, duration_days)) if completed else None,
+            "created_by": users[0]["id"], "created_at": created_at
+        })
+
+    user_weights = zipf_weights(len(users), options.skew)
+    for _ in range(options.notifications):
+        user = pick(rng, users, user_weights)
+        created_at = random_date(rng, now, options.days)
+        await writer.add("notifications", {
+            "id": new_id(rng), "user_id": user["id"], "title": "Notifikasi sintetis",
+            "message": f"Pembaruan proyek #{rng.randint(1, 9999)}", "type": rng.choice(NOTIFICATION_TYPES),
+            "read": created_at < now - timedelta(days=7) or rng.random() < 0.3, "created_at": created_at
+        })
+
+
+async def populate(db, options, now):
+    """Drop the data and derived collections and write a fresh synthetic dataset; returns per-collection counts"""
+    rng = random.Random(options.seed)
+    for name in DATA_COLLECTIONS + DERIVED_COLLECTIONS:
+        await db[name].drop()
+
+    users = generate_users(options, rng, now)
+    admin_email = users[0]["email"]
+    catalogs = build_catalogs(options, rng)
+    planning, projects = generate_projects(options, rng, now, admin_email)
+    if not projects:
+        raise SystemExit("No execution projects to attach transactions to (raise --projects)")
+    counts = {}
+    for name, docs in [("users", users), ("planning_projects", planning), ("projects", projects)]:
+        await insert_batched(db[name], docs)
+        counts[name] = len(docs)
+
+    writer = BatchWriter(db)
+    await generate_rabs(writer, options, rng, planning, admin_email)
+    inventory, receipts = await generate_transactions(writer, options, rng, now, projects, catalogs, admin_email)
+    await generate_warehouse_transactions(
+        writer, options, rng, now, inventory, receipts, {project["id"]: project for project in projects}, admin_email
+    )
+    await generate_tasks_and_notifications(writer, options, rng, now, projects, users)
+    await writer.flush()
+    await insert_batched(db.inventory, inventory)
+    counts.update(writer.counts)
+    counts["inventory"] = len(inventory)
+    return counts
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="xonfinance_synthetic")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, so regenerating gives the same data")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for project/item/supplier popularity (0 = uniform)")
+    parser.add_argument("--days", type=int, default=730, help="history length in days")
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--planning-projects", type=int, default=300)
+    parser.add_argument("--approved-ratio", type=float, default=0.6, help="share of planning projects approved into execution")
+    parser.add_argument("--projects", type=int, default=200, help="execution projects, approved plans first")
+    parser.add_argument("--rab-items", type=int, default=6, help="max work items per RAB category")
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--bahan-ratio", type=float, default=0.6, help="share of transactions that are bahan purchases")
+    parser.add_argument("--max-items", type=int, default=8, help="max item lines per bahan transaction")
+    parser.add_argument("--items", type=int, default=300, help="distinct materials in the catalog (at most 368)")
+    parser.add_argument("--suppliers", type=int, default=120, help="distinct suppliers")
+    parser.add_argument("--no-supplier-ratio", type=float, default=0.05, help="share of item lines without a supplier")
+    parser.add_argument("--warehouse-transactions", type=int, default=20000)
+    parser.add_argument("--tasks", type=int, default=5000)
+    parser.add_argument("--notifications", type=int, default=20000)
+    parser.add_argument("--skip-setup", action="store_true", help="don't run the server's index and backfill setup")
+    return parser
+
+
+def default_options(**overrides):
+    """Generator options with the CLI defaults, for callers like load_test.py"""
+    options = build_parser().parse_args([])
+    for key, value in overrides.items():
+        setattr(options, key, value)
+    return options
+
+
+async def generate(options):
+    os.environ["MONGO_URL"] = options.mongo_url
+    os.environ["DB_NAME"] = options.db
+    server = importlib.import_module("server")
+
+    started = time.perf_counter()
+    counts = await populate(server.db, options, server.now_wib())
+    for name in DATA_COLLECTIONS:
+        print(f"generated {name:<24}{counts.get(name, 0):>10} docs")
+    print(f"inserted in {time.perf_counter() - started:.1f}s")
+
+    if not options.skip_setup:
+        started = time.perf_counter()
+        await server.ensure_indexes()
+        await server.run_startup_backfills()
+        print(f"indexes and backfills in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    asyncio.run(generate(build_parser().parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compare FastAPI's default JSON path with FastJSONResponse on payloads shaped like
+get_inventory, get_transactions and get_planning_overview.
+
+Usage: python backend/benchmarks/json_encoding.py [--rows 5000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server import FastJSONResponse, now_wib
+
+
+def inventory_rows(count):
+    now = now_wib()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "item_name": f"Material {idx % 400}",
+            "category": "bahan" if idx % 3 else "alat",
+            "quantity_in_warehouse": float(idx % 50),
+            "quantity_out_warehouse": float(idx % 7),
+            "quantity": float(idx % 50 + idx % 7),
+            "unit": "sak",
+            "unit_price": 52500.0 + idx,
+            "total_value": (52500.0 + idx) * (idx % 57),
+            "project_id": str(uuid.uuid4()),
+            "project_type": "interior",
+            "transaction_id": str(uuid.uuid4()),
+            "status": "Tersedia",
+            "created_at": now - timedelta(minutes=idx),
+            "updated_at": now
+        }
+        for idx in range(count)
+    ]
+
+
+def transaction_rows(count):
+    now = now_wib()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "project_id": str(uuid.uuid4()),
+            "category": "bahan",
+            "description": f"Pembelian material {idx}",
+            "amount": 1250000.0 + idx,
+            "items": [
+                {
+                    "description": f"Material {line}",
+                    "quantity": float(line + 1),
+                    "unit": "pcs",
+                    "unit_price": 15000.0 + line,
+                    "total": (15000.0 + line) * (line + 1),
+                    "supplier": "TB Jaya",
+                    "status": "receiving"
+                }
+                for line in range(5)
+            ],
+            "transaction_date": now - timedelta(hours=idx),
+            "created_by": str(uuid.uuid4()),
+            "created_at": now - timedelta(hours=idx)
+        }
+        for idx in range(count)
+    ]
+
+
+def planning_overview_rows(count):
+    now = now_wib()
+    return [
+        {
+            "project": {"id": str(uuid.uuid4()), "name": f"Proyek {idx}", "type": "arsitektur", "created_at": now},
+            "rab": {"id": str(uuid.uuid4()), "status": "draft", "total_price": 150000000.0 + idx},
+            "modeling_3d": [],
+            "shop_drawing": [],
+            "schedule": {"items": [{"id": str(uuid.uuid4()), "name": f"Minggu {week}", "progress": week * 10} for week in range(8)]},
+            "schedule_progress": 42.5,
+            "design_progress": 30
+        }
+        for idx in range(max(1, count // 10))
+    ]
+
+
+def default_path(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_path(payload):
+    return FastJSONResponse(payload).body
+
+
+def measure(render, payload, repeat):
+    render(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render(payload)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = {
+        "get_inventory": inventory_rows(args.rows),
+        "get_transactions": transaction_rows(args.rows),
+        "get_planning_overview": planning_overview_rows(args.rows)
+    }
+
+    print(f"{'payload':<24}{'bytes':>12}{'default ms':>14}{'orjson ms':>12}{'speedup':>10}")
+    for name, payload in payloads.items():
+        default_ms = measure(default_path, payload, args.repeat)
+        fast_ms = measure(fast_path, payload, args.repeat)
+        size = len(fast_path(payload))
+        print(f"{name:<24}{size:>12}{default_ms:>14.2f}{fast_ms:>12.2f}{default_ms / fast_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Load-test the key API endpoints against a local server seeded from dump/test_database.
+
+Restores the dump into a dedicated database, scales projects and transactions up to the
+requested volume, runs the server's own index/backfill setup, starts uvicorn on it and
+drives each scenario with concurrent clients. Reports p50/p95/p99 latency and throughput
+and writes the run to benchmarks/results/ as JSON; --compare flags regressions against
+an earlier run (exit code 1).
+
+Needs a local mongod. The benchmark database is dropped and recreated unless --skip-seed.
+
+Usage: python backend/benchmarks/load_test.py [--transactions 10000] [--concurrency 16] [--duration 10]
+       python backend/benchmarks/load_test.py --synthetic --projects 500 --transactions 200000
+       python backend/benchmarks/load_test.py --skip-seed --compare backend/benchmarks/results/<run>.json
+"""
+import argparse
+import asyncio
+import copy
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+import bson
+import httpx
+import numpy as np
+
+import generate_data
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+REPO_DIR = BACKEND_DIR.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+DUMP_COLLECTIONS = ["users", "projects", "rabs", "rab_items", "transactions", "inventory", "schedule_items", "tasks", "notifications"]
+BENCHMARK_USER_ID = "benchmark-admin"
+BENCHMARK_SESSION_TOKEN = "benchmark-session-token"
+INSERT_BATCH_SIZE = 5000
+
+
+def read_dump(dump_dir, name):
+    """Documents of one mongodump .bson file, without their ObjectIds"""
+    path = dump_dir / f"{name}.bson"
+    if not path.exists():
+        return []
+    with open(path, "rb") as handle:
+        return [{k: v for k, v in doc.items() if k != "_id"} for doc in bson.decode_file_iter(handle)]
+
+
+async def insert_batched(collection, docs):
+    for start in range(0, len(docs), INSERT_BATCH_SIZE):
+        await collection.insert_many(docs[start:start + INSERT_BATCH_SIZE], ordered=False)
+
+
+def scale_projects(projects, count, rng, now):
+    """Clone dump projects (new ids, spread contract dates) until there are count of them"""
+    scaled = list(projects)
+    for idx in range(len(projects), count):
+        project = copy.deepcopy(projects[idx % len(projects)])
+        project["id"] = str(uuid.uuid4())
+        project["name"] = f"{project['name']} #{idx}"
+        project["project_value"] = round(project.get("project_value", 0) * rng.uniform(0.5, 2.0), -3)
+        project["created_at"] = now - timedelta(days=rng.randint(0, 730))
+        scaled.append(project)
+    return scaled
+
+
+def scale_transactions(transactions, count, project_ids, rng, now):
+    """
+    Clone dump transactions until there are count of them
+    - Each clone gets a new id, a random project, a date in the last two years and jittered amounts
+    - Item descriptions and suppliers are kept, so supplier/item aggregations see realistic cardinality
+    """
+    scaled = list(transactions)
+    for idx in range(len(transactions), count):
+        transaction = copy.deepcopy(transactions[idx % len(transactions)])
+        factor = rng.uniform(0.8, 1.2)
+        transaction_date = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+        transaction["id"] = str(uuid.uuid4())
+        transaction["project_id"] = rng.choice(project_ids)
+        transaction["amount"] = round(transaction.get("amount", 0) * factor, 2)
+        transaction["transaction_date"] = transaction_date
+        transaction["created_at"] = transaction_date
+        for item in transaction.get("items") or []:
+            item["unit_price"] = round(item.get("unit_price", 0) * factor, 2)
+            item["total"] = round(item["unit_price"] * item.get("quantity", 0), 2)
+        scaled.append(transaction)
+    return scaled
+
+
+async def seed(server, args):
+    """Recreate the benchmark database from the dump (or the synthetic generator) at the requested scale"""
+    db = server.db
+    rng = random.Random(args.seed)
+    now = server.now_wib()
+
+    for name in await db.list_collection_names():
+        await db[name].drop()
+
+    if args.synthetic:
+        started = time.perf_counter()
+        options = generate_data.default_options(projects=args.projects, transactions=args.transactions, seed=args.seed)
+        counts = await generate_data.populate(db, options, now)
+        print(f"seeded {sum(counts.values())} synthetic docs in {time.perf_counter() - started:.1f}s")
+    else:
+        dump = {name: read_dump(args.dump_dir, name) for name in DUMP_COLLECTIONS}
+        if not dump["projects"] or not dump["transactions"]:
+            raise SystemExit(f"No projects/transactions found in {args.dump_dir}")
+
+        dump["projects"] = scale_projects(dump["projects"], max(args.projects, len(dump["projects"])), rng, now)
+        project_ids = [project["id"] for project in dump["projects"]]
+        dump["transactions"] = scale_transactions(
+            dump["transactions"], max(args.transactions, len(dump["transactions"])), project_ids, rng, now
+        )
+
+        for name, docs in dump.items():
+            if docs:
+                started = time.perf_counter()
+                await insert_batched(db[name], docs)
+                print(f"seeded {name:<16}{len(docs):>10} docs in {time.perf_counter() - started:.1f}s")
+
+    await db.users.insert_one({
+        "id": BENCHMARK_USER_ID, "email": "benchmark@localhost", "name": "Benchmark",
+        "role": "admin", "roles": ["admin"], "created_at": now
+    })
+    await db.user_sessions.insert_one({
+        "id": str(uuid.uuid4()), "user_id": BENCHMARK_USER_ID, "session_token": BENCHMARK_SESSION_TOKEN,
+        "expires_at": now + timedelta(days=30), "created_at": now
+    })
+
+    # Same setup the server runs at startup, done up front so it isn't measured
+    started = time.perf_counter()
+    await server.ensure_indexes()
+    await server.run_startup_backfills()
+    print(f"indexes and backfills in {time.perf_counter() - started:.1f}s")
+
+
+async def scenario_context(server):
+    """Ids the parameterized scenarios need, picked deterministically from the seeded data"""
+    db = server.db
+    project = await db.projects.find_one({}, {"_id": 0, "id": 1}, sort=[("id", 1)])
+    inventory = await db.inventory.find_one({"category": "bahan"}, {"_id": 0, "id": 1}, sort=[("id", 1)])
+    return {"project_id": project["id"] if project else None, "inventory_id": inventory["id"] if inventory else None}
+
+
+def build_scenarios(context):
+    """Read endpoints behind the dashboards and autocomplete, as (name, method, path, params)"""
+    scenarios = [
+        ("projects", "GET", "/api/projects", {}),
+        ("financial_summary", "GET", "/api/financial/summary", {}),
+        ("financial_monthly", "GET", "/api/financial/monthly", {}),
+        ("planning_overview", "GET", "/api/planning/overview", {}),
+        ("recent_transactions", "GET", "/api/transactions/recent", {}),
+        ("unit_prices", "GET", "/api/unit-prices", {}),
+        ("inventory", "GET", "/api/inventory", {}),
+        ("item_names", "GET", "/api/inventory/item-names", {"q": "s", "limit": 20}),
+        ("suppliers", "GET", "/api/inventory/suppliers", {"q": "t", "limit": 20}),
+        ("price_comparison", "GET", "/api/inventory/price-comparison", {}),
+        ("usage_report", "GET", "/api/inventory/usage-report", {}),
+    ]
+    if context.get("project_id"):
+        scenarios.append(("transactions_by_project", "GET", "/api/transactions", {"project_id": context["project_id"]}))
+    if context.get("inventory_id"):
+        scenarios.append((
+            "breakdown_by_supplier", "GET", f"/api/inventory/{context['inventory_id']}/breakdown-by-supplier", {}
+        ))
+    return scenarios
+
+
+def summarize(latencies, errors, elapsed):
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(float(latencies_ms.mean()), 2) if len(latencies_ms) else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(latencies_ms.max()), 2) if len(latencies_ms) else 0.0
+    }
+
+
+async def run_scenario(client, scenario, concurrency, duration, warmup, conditional):
+    """
+    Drive one endpoint with concurrency clients for duration seconds
+    - Each client waits for its response before sending the next request (closed loop)
+    - With conditional, clients revalidate with the last ETag they saw, like a polling dashboard
+    """
+    _, method, path, params = scenario
+    for _ in range(warmup):
+        await client.request(method, path, params=params)
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        etag = None
+        while time.perf_counter() < deadline:
+            headers = {"If-None-Match": etag} if conditional and etag else {}
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, headers=headers)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            etag = response.headers.get("etag") or etag
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_scenarios(client, scenarios, args):
+    results = {}
+    print(f"{'scenario':<26}{'reqs':>8}{'err':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for scenario in scenarios:
+        result = await run_scenario(client, scenario, args.concurrency, args.duration, args.warmup, args.conditional)
+        results[scenario[0]] = result
+        print(
+            f"{scenario[0]:<26}{result['requests']:>8}{result['errors']:>6}{result['rps']:>10.1f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        )
+    return results
+
+
+def start_server(args):
+    """uvicorn on the benchmark database; returns the process once it answers /metrics"""
+    env = {**os.environ, "MONGO_URL": args.mongo_url, "DB_NAME": args.db}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Server exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/metrics", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("Server did not become ready within 60s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(run, output_dir):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"{run['meta']['started_at'][:19].replace(':', '').replace('-', '')}_{run['meta']['git_commit']}.json"
+    path.write_text(json.dumps(run, indent=2))
+    return path
+
+
+def compare_results(run, baseline, tolerance):
+    """
+    Print p95/throughput deltas against a baseline run and return the regressed scenarios
+    - A scenario regresses when p95 grows or throughput drops by more than tolerance
+    """
+    if baseline["meta"].get("transactions") != run["meta"]["transactions"]:
+        print(f"warning: baseline used {baseline['meta'].get('transactions')} transactions, this run {run['meta']['transactions']}")
+
+    regressions = []
+    print(f"\n{'scenario':<26}{'p95 base':>10}{'p95 now':>10}{'delta':>9}{'rps base':>10}{'rps now':>10}{'delta':>9}")
+    for name, result in run["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        p95_delta = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_delta = result["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        regressed = p95_delta > tolerance or rps_delta < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<26}{before['p95_ms']:>10.2f}{result['p95_ms']:>10.2f}{p95_delta:>+9.1%}"
+            f"{before['rps']:>10.1f}{result['rps']:>10.1f}{rps_delta:>+9.1%}{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+async def benchmark(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db
+    server = importlib.import_module("server")
+
+    if not args.skip_seed:
+        await seed(server, args)
+    transactions = await server.db.transactions.estimated_document_count()
+    scenarios = build_scenarios(await scenario_context(server))
+    if args.scenarios:
+        selected = set(args.scenarios.split(","))
+        scenarios = [scenario for scenario in scenarios if scenario[0] in selected]
+
+    process = None if args.base_url else start_server(args)
+    base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+    run = {
+        "meta": {
+            "started_at": server.now_wib().isoformat(),
+            "git_commit": git_commit(),
+            "transactions": transactions,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "conditional": args.conditional,
+            "python": platform.python_version(),
+            "machine": platform.machine()
+        }
+    }
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {BENCHMARK_SESSION_TOKEN}", "Accept-Encoding": "gzip, br"},
+            limits=limits,
+            timeout=60
+        ) as client:
+            run["scenarios"] = await run_scenarios(client, scenarios, args)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="xonfinance_benchmark")
+    parser.add_argument("--dump-dir", type=Path, default=REPO_DIR / "dump" / "test_database")
+    parser.add_argument("--transactions", type=int, default=10000, help="total transactions after scaling the dump")
+    parser.add_argument("--projects", type=int, default=50, help="total execution projects after scaling the dump")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, so reseeding gives the same data")
+    parser.add_argument("--synthetic", action="store_true", help="seed with generate_data.py instead of scaling the dump")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the benchmark database as it is")
+    parser.add_argument("--base-url", help="benchmark an already running server (must use the same database)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="requests per scenario before measuring")
+    parser.add_argument("--scenarios", help="comma-separated scenario names to run")
+    parser.add_argument("--conditional", action="store_true", help="revalidate with If-None-Match like polling dashboards")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR)
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p95/throughput change before flagging")
+    args = parser.parse_args()
+
+    run = asyncio.run(benchmark(args))
+    print(f"\nresults written to {save_results(run, args.output)}")
+
+    if args.compare:
+        regressions = compare_results(run, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,42 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, Depends, UploadFile, File, Form
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Header, Depends, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
+from fastapi.routing import APIRoute
+from fastapi.encoders import jsonable_encoder
+from starlette.routing import request_response, Match
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer, HTMLRenderer
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne, DeleteMany, ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+from bson import Binary, Regex, json_util
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
+import asyncio
+import bisect
+import time
+import csv
+import io
+import re
+import unicodedata
+import json
+import functools
+import itertools
+import random
+import contextvars
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import orjson
+import zlib
+import brotli
+import numpy as np
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import httpx
@@ -20,6 +48,55 @@ WIB = timezone(timedelta(hours=7))
 def now_wib():
     """Get current datetime in WIB timezone"""
     return datetime.now(WIB)
+
+# Timestamps are stored as BSON dates; these fields are coerced from incoming ISO strings.
+# Every collection has created_at/updated_at; other names are only timestamps in their own collection.
+COMMON_TIMESTAMP_FIELDS = ["created_at", "updated_at"]
+TIMESTAMP_FIELDS = {
+    "user_sessions": ["expires_at"],
+    "planning_projects": ["approved_at"],
+    "projects": ["contract_date"],
+    "rabs": ["approved_at"],
+    "transactions": ["transaction_date"],
+    "tasks": ["start_date", "due_date", "completed_at"],
+    "inventory": ["low_stock_alerted_at"],
+    "inventory_snapshots": ["as_of"],
+    "inventory_valuations": ["as_of", "computed_at"],
+    "supplier_price_history": ["date"],
+    "suppliers": ["first_seen", "last_seen"],
+    "backups": ["timestamp"],
+    "schema_migrations": ["completed_at"]
+}
+
+def timestamp_fields(collection_name: str) -> List[str]:
+    """Fields of a collection that hold timestamps"""
+    return COMMON_TIMESTAMP_FIELDS + TIMESTAMP_FIELDS.get(collection_name, [])
+
+def as_wib_datetime(value: Any) -> Optional[datetime]:
+    """Read a timestamp (datetime, ISO string or YYYY-MM-DD) as an aware WIB datetime"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=WIB)
+    return value.astimezone(WIB)
+
+def coerce_timestamps(data: Dict[str, Any], collection_name: str) -> Dict[str, Any]:
+    """Convert timestamp fields of a raw update payload for collection_name to datetimes before they reach Mongo"""
+    for field in timestamp_fields(collection_name):
+        if isinstance(data.get(field), str):
+            try:
+                data[field] = as_wib_datetime(data[field])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{field} must be an ISO date")
+    return data
+
+def to_wib_iso(value: Any) -> Any:
+    """Format datetimes as WIB ISO strings for hand-written JSON (FastAPI responses get this via the codec)"""
+    if isinstance(value, datetime):
+        return as_wib_datetime(value).isoformat()
+    return str(value)
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
@@ -33,14 +110,191 @@ from reportlab.pdfbase.ttfonts import TTFont
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ============= REQUEST METRICS =============
+
+# Route labels are path templates ("/api/projects/{project_id}"), so series stay bounded
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to send the full response", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_size_bytes", "Response body size as sent (after compression)", ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests currently being served", multiprocess_mode="livesum"
+)
+# Per-request Mongo usage: a high command count on a cheap route is the N+1 signature
+HTTP_REQUEST_MONGO_COMMANDS = Histogram(
+    "http_request_mongo_commands", "Mongo round trips made while serving one request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 1000)
+)
+HTTP_REQUEST_MONGO_SECONDS = Histogram(
+    "http_request_mongo_seconds", "Time spent in Mongo commands while serving one request", ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency by command and collection", ["command", "collection"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Mongo commands that returned an error", ["command", "collection"]
+)
+
+# Commands of the current request land here; Motor copies the context into its executor threads
+_request_mongo_commands = contextvars.ContextVar("request_mongo_commands", default=None)
+# ASGI scope of the current request, so slow commands can name the route that issued them
+_request_scope = contextvars.ContextVar("request_scope", default=None)
+
+# Driver chatter that isn't a query the app issued
+MONGO_UNTRACKED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "killCursors"}
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo listener feeding command latency metrics, the per-request tally and the slow-query log"""
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in MONGO_UNTRACKED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        # succeeded/failed events don't carry the command document
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "", event.command, event.database_name
+        )
+
+    def _finish(self, event) -> Optional[str]:
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return None
+        collection, command, database_name = pending
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_SECONDS.labels(event.command_name, collection).observe(seconds)
+        commands = _request_mongo_commands.get()
+        if commands is not None:
+            commands.append(seconds)
+        if SLOW_QUERY_THRESHOLD_MS and seconds * 1000 >= SLOW_QUERY_THRESHOLD_MS and collection not in SLOW_QUERY_IGNORED_COLLECTIONS:
+            scope = _request_scope.get()
+            route = (getattr(scope.get("route"), "path", None) or scope["path"]) if scope else "background"
+            log_slow_query(event.command_name, collection, command, database_name, seconds, route)
+        return collection
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection is not None:
+            MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status, body size and Mongo usage per route
+    - Runs outermost, so latency includes compression and sizes are what went over the wire
+    - Unmatched paths are grouped under one label instead of one series per URL
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        commands = []
+        token = _request_mongo_commands.set(commands)
+        scope_token = _request_scope.set(scope)
+        status = 500
+        size = 0
+
+        async def measuring_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, measuring_send)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            _request_mongo_commands.reset(token)
+            _request_scope.reset(scope_token)
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, label, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(method, label).observe(time.perf_counter() - started)
+            HTTP_RESPONSE_BYTES.labels(method, label).observe(size)
+            HTTP_REQUEST_MONGO_COMMANDS.labels(method, label).observe(len(commands))
+            HTTP_REQUEST_MONGO_SECONDS.labels(method, label).observe(sum(commands))
+
+def render_metrics() -> bytes:
+    """Prometheus text exposition; merges all workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Dates come back from Mongo as aware datetimes in WIB, so responses are formatted in WIB
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=WIB, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+# ============= JSON RESPONSES =============
+
+def orjson_default(value: Any) -> Any:
+    """Fallback for values orjson doesn't encode natively (Pydantic models and friends)"""
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return jsonable_encoder(value)
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson-backed JSON; aware datetimes keep their WIB offset, numpy values are supported"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+class FastJSONRoute(APIRoute):
+    """
+    Route that hands endpoint results straight to FastJSONResponse
+    - Skips FastAPI's jsonable_encoder walk, which visits every value in Python
+    - Routes with a response_model or a Response parameter (cookies/headers) keep the default path
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        endpoint = self.dependant.call
+        if self.response_model is not None or self.dependant.response_param_name or not asyncio.iscoroutinefunction(endpoint):
+            return
+
+        status_code = self.status_code or 200
+
+        @functools.wraps(endpoint)
+        async def respond(**values):
+            content = await endpoint(**values)
+            if isinstance(content, Response):
+                return content
+            return FastJSONResponse(content, status_code=status_code)
+
+        self.dependant.call = respond
+        self.app = request_response(self.get_route_handler())
+
 # Create the main app
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+app = FastAPI(default_response_class=FastJSONResponse)
+api_router = APIRouter(prefix="/api", route_class=FastJSONRoute)
 
 # ============= MODELS =============
 
@@ -122,6 +376,9 @@ class RAB(BaseModel):
     subtotal: float = 0.0  # Jumlah sebelum pajak
     tax_amount: float = 0.0  # Nilai pajak
     total_price: float = 0.0  # Total setelah pajak
+    category_totals: Dict[str, float] = {}  # Subtotal per kategori (maintained from rab_items)
+    revision: int = 0  # Latest entry in rab_revisions
+    price_list_id: Optional[str] = None  # Price list in effect when the RAB was drafted
     created_by: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: now_wib())
     approved_at: Optional[datetime] = None
@@ -279,6 +536,7 @@ class Inventory(BaseModel):
     project_type: str = "arsitektur"  # interior, arsitektur (dari project type)
     transaction_id: str
     status: str = "Tersedia"  # Status kondisi: Tersedia, Order, Habis, Bagus, Rusak, dll
+    reorder_level: Optional[float] = None  # Batas stok minimum di gudang (manual)
     created_at: datetime = Field(default_factory=lambda: now_wib())
     updated_at: datetime = Field(default_factory=lambda: now_wib())
 
@@ -292,6 +550,7 @@ class WarehouseTransaction(BaseModel):
     project_id: str
     project_name: str
     usage_type: str  # production, return, adjustment
+    category: Optional[str] = None  # bahan, alat (copied from the inventory item)
     notes: Optional[str] = None
     created_by: str
     created_at: datetime = Field(default_factory=lambda: now_wib())
@@ -342,6 +601,40 @@ class RABItemInput(BaseModel):
     total_price: float
     is_category: Optional[bool] = False
 
+class RABItemBulkEntry(BaseModel):
+    id: Optional[str] = None  # Existing item to update; omit to create
+    category: str
+    item_number: str
+    description: str
+    unit: str = ""
+    volume: float = 0.0
+    unit_price: float = 0.0
+    total_price: Optional[float] = None  # Defaults to volume x unit_price
+    is_category: Optional[bool] = False
+
+class RABItemBulkInput(BaseModel):
+    """Create/update/reorder many RAB items of one RAB in a single request"""
+    rab_id: str
+    items: List[RABItemBulkEntry] = []
+    delete_ids: Optional[List[str]] = []
+    replace: bool = False  # Delete existing items not listed in items
+
+class UnitPriceInput(BaseModel):
+    description: str
+    unit: str
+    price: float
+    category: str
+
+class UnitPriceBulkInput(BaseModel):
+    """Upsert many unit prices; optionally publish the result as a dated price list"""
+    items: List[UnitPriceInput]
+    price_list_name: Optional[str] = None
+    effective_date: Optional[str] = None  # YYYY-MM-DD
+
+class PriceListInput(BaseModel):
+    name: str
+    effective_date: str  # YYYY-MM-DD
+
 class RABUpdateInput(BaseModel):
     discount: Optional[float] = None
     tax: Optional[float] = None
@@ -391,6 +684,7 @@ class InventoryInput(BaseModel):
     project_id: str
     transaction_id: Optional[str] = None
     status: Optional[str] = "Tersedia"
+    reorder_level: Optional[float] = None
 
 class InventoryUpdateInput(BaseModel):
     item_name: Optional[str] = None
@@ -398,6 +692,7 @@ class InventoryUpdateInput(BaseModel):
     unit: Optional[str] = None
     unit_price: Optional[float] = None
     status: Optional[str] = None
+    reorder_level: Optional[float] = None
 
 class WarehouseTransactionInput(BaseModel):
     inventory_id: str
@@ -406,6 +701,25 @@ class WarehouseTransactionInput(BaseModel):
     notes: Optional[str] = None
     usage_type: str = "production"  # production, return, adjustment
 
+class WarehouseWithdrawalLine(BaseModel):
+    inventory_id: str
+    quantity: float
+    notes: Optional[str] = None
+    usage_type: Optional[str] = None  # Defaults to the requisition's usage_type
+
+class WarehouseWithdrawalInput(BaseModel):
+    project_id: str
+    items: List[WarehouseWithdrawalLine]
+    notes: Optional[str] = None
+    usage_type: str = "production"  # production, return, adjustment
+
+class ProfilerSettingsInput(BaseModel):
+    enabled: bool
+    routes: List[str] = []  # Route templates, optionally "METHOD /api/..."; empty = every route
+    sample_rate: float = Field(1.0, gt=0, le=1)  # Fraction of matching requests to profile
+    interval_ms: float = Field(1.0, ge=0.1, le=100)
+    duration_minutes: Optional[int] = Field(30, ge=1)  # Switches itself off; None keeps it on
+
 # ============= AUTH HELPERS =============
 
 async def get_current_user(request: Request, authorization: Optional[str] = Header(None)) -> User:
@@ -422,7 +736,7 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
     
     # Find session
     session = await db.user_sessions.find_one({"session_token": session_token})
-    if not session or datetime.fromisoformat(session["expires_at"]) < now_wib():
+    if not session or as_wib_datetime(session["expires_at"]) < now_wib():
         raise HTTPException(status_code=401, detail="Invalid or expired session")
     
     # Find user
@@ -438,6 +752,296 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+# ============= READ-THROUGH CACHE =============
+
+# "memory" keeps entries per worker; "mongo" shares them between workers through cache_entries
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))
+CACHE_DEFAULT_TTL_SECONDS = int(os.environ.get("CACHE_DEFAULT_TTL_SECONDS", "60"))
+
+CACHE_MISS = object()
+
+class CacheBackend:
+    """
+    Storage behind ReadThroughCache; subclass it to plug in a shared cache
+    - Keys are "<namespace>:<digest>"; tags are the collection names an entry was derived from
+    - get returns CACHE_MISS for absent or expired entries
+    """
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: int, tags: List[str]):
+        raise NotImplementedError
+
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        raise NotImplementedError
+
+    async def clear(self, namespace: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    async def size(self) -> int:
+        raise NotImplementedError
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU with per-entry TTL; also the local stand-in for a shared backend in tests"""
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, tags, value), least recently used first
+        self.keys_by_tag = {}
+        self.evictions = 0
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        for tag in entry[1]:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+    async def get(self, key: str) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return CACHE_MISS
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            return CACHE_MISS
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    async def set(self, key: str, value: Any, ttl: int, tags: List[str]):
+        self._drop(key)
+        self.entries[key] = (time.monotonic() + ttl, tags, value)
+        for tag in tags:
+            self.keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        keys = set()
+        for tag in tags:
+            keys.update(self.keys_by_tag.get(tag, ()))
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    async def clear(self, namespace: Optional[str] = None) -> int:
+        keys = [key for key in self.entries if namespace is None or key.startswith(f"{namespace}:")]
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    async def size(self) -> int:
+        return len(self.entries)
+
+class MongoCacheBackend(CacheBackend):
+    """
+    Shared cache in a Mongo collection, for multi-worker deployments
+    - Values are stored as orjson bytes (no pickle: anyone who can write the collection could run code)
+    - Datetimes come back as ISO strings, exactly as they would be rendered in a response
+    - Expired entries are skipped on read and removed by the TTL index on expires_at
+    - No LRU: size is bounded by TTLs
+    """
+    def __init__(self, collection_name: str = "cache_entries"):
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        return db[self.collection_name]
+
+    async def get(self, key: str) -> Any:
+        entry = await self.collection.find_one({"id": key, "expires_at": {"$gt": now_wib()}}, {"_id": 0, "value": 1})
+        if not entry:
+            return CACHE_MISS
+        return orjson.loads(bytes(entry["value"]))
+
+    async def set(self, key: str, value: Any, ttl: int, tags: List[str]):
+        await self.collection.replace_one({"id": key}, {
+            "id": key,
+            "tags": tags,
+            "value": Binary(orjson.dumps(value, default=orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)),
+            "expires_at": now_wib() + timedelta(seconds=ttl)
+        }, upsert=True)
+
+    async def invalidate_tags(self, tags: List[str]) -> int:
+        result = await self.collection.delete_many({"tags": {"$in": tags}})
+        return result.deleted_count
+
+    async def clear(self, namespace: Optional[str] = None) -> int:
+        query = {"id": {"$regex": f"^{re.escape(namespace)}:"}} if namespace else {}
+        result = await self.collection.delete_many(query)
+        return result.deleted_count
+
+    async def size(self) -> int:
+        return await self.collection.count_documents({"expires_at": {"$gt": now_wib()}})
+
+class ReadThroughCache:
+    """
+    Namespaced read-through cache over a pluggable backend
+    - cached() wraps an async function; its arguments form the key unless key= is given
+    - Writes call invalidate() with the collection names they touched (see bump_collection_versions)
+    - Concurrent misses on one key share a single load
+    - Backend failures are logged and fall through to the loader
+    """
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.stats = {}
+        self._inflight = {}
+        self._tag_generations = {}
+
+    def _count(self, namespace: str, field: str):
+        stats = self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "errors": 0})
+        stats[field] += 1
+
+    async def get_or_load(self, namespace: str, key: str, loader, ttl: int, tags: List[str]) -> Any:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Cache read failed for {key}: {str(e)}")
+            self._count(namespace, "errors")
+            value = CACHE_MISS
+        if value is not CACHE_MISS:
+            self._count(namespace, "hits")
+            return value
+
+        self._count(namespace, "misses")
+        pending = self._inflight.get(key)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generations = [self._tag_generations.get(tag, 0) for tag in tags]
+        try:
+            value = await loader()
+            # An invalidation that landed while loading means value may already be stale
+            if generations == [self._tag_generations.get(tag, 0) for tag in tags]:
+                try:
+                    await self.backend.set(key, value, ttl, tags)
+                except Exception as e:
+                    logger.error(f"Cache write failed for {key}: {str(e)}")
+                    self._count(namespace, "errors")
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved so an unawaited future doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def cached(self, namespace: str, ttl: Optional[int] = None, tags: Optional[List[str]] = None, key=None):
+        """Decorator for async functions returning cacheable (JSON-serializable) data"""
+        ttl = ttl or CACHE_DEFAULT_TTL_SECONDS
+        tags = list(tags or [])
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                parts = key(*args, **kwargs) if key else [args, kwargs]
+                digest = hashlib.sha1(orjson.dumps(parts, default=str, option=orjson.OPT_SORT_KEYS)).hexdigest()
+                return await self.get_or_load(namespace, f"{namespace}:{digest}", lambda: fn(*args, **kwargs), ttl, tags)
+
+            wrapper.cache_namespace = namespace
+            return wrapper
+        return decorator
+
+    async def invalidate(self, *tags: str) -> int:
+        """Drop every entry derived from the given collections"""
+        for tag in tags:
+            self._tag_generations[tag] = self._tag_generations.get(tag, 0) + 1
+        try:
+            return await self.backend.invalidate_tags(list(tags))
+        except Exception as e:
+            logger.error(f"Cache invalidation failed for {', '.join(tags)}: {str(e)}")
+            return 0
+
+    async def clear(self, namespace: Optional[str] = None) -> int:
+        return await self.backend.clear(namespace)
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Hit/miss counters per namespace plus backend size"""
+        namespaces = {}
+        for namespace, stats in self.stats.items():
+            lookups = stats["hits"] + stats["misses"]
+            namespaces[namespace] = {**stats, "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else None}
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": await self.backend.size(),
+            "evictions": getattr(self.backend, "evictions", None),
+            "namespaces": namespaces
+        }
+
+response_cache = ReadThroughCache(
+    MongoCacheBackend() if CACHE_BACKEND == "mongo" else MemoryCacheBackend(CACHE_MAX_ENTRIES)
+)
+
+# ============= CONDITIONAL GET HELPERS =============
+
+# Clients cache dashboard responses but must revalidate them with If-None-Match every time
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+async def bump_collection_versions(*names: str):
+    """
+    Record a write to the given collections so ETags and cache entries derived from them change
+    - Call after the write: a reader that sees the old version then also sees the old data
+    - The epoch changes when a counter is recreated, so old tags never match a reset counter
+    """
+    names = list(dict.fromkeys(names))
+    await db.collection_versions.bulk_write([
+        UpdateOne({"id": name}, {"$inc": {"version": 1}, "$setOnInsert": {"epoch": str(uuid.uuid4())}}, upsert=True)
+        for name in names
+    ], ordered=False)
+    await response_cache.invalidate(*names)
+
+async def get_collection_versions(names: List[str]) -> str:
+    """Current version token for a set of collections (one indexed read, no data touched)"""
+    docs = await db.collection_versions.find({"id": {"$in": names}}, {"_id": 0}).to_list(None)
+    by_name = {doc["id"]: doc for doc in docs}
+    return ";".join(
+        f"{name}:{by_name.get(name, {}).get('epoch', '-')}:{by_name.get(name, {}).get('version', 0)}"
+        for name in names
+    )
+
+def weak_etag(versions: str, *variant: Any) -> str:
+    """Weak ETag over collection versions plus whatever else shapes the response (filters, role)"""
+    digest = hashlib.sha1(versions.encode())
+    digest.update(orjson.dumps(variant, default=str))
+    return f'W/"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header (comma-separated tags or *)"""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+async def conditional_etag(request: Request, collections: List[str], *variant: Any):
+    """
+    ETag for a read over the given collections, plus a 304 response when the client already has it
+    - Handlers return the 304 as-is, skipping their queries entirely
+    """
+    etag = weak_etag(await get_collection_versions(collections), *variant)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, not_modified_response(etag)
+    return etag, None
+
+def not_modified_response(etag: str) -> Response:
+    """Empty 304 that repeats the validator, as RFC 9110 requires"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+
+def etag_response(content: Any, etag: str) -> FastJSONResponse:
+    """200 response carrying the ETag it was computed under"""
+    return FastJSONResponse(content, headers={"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL})
+
 # ============= AUTH ENDPOINTS =============
 
 @api_router.get("/")
@@ -474,8 +1078,6 @@ async def login(input: LoginInput, response: Response):
     )
     
     session_dict = session.model_dump()
-    session_dict["expires_at"] = session_dict["expires_at"].isoformat()
-    session_dict["created_at"] = session_dict["created_at"].isoformat()
     await db.user_sessions.insert_one(session_dict)
     
     # Set cookie
@@ -534,7 +1136,6 @@ async def google_auth(request: Request, response: Response):
             role="employee"  # default role
         )
         user_dict = user.model_dump(by_alias=True)
-        user_dict["created_at"] = user_dict["created_at"].isoformat()
         await db.users.insert_one(user_dict)
         user_id = user.id
     else:
@@ -551,8 +1152,6 @@ async def google_auth(request: Request, response: Response):
     )
     
     session_dict = session.model_dump()
-    session_dict["expires_at"] = session_dict["expires_at"].isoformat()
-    session_dict["created_at"] = session_dict["created_at"].isoformat()
     await db.user_sessions.insert_one(session_dict)
     
     # Set cookie
@@ -743,11 +1342,9 @@ async def create_planning_project(input: ProjectInput, user: User = Depends(get_
     )
     
     project_dict = project.model_dump()
-    project_dict["created_at"] = project_dict["created_at"].isoformat()
-    if project_dict.get("approved_at"):
-        project_dict["approved_at"] = project_dict["approved_at"].isoformat()
     
     await db.planning_projects.insert_one(project_dict)
+    await bump_collection_versions("planning_projects")
     
     return {"message": "Planning project created", "id": project.id}
 
@@ -768,6 +1365,7 @@ async def update_planning_project_progress(
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Planning project not found")
+    await bump_collection_versions("planning_projects")
     
     return {"message": "Progress updated", "progress": progress}
 
@@ -797,7 +1395,7 @@ async def update_task_progress(
         "report": report,
         "user_id": user.id,
         "user_name": user.name,
-        "created_at": now_wib().isoformat()
+        "created_at": now_wib()
     })
     
     # Update progress based on task type
@@ -810,7 +1408,7 @@ async def update_task_progress(
                 {"$set": {
                     "progress": progress,
                     "last_report": report,
-                    "updated_at": now_wib().isoformat()
+                    "updated_at": now_wib()
                 }}
             )
         else:
@@ -820,8 +1418,9 @@ async def update_task_progress(
                 "project_id": project_id,
                 "progress": progress,
                 "last_report": report,
-                "created_at": now_wib().isoformat()
+                "created_at": now_wib()
             })
+        await bump_collection_versions("rabs")
     
     elif task_type == "modeling_3d":
         # Update or create modeling_3d record
@@ -832,7 +1431,7 @@ async def update_task_progress(
                 {"$set": {
                     "progress": progress,
                     "last_report": report,
-                    "updated_at": now_wib().isoformat()
+                    "updated_at": now_wib()
                 }}
             )
         else:
@@ -841,8 +1440,9 @@ async def update_task_progress(
                 "project_id": project_id,
                 "progress": progress,
                 "last_report": report,
-                "created_at": now_wib().isoformat()
+                "created_at": now_wib()
             })
+        await bump_collection_versions("modeling_3d")
     
     elif task_type == "shop_drawing":
         # Update or create shop_drawing record
@@ -853,7 +1453,7 @@ async def update_task_progress(
                 {"$set": {
                     "progress": progress,
                     "last_report": report,
-                    "updated_at": now_wib().isoformat()
+                    "updated_at": now_wib()
                 }}
             )
         else:
@@ -862,8 +1462,9 @@ async def update_task_progress(
                 "project_id": project_id,
                 "progress": progress,
                 "last_report": report,
-                "created_at": now_wib().isoformat()
+                "created_at": now_wib()
             })
+        await bump_collection_versions("shop_drawing")
     
     elif task_type == "schedule":
         # For schedule, update a metadata record
@@ -874,7 +1475,7 @@ async def update_task_progress(
                 {"$set": {
                     "progress": progress,
                     "last_report": report,
-                    "updated_at": now_wib().isoformat()
+                    "updated_at": now_wib()
                 }}
             )
         else:
@@ -883,7 +1484,7 @@ async def update_task_progress(
                 "project_id": project_id,
                 "progress": progress,
                 "last_report": report,
-                "created_at": now_wib().isoformat()
+                "created_at": now_wib()
             })
     
     return {
@@ -919,9 +1520,6 @@ async def approve_planning_project(
     )
     
     exec_dict = execution_project.model_dump()
-    exec_dict["created_at"] = exec_dict["created_at"].isoformat()
-    if exec_dict.get("contract_date"):
-        exec_dict["contract_date"] = exec_dict["contract_date"].isoformat()
     
     await db.projects.insert_one(exec_dict)
     
@@ -931,11 +1529,12 @@ async def approve_planning_project(
         {
             "$set": {
                 "status": "approved",
-                "approved_at": now_wib().isoformat(),
+                "approved_at": now_wib(),
                 "execution_project_id": execution_project.id
             }
         }
     )
+    await bump_collection_versions("projects", "planning_projects")
     
     return {
         "message": "Planning project approved and execution project created",
@@ -946,9 +1545,10 @@ async def approve_planning_project(
 @api_router.patch("/planning-projects/{project_id}")
 async def update_planning_project(project_id: str, updates: dict, user: User = Depends(get_current_user)):
     """Update planning project"""
-    result = await db.planning_projects.update_one({"id": project_id}, {"$set": updates})
+    result = await db.planning_projects.update_one({"id": project_id}, {"$set": coerce_timestamps(updates, "planning_projects")})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Planning project not found")
+    await bump_collection_versions("planning_projects")
     return {"message": "Planning project updated"}
 
 @api_router.delete("/planning-projects/{project_id}")
@@ -957,6 +1557,7 @@ async def delete_planning_project(project_id: str, user: User = Depends(get_curr
     result = await db.planning_projects.delete_one({"id": project_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Planning project not found")
+    await bump_collection_versions("planning_projects")
     
     return {"message": "Planning project deleted"}
 
@@ -967,6 +1568,7 @@ async def bulk_delete_planning_projects(request: BulkOperationRequest, user: Use
         raise HTTPException(status_code=400, detail="No project IDs provided")
     
     result = await db.planning_projects.delete_many({"id": {"$in": request.project_ids}})
+    await bump_collection_versions("planning_projects")
     
     return {
         "message": f"Deleted {result.deleted_count} planning projects",
@@ -986,6 +1588,7 @@ async def bulk_update_planning_projects(request: BulkOperationRequest, user: Use
         {"id": {"$in": request.project_ids}},
         {"$set": request.updates}
     )
+    await bump_collection_versions("planning_projects")
     
     return {
         "message": f"Updated {result.modified_count} planning projects",
@@ -1002,10 +1605,12 @@ async def bulk_delete_projects(request: BulkOperationRequest, user: User = Depen
     await db.rab_items.delete_many({"project_id": {"$in": request.project_ids}})
     await db.rabs.delete_many({"project_id": {"$in": request.project_ids}})
     await db.transactions.delete_many({"project_id": {"$in": request.project_ids}})
+    await unindex_transaction_items({"project_id": {"$in": request.project_ids}})
     await db.schedule_items.delete_many({"project_id": {"$in": request.project_ids}})
     await db.tasks.delete_many({"project_id": {"$in": request.project_ids}})
     
     result = await db.projects.delete_many({"id": {"$in": request.project_ids}})
+    await bump_collection_versions("projects", "rabs", "transactions", "schedule_items")
     
     return {
         "message": f"Deleted {result.deleted_count} projects",
@@ -1025,6 +1630,7 @@ async def bulk_update_projects(request: BulkOperationRequest, user: User = Depen
         {"id": {"$in": request.project_ids}},
         {"$set": request.updates}
     )
+    await bump_collection_versions("projects")
     
     return {
         "message": f"Updated {result.modified_count} projects",
@@ -1074,6 +1680,7 @@ async def migrate_planning_projects(user: User = Depends(get_current_user)):
         
         migrated_count += 1
         migrated_ids.append(project["id"])
+    await bump_collection_versions("projects", "planning_projects")
     
     return {
         "message": f"Successfully migrated {migrated_count} projects from projects to planning_projects",
@@ -1105,7 +1712,7 @@ async def create_project(input: ProjectInput, user: User = Depends(get_current_u
         name=input.name,
         type=input.type,
         description=input.description,
-        contract_date=datetime.fromisoformat(input.contract_date) if input.contract_date else None,
+        contract_date=as_wib_datetime(input.contract_date),
         duration=input.duration,
         location=input.location,
         project_value=input.project_value,
@@ -1114,11 +1721,9 @@ async def create_project(input: ProjectInput, user: User = Depends(get_current_u
     )
     
     project_dict = project.model_dump()
-    project_dict["created_at"] = project_dict["created_at"].isoformat()
-    if project_dict["contract_date"]:
-        project_dict["contract_date"] = project_dict["contract_date"].isoformat()
     
     await db.projects.insert_one(project_dict)
+    await bump_collection_versions("projects")
     
     # Create notification for site supervisors
     supervisors = await db.users.find({"role": "site_supervisor"}).to_list(100)
@@ -1130,18 +1735,18 @@ async def create_project(input: ProjectInput, user: User = Depends(get_current_u
             type="info"
         )
         notif_dict = notif.model_dump()
-        notif_dict["created_at"] = notif_dict["created_at"].isoformat()
         await db.notifications.insert_one(notif_dict)
     
     return {"message": "Project created", "id": project.id}
 
 @api_router.get("/projects")
-async def get_projects(phase: Optional[str] = None, user: User = Depends(get_current_user)):
+async def get_projects(request: Request, phase: Optional[str] = None, user: User = Depends(get_current_user)):
     """
     Get execution projects (pelaksanaan phase only)
     Note: Planning projects are now in separate planning_projects collection
     - All roles see only execution/pelaksanaan projects
     - For planning projects, use /planning-projects endpoint
+    - Supports If-None-Match; the ETag covers the role-dependent filter
     """
     query = {}
     
@@ -1163,13 +1768,12 @@ async def get_projects(phase: Optional[str] = None, user: User = Depends(get_cur
     if phase:
         query["phase"] = phase
     
+    etag, not_modified = await conditional_etag(request, ["projects"], query)
+    if not_modified:
+        return not_modified
+    
     projects = await db.projects.find(query, {"_id": 0}).to_list(1000)
-    for p in projects:
-        if isinstance(p.get("created_at"), str):
-            p["created_at"] = datetime.fromisoformat(p["created_at"])
-        if p.get("contract_date") and isinstance(p["contract_date"], str):
-            p["contract_date"] = datetime.fromisoformat(p["contract_date"])
-    return projects
+    return etag_response(projects, etag)
 
 @api_router.get("/projects/{project_id}")
 async def get_project(project_id: str, user: User = Depends(get_current_user)):
@@ -1177,18 +1781,14 @@ async def get_project(project_id: str, user: User = Depends(get_current_user)):
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if isinstance(project.get("created_at"), str):
-        project["created_at"] = datetime.fromisoformat(project["created_at"])
-    if project.get("contract_date") and isinstance(project["contract_date"], str):
-        project["contract_date"] = datetime.fromisoformat(project["contract_date"])
-    
     return project
 
 @api_router.patch("/projects/{project_id}")
 async def update_project(project_id: str, updates: dict, user: User = Depends(get_current_user)):
-    result = await db.projects.update_one({"id": project_id}, {"$set": updates})
+    result = await db.projects.update_one({"id": project_id}, {"$set": coerce_timestamps(updates, "projects")})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
+    await bump_collection_versions("projects")
     return {"message": "Project updated"}
 
 @api_router.delete("/projects/{project_id}")
@@ -1197,10 +1797,12 @@ async def delete_project(project_id: str, user: User = Depends(get_current_user)
     await db.rab_items.delete_many({"project_id": project_id})
     await db.rabs.delete_many({"project_id": project_id})
     await db.transactions.delete_many({"project_id": project_id})
+    await unindex_transaction_items({"project_id": project_id})
     await db.schedule_items.delete_many({"project_id": project_id})
     await db.tasks.delete_many({"project_id": project_id})
     
     result = await db.projects.delete_one({"id": project_id})
+    await bump_collection_versions("projects", "rabs", "transactions", "schedule_items")
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
     return {"message": "Project deleted"}
@@ -1219,12 +1821,23 @@ async def update_design_progress(project_id: str, data: dict, user: User = Depen
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
+    await bump_collection_versions("projects")
     
     return {"message": "Design progress updated", "progress": progress}
 
+PLANNING_OVERVIEW_COLLECTIONS = ["planning_projects", "rabs", "modeling_3d", "shop_drawing", "schedule_items"]
+
 @api_router.get("/planning/overview")
-async def get_planning_overview(user: User = Depends(get_current_user)):
+async def get_planning_overview(request: Request, user: User = Depends(get_current_user)):
     """Get planning team overview: planning projects, RAB, modeling 3D, shop drawings, schedules with progress"""
+    etag, not_modified = await conditional_etag(request, PLANNING_OVERVIEW_COLLECTIONS)
+    if not_modified:
+        return not_modified
+    return etag_response(await build_planning_overview(etag), etag)
+
+@response_cache.cached("planning_overview", tags=PLANNING_OVERVIEW_COLLECTIONS)
+async def build_planning_overview(etag: str) -> List[Dict[str, Any]]:
+    """Planning overview rows; etag keys the cache to the collection versions it was built under"""
     # Get planning projects (not execution projects)
     projects = await db.planning_projects.find({}, {"_id": 0}).to_list(1000)
     
@@ -1297,17 +1910,323 @@ async def get_planning_overview(user: User = Depends(get_current_user)):
     
     return result
 
+# ============= UNIT PRICE CATALOG CACHE =============
+
+# Safety net for multi-worker deployments where another process changed the catalog
+UNIT_PRICE_CACHE_TTL_SECONDS = int(os.environ.get("UNIT_PRICE_CACHE_TTL_SECONDS", "300"))
+
+_unit_price_catalog = None
+_unit_price_catalog_generation = 0
+_unit_price_catalog_lock = asyncio.Lock()
+
+def build_unit_price_catalog(unit_prices: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Group unit prices by category and build a sorted token list for prefix lookups"""
+    by_category = {}
+    normalized = []
+    token_entries = []
+    for idx, unit_price in enumerate(unit_prices):
+        by_category.setdefault(unit_price.get("category"), []).append(unit_price)
+        description = normalize_text(unit_price.get("description"))
+        normalized.append(description)
+        tokens = set(description.split()) | set(normalize_text(unit_price.get("category")).split())
+        token_entries.extend((token, idx) for token in tokens)
+    token_entries.sort()
+
+    return {
+        "items": unit_prices,
+        "by_category": by_category,
+        "normalized": normalized,
+        "tokens": [token for token, _ in token_entries],
+        "token_ids": [idx for _, idx in token_entries],
+        "matcher": build_unit_price_matcher(unit_prices),
+        "loaded_at": time.monotonic()
+    }
+
+async def get_unit_price_catalog(version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the cached unit-price catalog, loading it from Mongo when missing or stale
+    - version (from get_collection_versions) also reloads a catalog built before another worker's write
+    """
+    global _unit_price_catalog
+
+    def is_fresh(catalog):
+        return (
+            catalog
+            and time.monotonic() - catalog["loaded_at"] < UNIT_PRICE_CACHE_TTL_SECONDS
+            and (version is None or catalog["version"] == version)
+        )
+
+    catalog = _unit_price_catalog
+    if is_fresh(catalog):
+        return catalog
+
+    async with _unit_price_catalog_lock:
+        catalog = _unit_price_catalog
+        if is_fresh(catalog):
+            return catalog
+
+        generation = _unit_price_catalog_generation
+        if version is None:
+            version = await get_collection_versions(["unit_prices"])
+        unit_prices = await db.unit_prices.find({}, {"_id": 0}).sort("description", 1).to_list(None)
+        catalog = build_unit_price_catalog(unit_prices)
+        catalog["version"] = version
+        # Don't publish a catalog that was invalidated while it was loading
+        if generation == _unit_price_catalog_generation:
+            _unit_price_catalog = catalog
+        return catalog
+
+def invalidate_unit_price_catalog():
+    """Drop the cached catalog after unit_prices writes"""
+    global _unit_price_catalog, _unit_price_catalog_generation
+    _unit_price_catalog_generation += 1
+    _unit_price_catalog = None
+
+def search_unit_price_catalog(
+    catalog: Dict[str, Any],
+    q: str,
+    category: Optional[str] = None,
+    limit: int = 20
+) -> List[Dict[str, Any]]:
+    """Match every query token as a prefix of a description/category token and rank the hits"""
+    tokens = normalize_text(q).split()
+    if not tokens:
+        return []
+
+    matches = None
+    for token in tokens:
+        lo = bisect.bisect_left(catalog["tokens"], token)
+        hi = bisect.bisect_left(catalog["tokens"], token + "\uffff")
+        ids = set(catalog["token_ids"][lo:hi])
+        matches = ids if matches is None else matches & ids
+        if not matches:
+            return []
+
+    items = catalog["items"]
+    if category:
+        matches = {idx for idx in matches if items[idx].get("category") == category}
+
+    query = " ".join(tokens)
+    normalized = catalog["normalized"]
+    ranked = sorted(matches, key=lambda idx: (
+        not normalized[idx].startswith(query),
+        query not in normalized[idx],
+        len(normalized[idx]),
+        normalized[idx]
+    ))
+    return [items[idx] for idx in ranked[:limit]]
+
+# ============= PRICE LIST HELPERS =============
+
+MAX_BULK_UNIT_PRICES = 20000
+UNIT_PRICE_IMPORT_COLUMNS = {
+    "description": ["description", "uraian", "uraian pekerjaan", "pekerjaan", "nama pekerjaan"],
+    "unit": ["unit", "satuan", "sat", "sat."],
+    "price": ["price", "unit_price", "unit price", "harga", "harga satuan"],
+    "category": ["category", "kategori"]
+}
+
+UNIT_PRICE_EXISTS = "A unit price with this description and unit already exists"
+
+def unit_price_key(description: Optional[str], unit: Optional[str]) -> str:
+    """Natural key used to upsert unit prices: normalized description plus unit"""
+    return f"{normalize_text(description)}|{normalize_text(unit)}"
+
+def parse_effective_date(value: Optional[str]) -> str:
+    """Validate a YYYY-MM-DD date (defaults to today in WIB)"""
+    if not value:
+        return now_wib().date().isoformat()
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="effective_date must be YYYY-MM-DD")
+
+async def backfill_unit_price_keys():
+    """Add the upsert key to unit prices created before keys existed"""
+    missing = await db.unit_prices.find(
+        {"key": {"$exists": False}}, {"_id": 0, "id": 1, "description": 1, "unit": 1}
+    ).to_list(None)
+    if missing:
+        await db.unit_prices.bulk_write([
+            UpdateOne({"id": doc["id"]}, {"$set": {"key": unit_price_key(doc.get("description"), doc.get("unit"))}})
+            for doc in missing
+        ], ordered=False)
+        await bump_collection_versions("unit_prices")
+
+async def ensure_unit_price_key_index():
+    """
+    Unique index on the upsert key, so concurrent imports can't create the same catalog row twice
+    - Keys are backfilled and duplicates from before the index are merged (the latest update wins)
+    - Replaces the earlier non-unique key index
+    """
+    await backfill_unit_price_keys()
+    pipeline = [
+        {"$match": {"key": {"$type": "string"}}},
+        {"$sort": {"updated_at": -1, "created_at": -1}},
+        {"$group": {"_id": "$key", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    duplicate_ids = []
+    async for row in db.unit_prices.aggregate(pipeline):
+        duplicate_ids.extend(row["ids"][1:])
+    if duplicate_ids:
+        await db.unit_prices.delete_many({"id": {"$in": duplicate_ids}})
+        invalidate_unit_price_catalog()
+        await bump_collection_versions("unit_prices")
+        logger.warning(f"Removed {len(duplicate_ids)} duplicate unit prices before indexing key")
+
+    indexes = await db.unit_prices.index_information()
+    if "key_1" in indexes and not indexes["key_1"].get("unique"):
+        await db.unit_prices.drop_index("key_1")
+    await db.unit_prices.create_index("key", unique=True, partialFilterExpression={"key": {"$type": "string"}})
+
+async def upsert_unit_prices(entries: List[UnitPriceInput], user: User) -> Dict[str, Any]:
+    """Upsert unit prices keyed by description+unit with a single bulk_write"""
+    if len(entries) > MAX_BULK_UNIT_PRICES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_UNIT_PRICES} unit prices per import")
+
+    await backfill_unit_price_keys()
+
+    # Last occurrence wins when the same item appears twice in one import
+    by_key = {}
+    for entry in entries:
+        by_key[unit_price_key(entry.description, entry.unit)] = entry
+
+    timestamp = now_wib()
+    operations = [
+        UpdateOne(
+            {"key": key},
+            {
+                "$set": {
+                    "description": entry.description.strip(),
+                    "unit": entry.unit.strip(),
+                    "price": entry.price,
+                    "category": entry.category.strip(),
+                    "updated_at": timestamp
+                },
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "key": key,
+                    "created_by": user.email,
+                    "created_at": timestamp
+                }
+            },
+            upsert=True
+        )
+        for key, entry in by_key.items()
+    ]
+
+    inserted = updated = 0
+    if operations:
+        result = await db.unit_prices.bulk_write(operations, ordered=False)
+        inserted = result.upserted_count
+        updated = result.matched_count
+    invalidate_unit_price_catalog()
+    await bump_collection_versions("unit_prices")
+
+    return {"received": len(entries), "inserted": inserted, "updated": updated}
+
+async def publish_price_list(name: str, effective_date: str, user: User) -> Dict[str, Any]:
+    """Freeze the current unit_prices catalog as a dated price list version"""
+    price_list = {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "effective_date": parse_effective_date(effective_date),
+        "created_by": user.email,
+        "created_at": now_wib(),
+        "item_count": 0
+    }
+
+    catalog = await get_unit_price_catalog()
+    versions = [
+        {
+            "price_list_id": price_list["id"],
+            "unit_price_id": unit_price.get("id"),
+            "key": unit_price.get("key") or unit_price_key(unit_price.get("description"), unit_price.get("unit")),
+            "description": unit_price.get("description"),
+            "unit": unit_price.get("unit"),
+            "price": unit_price.get("price", 0),
+            "category": unit_price.get("category")
+        }
+        for unit_price in catalog["items"]
+    ]
+    for start in range(0, len(versions), 1000):
+        await db.unit_price_versions.insert_many(versions[start:start + 1000], ordered=False)
+
+    price_list["item_count"] = len(versions)
+    await db.price_lists.insert_one(price_list)
+    price_list.pop("_id", None)
+    return price_list
+
+async def find_effective_price_list(date: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Price list in effect on a date: the latest one whose effective_date is not after it"""
+    return await db.price_lists.find_one(
+        {"effective_date": {"$lte": parse_effective_date(date)}},
+        {"_id": 0},
+        sort=[("effective_date", -1), ("created_at", -1)]
+    )
+
 # ============= UNIT PRICES ENDPOINTS =============
 
 @api_router.get("/unit-prices")
-async def get_unit_prices(category: Optional[str] = None, user: User = Depends(get_current_user)):
-    """Get all unit prices, optionally filtered by category"""
-    query = {}
+async def get_unit_prices(request: Request, category: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Get all unit prices, optionally filtered by category (supports If-None-Match)"""
+    version = await get_collection_versions(["unit_prices"])
+    etag = weak_etag(version, category)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified_response(etag)
+    
+    catalog = await get_unit_price_catalog(version)
     if category:
-        query["category"] = category
-    
-    unit_prices = await db.unit_prices.find(query, {"_id": 0}).sort("description", 1).to_list(1000)
-    return unit_prices
+        return etag_response(catalog["by_category"].get(category, []), etag)
+    return etag_response(catalog["items"], etag)
+
+@api_router.get("/unit-prices/search")
+async def search_unit_prices(
+    q: str = "",
+    category: Optional[str] = None,
+    limit: int = 20,
+    user: User = Depends(get_current_user)
+):
+    """Autocomplete unit prices by description/category prefix (served from the in-memory catalog)"""
+    catalog = await get_unit_price_catalog()
+    return search_unit_price_catalog(catalog, q, category, max(1, min(limit, 100)))
+
+@api_router.post("/unit-prices/bulk")
+async def bulk_upsert_unit_prices(input: UnitPriceBulkInput, user: User = Depends(get_current_user)):
+    """Upsert many unit prices (JSON) in one bulk_write, optionally publishing a dated price list"""
+    result = await upsert_unit_prices(input.items, user)
+    if input.price_list_name:
+        result["price_list"] = await publish_price_list(input.price_list_name, input.effective_date, user)
+    return {"message": "Unit prices imported", **result}
+
+@api_router.post("/unit-prices/import")
+async def import_unit_prices(
+    file: UploadFile = File(...),
+    price_list_name: Optional[str] = Form(None),
+    effective_date: Optional[str] = Form(None),
+    user: User = Depends(get_current_user)
+):
+    """Upsert unit prices from a CSV/XLSX file, optionally publishing a dated price list"""
+    entries = []
+    skipped = []
+    async for line_number, row in aiter_spreadsheet_rows(file, UNIT_PRICE_IMPORT_COLUMNS):
+        description = str(row.get("description") or "").strip()
+        price = parse_number(row.get("price"))
+        if not description or price is None:
+            skipped.append({"line": line_number, "reason": "Missing description or price"})
+            continue
+        entries.append(UnitPriceInput(
+            description=description,
+            unit=str(row.get("unit") or "").strip(),
+            price=price,
+            category=str(row.get("category") or "umum").strip()
+        ))
+
+    result = await upsert_unit_prices(entries, user)
+    if price_list_name:
+        result["price_list"] = await publish_price_list(price_list_name, effective_date, user)
+    return {"message": "Unit prices imported", **result, "skipped": skipped}
 
 @api_router.post("/unit-prices")
 async def create_unit_price(
@@ -1323,15 +2242,18 @@ async def create_unit_price(
         unit=unit,
         price=price,
         category=category,
-        created_by=user.id
+        created_by=user.email
     )
     
     unit_price_dict = unit_price.model_dump()
-    unit_price_dict["created_at"] = unit_price_dict["created_at"].isoformat()
-    if unit_price_dict.get("updated_at"):
-        unit_price_dict["updated_at"] = unit_price_dict["updated_at"].isoformat()
+    unit_price_dict["key"] = unit_price_key(description, unit)
     
-    await db.unit_prices.insert_one(unit_price_dict)
+    try:
+        await db.unit_prices.insert_one(unit_price_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=UNIT_PRICE_EXISTS)
+    invalidate_unit_price_catalog()
+    await bump_collection_versions("unit_prices")
     return {"message": "Unit price created", "id": unit_price.id}
 
 @api_router.patch("/unit-prices/{price_id}")
@@ -1344,7 +2266,7 @@ async def update_unit_price(
     user: User = Depends(get_current_user)
 ):
     """Update a unit price"""
-    update_data = {"updated_at": now_wib().isoformat()}
+    update_data = {"updated_at": now_wib()}
     
     if description is not None:
         update_data["description"] = description
@@ -1355,14 +2277,27 @@ async def update_unit_price(
     if category is not None:
         update_data["category"] = category
     
-    result = await db.unit_prices.update_one(
-        {"id": price_id},
-        {"$set": update_data}
-    )
+    if description is not None or unit is not None:
+        existing = await db.unit_prices.find_one({"id": price_id}, {"_id": 0, "description": 1, "unit": 1})
+        if existing:
+            update_data["key"] = unit_price_key(
+                description if description is not None else existing.get("description"),
+                unit if unit is not None else existing.get("unit")
+            )
+    
+    try:
+        result = await db.unit_prices.update_one(
+            {"id": price_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=UNIT_PRICE_EXISTS)
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Unit price not found")
     
+    invalidate_unit_price_catalog()
+    await bump_collection_versions("unit_prices")
     return {"message": "Unit price updated"}
 
 @api_router.delete("/unit-prices/{price_id}")
@@ -1373,8 +2308,514 @@ async def delete_unit_price(price_id: str, user: User = Depends(get_current_user
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Unit price not found")
     
+    invalidate_unit_price_catalog()
+    await bump_collection_versions("unit_prices")
     return {"message": "Unit price deleted"}
 
+# ============= PRICE LIST ENDPOINTS =============
+
+@api_router.post("/price-lists")
+async def create_price_list(input: PriceListInput, user: User = Depends(get_current_user)):
+    """Publish the current unit-price catalog as a dated price list"""
+    price_list = await publish_price_list(input.name, input.effective_date, user)
+    return {"message": "Price list created", **price_list}
+
+@api_router.get("/price-lists")
+async def get_price_lists(user: User = Depends(get_current_user)):
+    """List price list versions, newest effective date first"""
+    return await db.price_lists.find({}, {"_id": 0}).sort([("effective_date", -1), ("created_at", -1)]).to_list(1000)
+
+@api_router.get("/price-lists/effective")
+async def get_effective_price_list(date: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Price list in effect on a date (defaults to today)"""
+    price_list = await find_effective_price_list(date)
+    if not price_list:
+        raise HTTPException(status_code=404, detail="No price list in effect on that date")
+    return price_list
+
+@api_router.get("/price-lists/{price_list_id}/prices")
+async def get_price_list_prices(
+    price_list_id: str,
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """Unit prices of a specific price list version, optionally filtered by category or description prefix"""
+    query = {"price_list_id": price_list_id}
+    if category:
+        query["category"] = category
+    if q:
+        query["key"] = {"$regex": f"^{re.escape(normalize_text(q))}"}
+    return await db.unit_price_versions.find(query, {"_id": 0}).sort("key", 1).to_list(None)
+
+@api_router.delete("/price-lists/{price_list_id}")
+async def delete_price_list(price_list_id: str, user: User = Depends(get_current_user)):
+    """Delete a price list version (RABs pinned to it fall back to the live catalog)"""
+    result = await db.price_lists.delete_one({"id": price_list_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Price list not found")
+    await db.unit_price_versions.delete_many({"price_list_id": price_list_id})
+    await db.rabs.update_many({"price_list_id": price_list_id}, {"$set": {"price_list_id": None}})
+    await bump_collection_versions("rabs")
+    return {"message": "Price list deleted"}
+
+# ============= RAB TOTALS HELPERS =============
+
+# Allowed drift between maintained totals and the sum of rab_items before reconciliation rewrites them
+RAB_TOTALS_TOLERANCE = 0.01
+MAX_BULK_RAB_ITEMS = 2000
+RAB_RECONCILE_INTERVAL_SECONDS = int(os.environ.get("RAB_RECONCILE_INTERVAL_SECONDS", "21600"))
+
+def rab_item_line_total(item: Dict[str, Any]) -> float:
+    """Contribution of a RAB item to the RAB subtotal (category headers count as 0)"""
+    if item.get("is_category"):
+        return 0.0
+    return float(item.get("total_price") or 0)
+
+def rab_category_key(category: Optional[str]) -> str:
+    """Mongo-safe key for category_totals (field names cannot contain '.' or start with '$')"""
+    key = (category or "").replace(".", "_").lstrip("$")
+    return key or "-"
+
+async def inc_rab_totals(rab_id: str, category_deltas: Dict[str, float], tax_percentage: Optional[float] = None):
+    """Apply item total deltas to a RAB's subtotal, tax_amount, total_price and category_totals with $inc"""
+    category_deltas = {category: delta for category, delta in category_deltas.items() if delta}
+    if not rab_id or not category_deltas:
+        return
+
+    if tax_percentage is None:
+        rab = await db.rabs.find_one({"id": rab_id}, {"_id": 0, "tax_percentage": 1})
+        if not rab:
+            return
+        tax_percentage = rab.get("tax_percentage") or 0
+
+    rate = tax_percentage / 100
+    delta = sum(category_deltas.values())
+    inc = {
+        "subtotal": delta,
+        "tax_amount": delta * rate,
+        "total_price": delta + delta * rate
+    }
+    for category, category_delta in category_deltas.items():
+        key = f"category_totals.{rab_category_key(category)}"
+        inc[key] = inc.get(key, 0) + category_delta
+
+    await db.rabs.update_one({"id": rab_id}, {"$inc": inc})
+    await bump_collection_versions("rabs")
+
+async def reconcile_rab_totals(rab_ids: Optional[List[str]] = None, fix: bool = True) -> Dict[str, Any]:
+    """Verify maintained RAB totals against rab_items and optionally rewrite the ones that drifted"""
+    match = {"is_category": {"$ne": True}}
+    if rab_ids:
+        match["rab_id"] = {"$in": rab_ids}
+
+    expected_by_rab = {}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"rab_id": "$rab_id", "category": "$category"},
+            "total": {"$sum": {"$ifNull": ["$total_price", 0]}}
+        }}
+    ]
+    async for row in db.rab_items.aggregate(pipeline):
+        categories = expected_by_rab.setdefault(row["_id"]["rab_id"], {})
+        key = rab_category_key(row["_id"].get("category"))
+        categories[key] = categories.get(key, 0) + row["total"]
+
+    rab_query = {"id": {"$in": rab_ids}} if rab_ids else {}
+    rabs = await db.rabs.find(rab_query, {
+        "_id": 0, "id": 1, "tax_percentage": 1, "subtotal": 1,
+        "tax_amount": 1, "total_price": 1, "category_totals": 1
+    }).to_list(None)
+
+    mismatches = []
+    for rab in rabs:
+        category_totals = expected_by_rab.get(rab["id"], {})
+        subtotal = sum(category_totals.values())
+        rate = (rab.get("tax_percentage") or 0) / 100
+        expected = {
+            "subtotal": subtotal,
+            "tax_amount": subtotal * rate,
+            "total_price": subtotal + subtotal * rate,
+            "category_totals": category_totals
+        }
+
+        stored_categories = rab.get("category_totals") or {}
+        drifted = any(
+            abs((rab.get(field) or 0) - expected[field]) > RAB_TOTALS_TOLERANCE
+            for field in ["subtotal", "tax_amount", "total_price"]
+        ) or any(
+            abs(stored_categories.get(key, 0) - category_totals.get(key, 0)) > RAB_TOTALS_TOLERANCE
+            for key in set(stored_categories) | set(category_totals)
+        )
+        if not drifted:
+            continue
+
+        mismatches.append({
+            "rab_id": rab["id"],
+            "stored_subtotal": rab.get("subtotal", 0),
+            "expected_subtotal": subtotal
+        })
+        if fix:
+            await db.rabs.update_one({"id": rab["id"]}, {"$set": expected})
+    if fix and mismatches:
+        await bump_collection_versions("rabs")
+
+    return {
+        "checked": len(rabs),
+        "mismatched": len(mismatches),
+        "fixed": fix,
+        "mismatches": mismatches
+    }
+
+async def rab_totals_reconcile_loop():
+    """Background job that verifies and repairs maintained RAB totals at startup and then periodically"""
+    while True:
+        try:
+            report = await reconcile_rab_totals(fix=True)
+            if report["mismatched"]:
+                logger.warning(f"RAB totals reconciliation fixed {report['mismatched']} of {report['checked']} RABs")
+        except Exception as e:
+            logger.error(f"RAB totals reconciliation failed: {str(e)}")
+        await asyncio.sleep(RAB_RECONCILE_INTERVAL_SECONDS)
+
+# ============= RAB IMPORT HELPERS =============
+
+RAB_IMPORT_BATCH_SIZE = 500
+MAX_RAB_IMPORT_ROWS = 5000
+# openpyxl/csv parsing is synchronous, so it runs off the event loop in chunks of this many rows
+SPREADSHEET_PARSE_CHUNK_ROWS = 500
+UNIT_PRICE_MATCH_THRESHOLD = 0.6
+
+# Spreadsheet header aliases (English and Indonesian BOQ headings)
+RAB_IMPORT_COLUMNS = {
+    "item_number": ["no", "no.", "nomor", "item_number", "item number"],
+    "description": ["description", "uraian", "uraian pekerjaan", "pekerjaan", "item", "nama pekerjaan"],
+    "unit": ["unit", "satuan", "sat", "sat."],
+    "volume": ["volume", "vol", "vol.", "qty", "quantity", "jumlah volume"],
+    "unit_price": ["unit_price", "unit price", "harga satuan", "harga"],
+    "category": ["category", "kategori"]
+}
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase, strip accents and collapse punctuation/whitespace for matching"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text).split())
+
+def parse_number(value: Any) -> Optional[float]:
+    """Parse spreadsheet numbers, including Indonesian formats like 'Rp 1.250.000' or '2,5'"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = re.sub(r"[^0-9,.\-]", "", str(value))
+    if not text or text in ["-", ".", ","]:
+        return None
+    if "," in text and "." in text:
+        # The last separator is the decimal one
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    elif text.count(".") > 1 or re.fullmatch(r"-?\d{1,3}\.\d{3}", text):
+        text = text.replace(".", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def build_unit_price_matcher(unit_prices: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Index unit prices by normalized description and by token for fuzzy lookups"""
+    exact = {}
+    tokens_index = {}
+    entries = []
+    for unit_price in unit_prices:
+        normalized = normalize_text(unit_price.get("description"))
+        if not normalized:
+            continue
+        tokens = set(normalized.split())
+        entries.append((unit_price, tokens))
+        exact.setdefault(normalized, []).append(unit_price)
+        for token in tokens:
+            tokens_index.setdefault(token, []).append(len(entries) - 1)
+    return {"exact": exact, "tokens": tokens_index, "entries": entries}
+
+def match_unit_price(matcher: Dict[str, Any], description: str, unit: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Best catalog entry for a description: exact match first, then token overlap (Jaccard)"""
+    normalized = normalize_text(description)
+    if not normalized:
+        return None
+    normalized_unit = normalize_text(unit)
+
+    candidates = matcher["exact"].get(normalized)
+    if candidates:
+        for candidate in candidates:
+            if normalize_text(candidate.get("unit")) == normalized_unit:
+                return candidate
+        return candidates[0]
+
+    tokens = set(normalized.split())
+    best = None
+    best_score = 0.0
+    candidate_ids = {idx for token in tokens for idx in matcher["tokens"].get(token, [])}
+    for idx in candidate_ids:
+        unit_price, entry_tokens = matcher["entries"][idx]
+        score = len(tokens & entry_tokens) / len(tokens | entry_tokens)
+        if normalized_unit and normalize_text(unit_price.get("unit")) == normalized_unit:
+            score += 0.05  # Prefer the same unit on ties
+        if score > best_score:
+            best, best_score = unit_price, score
+    return best if best_score >= UNIT_PRICE_MATCH_THRESHOLD else None
+
+def iter_spreadsheet_rows(upload: UploadFile, columns: Dict[str, List[str]] = RAB_IMPORT_COLUMNS):
+    """Yield (line_number, row dict) from an uploaded CSV/XLSX without loading it all into memory"""
+    filename = (upload.filename or "").lower()
+    if filename.endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(upload.file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            yield from _map_spreadsheet_rows(rows, columns)
+        finally:
+            workbook.close()
+    elif filename.endswith(".csv") or upload.content_type in ["text/csv", "application/csv"]:
+        text_stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        try:
+            sample = text_stream.read(4096)
+            text_stream.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            yield from _map_spreadsheet_rows(csv.reader(text_stream, dialect), columns)
+        finally:
+            text_stream.detach()
+    else:
+        raise HTTPException(status_code=400, detail="Only .csv and .xlsx files are supported")
+
+async def aiter_spreadsheet_rows(upload: UploadFile, columns: Dict[str, List[str]] = RAB_IMPORT_COLUMNS):
+    """iter_spreadsheet_rows with the parsing done in a worker thread, SPREADSHEET_PARSE_CHUNK_ROWS rows at a time"""
+    rows = iter_spreadsheet_rows(upload, columns)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(itertools.islice(rows, SPREADSHEET_PARSE_CHUNK_ROWS)))
+            if not chunk:
+                return
+            for row in chunk:
+                yield row
+    finally:
+        rows.close()
+
+def _map_spreadsheet_rows(rows, column_aliases: Dict[str, List[str]]):
+    """Find the header row, then map each following row onto the aliased fields"""
+    columns = None
+    for line_number, row in enumerate(rows, start=1):
+        cells = ["" if cell is None else str(cell).strip() for cell in row]
+        if not any(cells):
+            continue
+        if columns is None:
+            headers = [normalize_text(cell) for cell in cells]
+            found = {}
+            for field, aliases in column_aliases.items():
+                normalized_aliases = {normalize_text(alias) for alias in aliases}
+                for idx, header in enumerate(headers):
+                    if header in normalized_aliases and field not in found:
+                        found[field] = idx
+            if "description" in found:
+                columns = found
+            continue
+        yield line_number, {
+            field: (row[idx] if idx < len(row) else None)
+            for field, idx in columns.items()
+        }
+    if columns is None:
+        raise HTTPException(status_code=400, detail="No header row with a description/uraian column found")
+
+# ============= RAB REVISION HELPERS =============
+
+# Every Nth revision stores a full snapshot so reconstruction never replays more than N-1 diffs
+RAB_REVISION_SNAPSHOT_INTERVAL = 20
+RAB_REVISION_FIELDS = [
+    "project_id", "project_name", "project_type", "client_name", "location",
+    "status", "discount", "tax_percentage", "rejected_reason", "price_list_id"
+]
+RAB_REVISION_ITEM_FIELDS = [
+    "id", "category", "item_number", "description", "unit",
+    "volume", "unit_price", "total_price", "is_category"
+]
+
+# A RAB write and the revision describing it hold a per-RAB lease, so revision numbers follow write order
+RAB_WRITE_LEASE_SECONDS = 300
+RAB_WRITE_WAIT_SECONDS = 30
+
+@asynccontextmanager
+async def rab_write_lock(*rab_ids: Optional[str]):
+    """
+    Serialize writes to the given RABs, together with the revisions recorded for them, across workers
+    - Leases live in rab_write_locks (unique rab_id); one left by a crashed worker expires after RAB_WRITE_LEASE_SECONDS
+    - Several RABs are locked in id order so two writers can't deadlock
+    - Raises 409 when another write holds a RAB longer than RAB_WRITE_WAIT_SECONDS
+    """
+    token = str(uuid.uuid4())
+    held = []
+    try:
+        for rab_id in sorted(set(filter(None, rab_ids))):
+            deadline = time.monotonic() + RAB_WRITE_WAIT_SECONDS
+            while True:
+                now = now_wib()
+                try:
+                    await db.rab_write_locks.insert_one({
+                        "rab_id": rab_id,
+                        "token": token,
+                        "expires_at": now + timedelta(seconds=RAB_WRITE_LEASE_SECONDS)
+                    })
+                    break
+                except DuplicateKeyError:
+                    await db.rab_write_locks.delete_one({"rab_id": rab_id, "expires_at": {"$lte": now}})
+                if time.monotonic() >= deadline:
+                    raise HTTPException(status_code=409, detail="RAB is being updated, please try again")
+                await asyncio.sleep(0.05)
+            held.append(rab_id)
+        yield
+    finally:
+        if held:
+            await db.rab_write_locks.delete_many({"rab_id": {"$in": held}, "token": token})
+
+def rab_revision_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact copy of a RAB item holding only the fields tracked in revisions"""
+    return {field: item.get(field) for field in RAB_REVISION_ITEM_FIELDS if field in item}
+
+async def record_rab_revision(
+    rab_id: str,
+    user: Optional[User] = None,
+    rab_changes: Optional[Dict[str, Any]] = None,
+    added: Optional[List[Dict[str, Any]]] = None,
+    changed: Optional[Dict[str, Dict[str, Any]]] = None,
+    removed: Optional[List[str]] = None,
+    note: Optional[str] = None,
+    full: bool = False
+):
+    """
+    Append a revision for a RAB
+    - Call it inside rab_write_lock together with the write it describes
+    - Normally stores only the diff against the previous revision
+    - Stores a full snapshot for the first revision, every RAB_REVISION_SNAPSHOT_INTERVAL revisions, or when asked
+    """
+    rab_changes = {k: v for k, v in (rab_changes or {}).items() if k in RAB_REVISION_FIELDS}
+    changed = {
+        item_id: {k: v for k, v in fields.items() if k in RAB_REVISION_ITEM_FIELDS and k != "id"}
+        for item_id, fields in (changed or {}).items()
+    }
+    changed = {item_id: fields for item_id, fields in changed.items() if fields}
+    if not (full or note or rab_changes or added or changed or removed):
+        return None
+
+    rab = await db.rabs.find_one_and_update(
+        {"id": rab_id},
+        {"$inc": {"revision": 1}},
+        {"_id": 0, "revision": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not rab:
+        return None
+    await bump_collection_versions("rabs")
+    revision = rab["revision"]
+
+    revision_doc = {
+        "id": str(uuid.uuid4()),
+        "rab_id": rab_id,
+        "revision": revision,
+        "note": note,
+        "created_by": user.email if user else None,
+        "created_at": now_wib(),
+        "summary": {
+            "rab_fields": sorted(rab_changes),
+            "added": len(added or []),
+            "changed": len(changed),
+            "removed": len(removed or [])
+        }
+    }
+
+    if full or revision == 1 or revision % RAB_REVISION_SNAPSHOT_INTERVAL == 0:
+        current_rab = await db.rabs.find_one({"id": rab_id}, {"_id": 0})
+        items = await db.rab_items.find({"rab_id": rab_id}, {"_id": 0}).to_list(None)
+        revision_doc["full"] = True
+        revision_doc["snapshot"] = {
+            "rab": {field: current_rab.get(field) for field in RAB_REVISION_FIELDS},
+            "items": [rab_revision_item(item) for item in items]
+        }
+    else:
+        revision_doc["full"] = False
+        revision_doc["diff"] = {
+            "rab": rab_changes,
+            "added": [rab_revision_item(item) for item in added or []],
+            "changed": changed,
+            "removed": list(removed or [])
+        }
+
+    await db.rab_revisions.insert_one(revision_doc)
+    return revision
+
+async def load_rab_revision(rab_id: str, revision: int) -> Optional[Dict[str, Any]]:
+    """Rebuild a RAB revision from the nearest full snapshot plus the diffs after it"""
+    base = await db.rab_revisions.find_one(
+        {"rab_id": rab_id, "full": True, "revision": {"$lte": revision}},
+        {"_id": 0},
+        sort=[("revision", -1)]
+    )
+    if not base:
+        return None
+
+    diffs = await db.rab_revisions.find(
+        {"rab_id": rab_id, "revision": {"$gt": base["revision"], "$lte": revision}},
+        {"_id": 0}
+    ).sort("revision", 1).to_list(None)
+    if (diffs[-1]["revision"] if diffs else base["revision"]) != revision:
+        return None
+
+    rab = dict(base["snapshot"]["rab"])
+    items = {item["id"]: dict(item) for item in base["snapshot"]["items"]}
+    for entry in diffs:
+        diff = entry["diff"]
+        rab.update(diff.get("rab", {}))
+        for item in diff.get("added", []):
+            items[item["id"]] = dict(item)
+        for item_id, fields in diff.get("changed", {}).items():
+            if item_id in items:
+                items[item_id].update(fields)
+        for item_id in diff.get("removed", []):
+            items.pop(item_id, None)
+
+    last = diffs[-1] if diffs else base
+    category_totals = {}
+    for item in items.values():
+        key = rab_category_key(item.get("category"))
+        category_totals[key] = category_totals.get(key, 0) + rab_item_line_total(item)
+    subtotal = sum(category_totals.values())
+    rate = (rab.get("tax_percentage") or 0) / 100
+
+    return {
+        "rab_id": rab_id,
+        "revision": revision,
+        "note": last.get("note"),
+        "created_by": last.get("created_by"),
+        "created_at": last.get("created_at"),
+        "rab": {
+            **rab,
+            "subtotal": subtotal,
+            "tax_amount": subtotal * rate,
+            "total_price": subtotal + subtotal * rate,
+            "category_totals": category_totals
+        },
+        "items": sorted(items.values(), key=lambda item: (str(item.get("category")), str(item.get("item_number"))))
+    }
+
 # ============= RAB ENDPOINTS =============
 
 @api_router.post("/rabs")
@@ -1388,9 +2829,15 @@ async def create_rab(input: RABInput, user: User = Depends(get_current_user)):
         status="draft"
     )
     
+    # Pin the price list in effect while the RAB is drafted
+    price_list = await find_effective_price_list()
+    if price_list:
+        rab.price_list_id = price_list["id"]
+    
     rab_dict = rab.model_dump()
-    rab_dict["created_at"] = rab_dict["created_at"].isoformat()
     await db.rabs.insert_one(rab_dict)
+    await bump_collection_versions("rabs")
+    await record_rab_revision(rab.id, user, full=True)
     
     return {"message": "RAB created", "id": rab.id}
 
@@ -1410,30 +2857,46 @@ async def get_rab(rab_id: str, user: User = Depends(get_current_user)):
 async def update_rab(
     rab_id: str,
     tax_percentage: Optional[float] = None,
-    subtotal: Optional[float] = None,
-    tax_amount: Optional[float] = None,
-    total_price: Optional[float] = None,
     project_name: Optional[str] = None,
     location: Optional[str] = None,
+    price_list_id: Optional[str] = None,
     user: User = Depends(get_current_user)
 ):
     updates = {}
+    if price_list_id is not None:
+        if price_list_id and not await db.price_lists.find_one({"id": price_list_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Price list not found")
+        updates["price_list_id"] = price_list_id or None
     if tax_percentage is not None:
         updates["tax_percentage"] = tax_percentage
-    if subtotal is not None:
-        updates["subtotal"] = subtotal
-    if tax_amount is not None:
-        updates["tax_amount"] = tax_amount
-    if total_price is not None:
-        updates["total_price"] = total_price
     if project_name is not None:
         updates["project_name"] = project_name
     if location is not None:
         updates["location"] = location
     
-    result = await db.rabs.update_one({"id": rab_id}, {"$set": updates})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="RAB not found")
+    if not updates:
+        if not await db.rabs.find_one({"id": rab_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="RAB not found")
+        return {"message": "RAB updated"}
+
+    # One pipeline update, so readers never see a new tax_percentage next to the old tax and total;
+    # totals are maintained from rab_items, only tax and total follow a new tax_percentage
+    stage = {field: {"$literal": value} for field, value in updates.items()}
+    if tax_percentage is not None:
+        rate = tax_percentage / 100
+        stage["tax_amount"] = {"$multiply": [{"$ifNull": ["$subtotal", 0]}, rate]}
+        stage["total_price"] = {"$add": [
+            {"$ifNull": ["$subtotal", 0]},
+            {"$multiply": [{"$ifNull": ["$subtotal", 0]}, rate]}
+        ]}
+
+    async with rab_write_lock(rab_id):
+        result = await db.rabs.update_one({"id": rab_id}, [{"$set": stage}])
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="RAB not found")
+        await bump_collection_versions("rabs")
+
+        await record_rab_revision(rab_id, user, rab_changes=updates)
     return {"message": "RAB updated"}
 
 @api_router.patch("/rabs/{rab_id}/status")
@@ -1458,8 +2921,11 @@ async def update_rab_status(rab_id: str, data: dict, user: User = Depends(get_cu
             await db.projects.delete_one({"id": project_id})
             # Also delete transactions related to this project
             await db.transactions.delete_many({"project_id": project_id})
+            await unindex_transaction_items({"project_id": project_id})
             # Delete inventory related to this project
+            await record_inventory_removal({"project_id": project_id}, {"rab_id": rab_id}, user.id)
             await db.inventory.delete_many({"project_id": project_id})
+            await invalidate_item_name_index()
             # Delete schedules and tasks
             await db.schedules.delete_many({"project_id": project_id})
             await db.tasks.delete_many({"project_id": project_id})
@@ -1469,9 +2935,8 @@ async def update_rab_status(rab_id: str, data: dict, user: User = Depends(get_cu
     
     # If changing TO approved, create project automatically
     if new_status == "approved":
-        # Calculate total from RAB items
-        rab_items = await db.rab_items.find({"rab_id": rab_id}, {"_id": 0}).to_list(1000)
-        subtotal = sum(item.get("total", 0) for item in rab_items)
+        # Subtotal is maintained incrementally from RAB items
+        subtotal = rab.get("subtotal", 0)
         discount = rab.get("discount", 0)
         tax_percent = rab.get("tax", 11)
         
@@ -1492,22 +2957,22 @@ async def update_rab_status(rab_id: str, data: dict, user: User = Depends(get_cu
         )
         
         project_dict = project.model_dump()
-        project_dict["created_at"] = project_dict["created_at"].isoformat()
-        if project_dict.get("contract_date"):
-            project_dict["contract_date"] = project_dict["contract_date"].isoformat()
         
         await db.projects.insert_one(project_dict)
         
         # Update RAB with project_id and approved timestamp
         updates["project_id"] = project.id
-        updates["approved_at"] = now_wib().isoformat()
+        updates["approved_at"] = now_wib()
     
     # If rejected, store reason
     if new_status == "rejected":
         updates["rejected_reason"] = data.get("rejected_reason", "")
     
     # Update RAB
-    await db.rabs.update_one({"id": rab_id}, {"$set": updates})
+    async with rab_write_lock(rab_id):
+        await db.rabs.update_one({"id": rab_id}, {"$set": updates})
+        await bump_collection_versions("rabs", "projects", "transactions")
+        await record_rab_revision(rab_id, user, rab_changes=updates)
     
     if new_status == "approved":
         return {"message": "RAB approved and project created", "project_id": project.id}
@@ -1516,6 +2981,80 @@ async def update_rab_status(rab_id: str, data: dict, user: User = Depends(get_cu
     
     return {"message": f"RAB status updated to {new_status}"}
 
+@api_router.get("/rabs/{rab_id}/revisions")
+async def get_rab_revisions(rab_id: str, user: User = Depends(get_current_user)):
+    """List revisions of a RAB (newest first) without their snapshot/diff payloads"""
+    revisions = await db.rab_revisions.find(
+        {"rab_id": rab_id},
+        {"_id": 0, "snapshot": 0, "diff": 0}
+    ).sort("revision", -1).to_list(1000)
+    return revisions
+
+@api_router.post("/rabs/{rab_id}/revisions")
+async def create_rab_revision(rab_id: str, data: dict, user: User = Depends(get_current_user)):
+    """Mark the current state as a named revision, e.g. a bidding round"""
+    async with rab_write_lock(rab_id):
+        revision = await record_rab_revision(rab_id, user, note=data.get("note") or "Snapshot", full=True)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="RAB not found")
+    return {"message": "RAB revision created", "revision": revision}
+
+@api_router.get("/rabs/{rab_id}/revisions/diff")
+async def diff_rab_revisions(
+    rab_id: str,
+    from_revision: int,
+    to_revision: int,
+    user: User = Depends(get_current_user)
+):
+    """Compare two RAB revisions item by item"""
+    old = await load_rab_revision(rab_id, from_revision)
+    new = await load_rab_revision(rab_id, to_revision)
+    if not old or not new:
+        raise HTTPException(status_code=404, detail="RAB revision not found")
+
+    old_items = {item["id"]: item for item in old["items"]}
+    new_items = {item["id"]: item for item in new["items"]}
+
+    changed = []
+    for item_id in old_items.keys() & new_items.keys():
+        changes = {
+            field: {"from": old_items[item_id].get(field), "to": new_items[item_id].get(field)}
+            for field in RAB_REVISION_ITEM_FIELDS
+            if old_items[item_id].get(field) != new_items[item_id].get(field)
+        }
+        if changes:
+            changed.append({
+                "id": item_id,
+                "item_number": new_items[item_id].get("item_number"),
+                "description": new_items[item_id].get("description"),
+                "changes": changes
+            })
+
+    rab_changes = {
+        field: {"from": old["rab"].get(field), "to": new["rab"].get(field)}
+        for field in RAB_REVISION_FIELDS + ["subtotal", "tax_amount", "total_price"]
+        if old["rab"].get(field) != new["rab"].get(field)
+    }
+
+    return {
+        "rab_id": rab_id,
+        "from_revision": from_revision,
+        "to_revision": to_revision,
+        "rab": rab_changes,
+        "added": [new_items[item_id] for item_id in new_items.keys() - old_items.keys()],
+        "removed": [old_items[item_id] for item_id in old_items.keys() - new_items.keys()],
+        "changed": sorted(changed, key=lambda item: str(item.get("item_number"))),
+        "total_delta": new["rab"]["total_price"] - old["rab"]["total_price"]
+    }
+
+@api_router.get("/rabs/{rab_id}/revisions/{revision}")
+async def get_rab_revision(rab_id: str, revision: int, user: User = Depends(get_current_user)):
+    """Reconstruct a RAB and its items as they were at a given revision"""
+    result = await load_rab_revision(rab_id, revision)
+    if not result:
+        raise HTTPException(status_code=404, detail="RAB revision not found")
+    return result
+
 @api_router.post("/rabs/{rab_id}/approve")
 async def approve_rab(rab_id: str, user: User = Depends(get_current_user)):
     """Legacy endpoint - redirects to update_rab_status"""
@@ -1523,47 +3062,285 @@ async def approve_rab(rab_id: str, user: User = Depends(get_current_user)):
 
 @api_router.delete("/rabs/{rab_id}")
 async def delete_rab(rab_id: str, user: User = Depends(get_current_user)):
-    # Delete all items first
+    # Delete all items and revision history first
     await db.rab_items.delete_many({"rab_id": rab_id})
+    await db.rab_revisions.delete_many({"rab_id": rab_id})
     
     result = await db.rabs.delete_one({"id": rab_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="RAB not found")
+    await bump_collection_versions("rabs")
     return {"message": "RAB deleted"}
 
 @api_router.post("/rab-items")
 async def create_rab_item(input: RABItemInput, user: User = Depends(get_current_user)):
-    # If project_id not provided, get it from RAB
-    project_id = input.project_id
-    if not project_id:
-        rab = await db.rabs.find_one({"id": input.rab_id}, {"_id": 0, "project_id": 1})
-        if rab and rab.get("project_id"):
-            project_id = rab["project_id"]
-        else:
-            project_id = None  # RAB might not have project_id yet
-    
-    rab_item = RABItem(
-        rab_id=input.rab_id,
-        project_id=project_id,
-        category=input.category,
-        item_number=input.item_number,
-        description=input.description,
-        unit=input.unit,
-        volume=input.volume,
-        unit_price=input.unit_price,
-        total_price=input.total_price
-    )
-    
-    rab_dict = rab_item.model_dump()
-    rab_dict["created_at"] = rab_dict["created_at"].isoformat()
+    async with rab_write_lock(input.rab_id):
+        rab = await db.rabs.find_one({"id": input.rab_id}, {"_id": 0, "project_id": 1, "tax_percentage": 1})
+
+        # If project_id not provided, get it from RAB
+        project_id = input.project_id
+        if not project_id:
+            if rab and rab.get("project_id"):
+                project_id = rab["project_id"]
+            else:
+                project_id = None  # RAB might not have project_id yet
+    
+        rab_item = RABItem(
+            rab_id=input.rab_id,
+            project_id=project_id,
+            category=input.category,
+            item_number=input.item_number,
+            description=input.description,
+            unit=input.unit,
+            volume=input.volume,
+            unit_price=input.unit_price,
+            total_price=input.total_price
+        )
     
-    # Add is_category flag
-    rab_dict["is_category"] = input.is_category
+        rab_dict = rab_item.model_dump()
     
-    await db.rab_items.insert_one(rab_dict)
+        # Add is_category flag
+        rab_dict["is_category"] = input.is_category
     
+        await db.rab_items.insert_one(rab_dict)
+
+        if rab:
+            await inc_rab_totals(
+                input.rab_id,
+                {input.category: rab_item_line_total(rab_dict)},
+                rab.get("tax_percentage") or 0
+            )
+            await record_rab_revision(input.rab_id, user, added=[rab_dict])
+
     return {"message": "RAB item created", "id": rab_item.id}
 
+@api_router.post("/rab-items/bulk")
+async def bulk_upsert_rab_items(input: RABItemBulkInput, user: User = Depends(get_current_user)):
+    """Create, update, reorder and delete RAB items of one RAB with a single bulk_write"""
+    if len(input.items) > MAX_BULK_RAB_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_RAB_ITEMS} items per request")
+
+    async with rab_write_lock(input.rab_id):
+        rab = await db.rabs.find_one({"id": input.rab_id}, {"_id": 0, "project_id": 1, "tax_percentage": 1})
+        if not rab:
+            raise HTTPException(status_code=404, detail="RAB not found")
+
+        existing_items = await db.rab_items.find({"rab_id": input.rab_id}, {"_id": 0}).to_list(None)
+        existing_by_id = {item["id"]: item for item in existing_items}
+
+        # Validate everything in one pass before writing anything
+        errors = []
+        seen_ids = set()
+        for index, entry in enumerate(input.items):
+            if entry.id:
+                if entry.id not in existing_by_id:
+                    errors.append({"index": index, "error": f"RAB item {entry.id} not found in this RAB"})
+                elif entry.id in seen_ids:
+                    errors.append({"index": index, "error": f"RAB item {entry.id} listed more than once"})
+                seen_ids.add(entry.id)
+            if not entry.description.strip():
+                errors.append({"index": index, "error": "Description is required"})
+            if not entry.item_number.strip():
+                errors.append({"index": index, "error": "Item number is required"})
+            if entry.volume < 0 or entry.unit_price < 0:
+                errors.append({"index": index, "error": "Volume and unit price must not be negative"})
+        for item_id in input.delete_ids or []:
+            if item_id not in existing_by_id:
+                errors.append({"id": item_id, "error": "RAB item not found in this RAB"})
+            elif item_id in seen_ids:
+                errors.append({"id": item_id, "error": "RAB item cannot be both updated and deleted"})
+        if errors:
+            raise HTTPException(status_code=400, detail={"message": "Validation failed", "errors": errors})
+
+        delete_ids = set(input.delete_ids or [])
+        if input.replace:
+            delete_ids |= set(existing_by_id) - seen_ids
+
+        operations = []
+        result_ids = []
+        category_deltas = {}
+        added_items = []
+        changed_items = {}
+        created_count = 0
+        updated_count = 0
+
+        def add_delta(category, delta):
+            category_deltas[category] = category_deltas.get(category, 0) + delta
+
+        for entry in input.items:
+            fields = {
+                "category": entry.category,
+                "item_number": entry.item_number,
+                "description": entry.description,
+                "unit": entry.unit,
+                "volume": entry.volume,
+                "unit_price": entry.unit_price,
+                "total_price": entry.total_price if entry.total_price is not None else entry.volume * entry.unit_price,
+                "is_category": entry.is_category
+            }
+
+            if entry.id:
+                old_item = existing_by_id[entry.id]
+                operations.append(UpdateOne({"id": entry.id}, {"$set": fields}))
+                add_delta(old_item.get("category"), -rab_item_line_total(old_item))
+                changed_items[entry.id] = {k: v for k, v in fields.items() if old_item.get(k) != v}
+                updated_count += 1
+                result_ids.append(entry.id)
+            else:
+                rab_item = RABItem(rab_id=input.rab_id, project_id=rab.get("project_id"), **fields)
+                item_dict = rab_item.model_dump()
+                item_dict["is_category"] = entry.is_category
+                operations.append(InsertOne(item_dict))
+                added_items.append(item_dict)
+                created_count += 1
+                result_ids.append(rab_item.id)
+            add_delta(entry.category, rab_item_line_total(fields))
+
+        if delete_ids:
+            operations.append(DeleteMany({"id": {"$in": list(delete_ids)}, "rab_id": input.rab_id}))
+            for item_id in delete_ids:
+                old_item = existing_by_id[item_id]
+                add_delta(old_item.get("category"), -rab_item_line_total(old_item))
+
+        if operations:
+            await db.rab_items.bulk_write(operations, ordered=False)
+            await inc_rab_totals(input.rab_id, category_deltas, rab.get("tax_percentage") or 0)
+            await record_rab_revision(
+                input.rab_id, user, added=added_items, changed=changed_items, removed=list(delete_ids)
+            )
+
+    return {
+        "message": "RAB items saved",
+        "created": created_count,
+        "updated": updated_count,
+        "deleted": len(delete_ids),
+        "ids": result_ids
+    }
+
+@api_router.post("/rabs/{rab_id}/import-items")
+async def import_rab_items(rab_id: str, file: UploadFile = File(...), user: User = Depends(get_current_user)):
+    """
+    Import RAB items from a CSV/XLSX bill of quantities
+    - Rows without unit, volume and price are treated as category headers
+    - Missing unit prices are prefilled from the unit_prices catalog
+    - Rows are written with insert_many in batches while the file is parsed (in a worker thread)
+    - If the file fails to parse partway, the batches already written are removed again
+    """
+    async with rab_write_lock(rab_id):
+        rab = await db.rabs.find_one(
+            {"id": rab_id}, {"_id": 0, "project_id": 1, "tax_percentage": 1, "price_list_id": 1}
+        )
+        if not rab:
+            raise HTTPException(status_code=404, detail="RAB not found")
+
+        # Match against the pinned price list when there is one, else the live catalog
+        pinned_prices = []
+        if rab.get("price_list_id"):
+            pinned_prices = await db.unit_price_versions.find(
+                {"price_list_id": rab["price_list_id"]}, {"_id": 0}
+            ).to_list(None)
+        if pinned_prices:
+            matcher = build_unit_price_matcher(pinned_prices)
+        else:
+            matcher = (await get_unit_price_catalog())["matcher"]
+
+        batch = []
+        batch_deltas = {}
+        imported_items = []
+        imported_deltas = {}
+        report = {"imported": 0, "categories": 0, "matched": 0, "unmatched": [], "skipped": [], "truncated": False}
+
+        async def flush():
+            if not batch:
+                return
+            await db.rab_items.insert_many(batch, ordered=False)
+            await inc_rab_totals(rab_id, batch_deltas, rab.get("tax_percentage") or 0)
+            imported_items.extend(rab_revision_item(item) for item in batch)
+            for category, delta in batch_deltas.items():
+                imported_deltas[category] = imported_deltas.get(category, 0) + delta
+            batch.clear()
+            batch_deltas.clear()
+
+        current_category = "umum"
+        category_count = 0
+        item_count = 0
+        try:
+            async for line_number, row in aiter_spreadsheet_rows(file):
+                if report["imported"] >= MAX_RAB_IMPORT_ROWS:
+                    report["truncated"] = True
+                    break
+
+                description = str(row.get("description") or "").strip()
+                if not description:
+                    report["skipped"].append({"line": line_number, "reason": "Missing description"})
+                    continue
+
+                unit = str(row.get("unit") or "").strip()
+                volume = parse_number(row.get("volume"))
+                unit_price = parse_number(row.get("unit_price"))
+                category = str(row.get("category") or "").strip()
+                item_number = str(row.get("item_number") or "").strip()
+
+                is_category = not unit and volume is None and unit_price is None
+                if is_category:
+                    category_count += 1
+                    item_count = 0
+                    current_category = category or description
+                    report["categories"] += 1
+                    fields = {
+                        "category": current_category,
+                        "item_number": item_number or chr(ord("A") + (category_count - 1) % 26),
+                        "description": description,
+                        "unit": "",
+                        "volume": 0.0,
+                        "unit_price": 0.0,
+                        "total_price": 0.0
+                    }
+                else:
+                    if not unit_price:
+                        match = match_unit_price(matcher, description, unit)
+                        if match:
+                            unit_price = match.get("price", 0)
+                            unit = unit or match.get("unit", "")
+                            report["matched"] += 1
+                        else:
+                            unit_price = 0.0
+                            report["unmatched"].append({"line": line_number, "description": description})
+                    volume = volume or 0.0
+                    item_count += 1
+                    fields = {
+                        "category": category or current_category,
+                        "item_number": item_number or str(item_count),
+                        "description": description,
+                        "unit": unit,
+                        "volume": volume,
+                        "unit_price": unit_price,
+                        "total_price": volume * unit_price
+                    }
+
+                rab_item = RABItem(rab_id=rab_id, project_id=rab.get("project_id"), **fields)
+                item_dict = rab_item.model_dump()
+                item_dict["is_category"] = is_category
+                batch.append(item_dict)
+                batch_deltas[fields["category"]] = batch_deltas.get(fields["category"], 0) + rab_item_line_total(item_dict)
+                report["imported"] += 1
+
+                if len(batch) >= RAB_IMPORT_BATCH_SIZE:
+                    await flush()
+            await flush()
+        except Exception:
+            if imported_items:
+                await db.rab_items.delete_many({"id": {"$in": [item["id"] for item in imported_items]}})
+                await inc_rab_totals(
+                    rab_id, {category: -delta for category, delta in imported_deltas.items()}, rab.get("tax_percentage") or 0
+                )
+            raise
+
+        if imported_items:
+            await record_rab_revision(rab_id, user, added=imported_items, note=f"Import {file.filename}")
+
+    return {"message": f"Imported {report['imported']} RAB items", **report}
+
 @api_router.get("/rab-items")
 async def get_rab_items(rab_id: Optional[str] = None, user: User = Depends(get_current_user)):
     query = {}
@@ -1579,26 +3356,69 @@ async def get_rab_items_by_id(rab_id: str, user: User = Depends(get_current_user
 
 @api_router.patch("/rab-items/{item_id}")
 async def update_rab_item(item_id: str, updates: dict, user: User = Depends(get_current_user)):
-    # Recalculate total if unit_price or quantity changed
-    if "unit_price" in updates or "quantity" in updates:
-        item = await db.rab_items.find_one({"id": item_id})
-        if item:
-            unit_price = updates.get("unit_price", item["unit_price"])
-            quantity = updates.get("quantity", item["quantity"])
-            updates["total"] = unit_price * quantity
-    
-    result = await db.rab_items.update_one({"id": item_id}, {"$set": updates})
-    if result.matched_count == 0:
+    owner = await db.rab_items.find_one({"id": item_id}, {"_id": 0, "rab_id": 1})
+    if not owner:
         raise HTTPException(status_code=404, detail="RAB item not found")
+
+    async with rab_write_lock(owner.get("rab_id"), updates.get("rab_id")):
+        item = await db.rab_items.find_one({"id": item_id}, {"_id": 0})
+        if not item:
+            raise HTTPException(status_code=404, detail="RAB item not found")
+
+        # Recalculate total if unit_price or volume changed
+        if "unit_price" in updates or "volume" in updates:
+            unit_price = updates.get("unit_price", item.get("unit_price", 0))
+            volume = updates.get("volume", item.get("volume", 0))
+            updates["total_price"] = unit_price * volume
+
+        result = await db.rab_items.update_one({"id": item_id}, {"$set": updates})
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="RAB item not found")
+
+        # Move the item's contribution between RABs/categories as needed
+        updated_item = {**item, **updates}
+        old_total = rab_item_line_total(item)
+        new_total = rab_item_line_total(updated_item)
+        if item.get("rab_id") == updated_item.get("rab_id"):
+            deltas = {item.get("category"): -old_total}
+            deltas[updated_item.get("category")] = deltas.get(updated_item.get("category"), 0) + new_total
+            await inc_rab_totals(item.get("rab_id"), deltas)
+            await record_rab_revision(item.get("rab_id"), user, changed={item_id: updates})
+        else:
+            await inc_rab_totals(item.get("rab_id"), {item.get("category"): -old_total})
+            await inc_rab_totals(updated_item.get("rab_id"), {updated_item.get("category"): new_total})
+            await record_rab_revision(item.get("rab_id"), user, removed=[item_id])
+            await record_rab_revision(updated_item.get("rab_id"), user, added=[updated_item])
+
     return {"message": "RAB item updated"}
 
 @api_router.delete("/rab-items/{item_id}")
 async def delete_rab_item(item_id: str, user: User = Depends(get_current_user)):
-    result = await db.rab_items.delete_one({"id": item_id})
-    if result.deleted_count == 0:
+    owner = await db.rab_items.find_one({"id": item_id}, {"_id": 0, "rab_id": 1})
+    if not owner:
         raise HTTPException(status_code=404, detail="RAB item not found")
+
+    async with rab_write_lock(owner.get("rab_id")):
+        item = await db.rab_items.find_one_and_delete({"id": item_id}, {"_id": 0})
+        if not item:
+            raise HTTPException(status_code=404, detail="RAB item not found")
+
+        await inc_rab_totals(item.get("rab_id"), {item.get("category"): -rab_item_line_total(item)})
+        await record_rab_revision(item.get("rab_id"), user, removed=[item_id])
     return {"message": "RAB item deleted"}
 
+@api_router.post("/rabs/reconcile-totals")
+async def reconcile_rab_totals_endpoint(
+    rab_id: Optional[str] = None,
+    fix: bool = True,
+    user: User = Depends(get_current_user)
+):
+    """Verify maintained RAB totals against rab_items (admin only)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+
+    return await reconcile_rab_totals([rab_id] if rab_id else None, fix=fix)
+
 @api_router.get("/rabs/{rab_id}/export")
 async def export_rab_pdf(rab_id: str, user: User = Depends(get_current_user)):
     # Get RAB
@@ -1719,7 +3539,692 @@ async def export_rab_pdf(rab_id: str, user: User = Depends(get_current_user)):
         headers={"Content-Disposition": f"attachment; filename=RAB_{project['name']}.pdf"}
     )
 
-# ============= TRANSACTION ENDPOINTS =============
+# ============= TRANSACTION ITEM INDEX HELPERS =============
+
+NO_SUPPLIER_NAME = "Tidak ada nama toko"
+
+def supplier_key(supplier: Optional[str]) -> Optional[str]:
+    """Normalized suppliers directory key of a supplier name, None for lines without a supplier"""
+    if not supplier or supplier == NO_SUPPLIER_NAME:
+        return None
+    return normalize_text(supplier) or None
+
+def supplier_price_rows(transaction: Dict[str, Any], project_type: Optional[str]) -> List[Dict[str, Any]]:
+    """One supplier_price_history row per purchased item line of a bahan/alat transaction"""
+    if transaction.get("category") not in ["bahan", "alat"]:
+        return []
+    return [
+        {
+            "transaction_id": transaction["id"],
+            "project_id": transaction.get("project_id"),
+            "project_type": project_type,
+            "category": transaction["category"],
+            "item_name": item.get("description"),
+            "supplier": item.get("supplier") or NO_SUPPLIER_NAME,
+            "supplier_key": supplier_key(item.get("supplier")),
+            "unit": item.get("unit", ""),
+            "unit_price": item.get("unit_price", 0),
+            "quantity": item.get("quantity", 0),
+            "date": transaction.get("transaction_date")
+        }
+        for item in transaction.get("items") or []
+        if item.get("description")
+    ]
+
+def supplier_directory_updates(rows: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """Upserts counting one purchase per supplier per transaction in the suppliers directory"""
+    by_key = {}
+    for row in rows:
+        key = row["supplier_key"]
+        if not key:
+            continue
+        entry = by_key.setdefault(key, {"name": row["supplier"].strip(), "date": row.get("date"), "transactions": set()})
+        entry["transactions"].add(row["transaction_id"])
+        if row.get("date") and (not entry["date"] or row["date"] > entry["date"]):
+            entry["date"] = row["date"]
+
+    operations = []
+    for key, entry in by_key.items():
+        update = {
+            "$set": {"name": entry["name"]},
+            "$setOnInsert": {"id": str(uuid.uuid4())},
+            "$inc": {"purchase_count": len(entry["transactions"])}
+        }
+        if entry["date"]:
+            update["$min"] = {"first_seen": entry["date"]}
+            update["$max"] = {"last_seen": entry["date"]}
+        operations.append(UpdateOne({"key": key}, update, upsert=True))
+    return operations
+
+async def index_transaction_items(transaction: Dict[str, Any], project_type: Optional[str] = None):
+    """Feed the materialized per-item collections from a newly written transaction"""
+    rows = supplier_price_rows(transaction, project_type)
+    if rows:
+        await db.supplier_price_history.insert_many(rows, ordered=False)
+        operations = supplier_directory_updates(rows)
+        if operations:
+            await db.suppliers.bulk_write(operations, ordered=False)
+            await bump_collection_versions("suppliers")
+
+async def rebuild_supplier_directory() -> int:
+    """Recreate the suppliers directory from supplier_price_history"""
+    pipeline = [
+        {"$match": {"supplier": {"$ne": NO_SUPPLIER_NAME}}},
+        {"$group": {
+            "_id": "$supplier",
+            "transactions": {"$addToSet": "$transaction_id"},
+            "first_seen": {"$min": "$date"},
+            "last_seen": {"$max": "$date"}
+        }}
+    ]
+    by_key = {}
+    async for row in db.supplier_price_history.aggregate(pipeline, allowDiskUse=True):
+        key = normalize_text(row["_id"])
+        if not key:
+            continue
+        entry = by_key.setdefault(key, {
+            "id": str(uuid.uuid4()), "key": key, "name": row["_id"].strip(),
+            "transactions": set(), "first_seen": row["first_seen"], "last_seen": row["last_seen"]
+        })
+        entry["transactions"].update(row["transactions"])
+        entry["first_seen"] = min(filter(None, [entry["first_seen"], row["first_seen"]]), default=None)
+        if row["last_seen"] and (not entry["last_seen"] or row["last_seen"] > entry["last_seen"]):
+            entry["last_seen"] = row["last_seen"]
+            entry["name"] = row["_id"].strip()
+
+    await db.suppliers.delete_many({})
+    docs = [
+        {**{k: v for k, v in entry.items() if k != "transactions"}, "purchase_count": len(entry["transactions"])}
+        for entry in by_key.values()
+    ]
+    if docs:
+        await db.suppliers.insert_many(docs, ordered=False)
+    await bump_collection_versions("suppliers")
+    return len(docs)
+
+async def supplier_seen_ranges(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """first_seen/last_seen per supplier key, recomputed from supplier_price_history"""
+    pipeline = [
+        {"$match": {"supplier_key": {"$in": keys}}},
+        {"$group": {"_id": "$supplier_key", "first_seen": {"$min": "$date"}, "last_seen": {"$max": "$date"}}}
+    ]
+    return {
+        row["_id"]: {"first_seen": row["first_seen"], "last_seen": row["last_seen"]}
+        async for row in db.supplier_price_history.aggregate(pipeline)
+    }
+
+async def unindex_transaction_items(query: Dict[str, Any]):
+    """
+    Remove materialized rows matching query and give back their supplier purchase counts
+    - first_seen/last_seen of the touched suppliers are recomputed from the remaining history
+    """
+    rows = await db.supplier_price_history.find(
+        {**query, "supplier": {"$ne": NO_SUPPLIER_NAME}},
+        {"_id": 0, "supplier": 1, "supplier_key": 1, "transaction_id": 1}
+    ).to_list(None)
+    await db.supplier_price_history.delete_many(query)
+
+    transactions_by_key = {}
+    for row in rows:
+        key = row.get("supplier_key") or supplier_key(row["supplier"])
+        if key:
+            transactions_by_key.setdefault(key, set()).add(row["transaction_id"])
+    if transactions_by_key:
+        ranges = await supplier_seen_ranges(list(transactions_by_key))
+        await db.suppliers.bulk_write([
+            UpdateOne({"key": key}, {
+                "$inc": {"purchase_count": -len(transaction_ids)},
+                "$set": ranges.get(key, {"first_seen": None, "last_seen": None})
+            })
+            for key, transaction_ids in transactions_by_key.items()
+        ], ordered=False)
+        await db.suppliers.delete_many({"key": {"$in": list(transactions_by_key)}, "purchase_count": {"$lte": 0}})
+        await bump_collection_versions("suppliers")
+
+@response_cache.cached("supplier_names", tags=["suppliers"])
+async def list_supplier_names(version: str, prefix: str, limit: Optional[int]) -> List[str]:
+    """
+    Supplier names from the directory, ranked by purchase_count when filtered by a normalized prefix
+    - version (the suppliers collection version) keys the cache, so every worker sees writes at once
+    """
+    query = {}
+    sort = [("key", 1)]
+    if prefix:
+        query["key"] = {"$regex": f"^{re.escape(prefix)}"}
+        sort = [("purchase_count", -1), ("key", 1)]
+    
+    cursor = db.suppliers.find(query, {"_id": 0, "name": 1}).sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return [supplier["name"] for supplier in await cursor.to_list(None)]
+
+async def reindex_transaction_items(transaction_id: str):
+    """Rebuild the materialized rows of one transaction after it was edited"""
+    await unindex_transaction_items({"transaction_id": transaction_id})
+    transaction = await db.transactions.find_one({"id": transaction_id}, {"_id": 0, "receipt": 0})
+    if transaction:
+        project = await db.projects.find_one({"id": transaction.get("project_id")}, {"_id": 0, "type": 1})
+        await index_transaction_items(transaction, project.get("type", "arsitektur") if project else "arsitektur")
+
+async def rebuild_supplier_price_history() -> int:
+    """Recreate supplier_price_history from all bahan/alat transactions"""
+    projects = await db.projects.find({}, {"_id": 0, "id": 1, "type": 1}).to_list(None)
+    project_types = {project["id"]: project.get("type", "arsitektur") for project in projects}
+
+    await db.supplier_price_history.delete_many({})
+    count = 0
+    batch = []
+    cursor = db.transactions.find(
+        {"category": {"$in": ["bahan", "alat"]}, "items.0": {"$exists": True}},
+        {"_id": 0, "id": 1, "project_id": 1, "category": 1, "items": 1, "transaction_date": 1}
+    )
+    async for transaction in cursor:
+        batch.extend(supplier_price_rows(transaction, project_types.get(transaction.get("project_id"), "arsitektur")))
+        if len(batch) >= 1000:
+            await db.supplier_price_history.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        await db.supplier_price_history.insert_many(batch, ordered=False)
+        count += len(batch)
+    await rebuild_supplier_directory()
+    return count
+
+async def backfill_supplier_keys() -> int:
+    """Set supplier_key on history rows written before it existed, one update per distinct supplier name"""
+    updated = 0
+    for name in await db.supplier_price_history.distinct("supplier", {"supplier_key": {"$exists": False}}):
+        result = await db.supplier_price_history.update_many(
+            {"supplier": name, "supplier_key": {"$exists": False}},
+            {"$set": {"supplier_key": supplier_key(name)}}
+        )
+        updated += result.modified_count
+    return updated
+
+async def backfill_supplier_price_history():
+    """Build the history once for databases that predate it"""
+    try:
+        if await db.supplier_price_history.estimated_document_count() == 0:
+            if await db.transactions.find_one({"category": {"$in": ["bahan", "alat"]}, "items.0": {"$exists": True}}, {"_id": 1}):
+                count = await rebuild_supplier_price_history()
+                logger.info(f"Backfilled supplier_price_history with {count} rows")
+        else:
+            count = await backfill_supplier_keys()
+            if count:
+                logger.info(f"Backfilled supplier_key on {count} supplier_price_history rows")
+            if await db.suppliers.estimated_document_count() == 0:
+                await rebuild_supplier_directory()
+    except Exception as e:
+        logger.error(f"Supplier price history backfill failed: {str(e)}")
+
+# ============= INVENTORY LEDGER HELPERS =============
+
+# Append-only stock events plus periodic snapshots; the inventory documents stay the live read model
+INVENTORY_STOCK_FIELDS = ["quantity_in_warehouse", "quantity_out_warehouse", "quantity"]
+INVENTORY_SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get("INVENTORY_SNAPSHOT_INTERVAL_SECONDS", "86400"))
+# Events younger than this are left for the next run so in-flight writes aren't skipped
+INVENTORY_SNAPSHOT_LAG_SECONDS = 60
+
+def inventory_event(
+    inventory: Dict[str, Any],
+    event_type: str,
+    before: Optional[Dict[str, Any]] = None,
+    after: Optional[Dict[str, Any]] = None,
+    source: Optional[Dict[str, Any]] = None,
+    user_id: Optional[str] = None,
+    unit_price: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Build a stock event from the inventory values before and after a write
+    - Missing values count as 0, so before=None is an opening and after=None a removal
+    - unit_price is the purchase price of incoming stock, used by the valuation engine
+    """
+    before = before or {}
+    after = after or {}
+    event = {
+        "id": str(uuid.uuid4()),
+        "inventory_id": inventory["id"],
+        "item_name": inventory.get("item_name"),
+        "category": inventory.get("category"),
+        "project_id": inventory.get("project_id"),
+        "type": event_type,
+        "unit_price": unit_price,
+        "source": source or {},
+        "created_by": user_id,
+        "created_at": now_wib()
+    }
+    for field in INVENTORY_STOCK_FIELDS:
+        event[field] = (after.get(field) or 0) - (before.get(field) or 0)
+    return event
+
+async def record_inventory_events(events: List[Dict[str, Any]]):
+    """Append stock events, dropping ones that don't move any quantity"""
+    events = [event for event in events if any(event[field] for field in INVENTORY_STOCK_FIELDS)]
+    if events:
+        await db.inventory_events.insert_many(events, ordered=False)
+
+async def record_inventory_removal(query: Dict[str, Any], source: Optional[Dict[str, Any]] = None, user_id: Optional[str] = None):
+    """Close the stock of inventory items that are about to be deleted"""
+    items = await db.inventory.find(
+        query, {"_id": 0, "id": 1, "item_name": 1, "category": 1, "project_id": 1, **{field: 1 for field in INVENTORY_STOCK_FIELDS}}
+    ).to_list(None)
+    await record_inventory_events([inventory_event(item, "removal", before=item, source=source, user_id=user_id) for item in items])
+
+def parse_as_of(value: str) -> datetime:
+    """Turn a YYYY-MM-DD date (end of day, WIB) or ISO datetime into an exclusive upper bound on created_at"""
+    try:
+        moment = as_wib_datetime(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="as_of must be YYYY-MM-DD or an ISO datetime")
+    if len(value) <= 10:
+        moment += timedelta(days=1)
+    return moment
+
+async def latest_snapshot_cutoff(bound: Optional[datetime] = None) -> Optional[datetime]:
+    """Cutoff of the most recent snapshot run at or before bound"""
+    query = {"as_of": {"$lte": bound}} if bound else {}
+    snapshot = await db.inventory_snapshots.find_one(query, {"_id": 0, "as_of": 1}, sort=[("as_of", -1)])
+    return snapshot["as_of"] if snapshot else None
+
+async def fold_inventory_ledger(bound: datetime, query: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Stock per inventory item for events strictly before bound
+    - Snapshot runs cover every item that changed since the previous run, so each item's
+      latest snapshot up to the newest run C is its state at C
+    - Only the events in [C, bound) are replayed on top, summed by Mongo
+    """
+    query = query or {}
+    cutoff = await latest_snapshot_cutoff(bound)
+
+    state = {}
+    if cutoff:
+        pipeline = [
+            {"$match": {**query, "as_of": {"$lte": cutoff}}},
+            {"$sort": {"inventory_id": 1, "as_of": -1}},
+            {"$group": {"_id": "$inventory_id", "snapshot": {"$first": "$$ROOT"}}}
+        ]
+        async for row in db.inventory_snapshots.aggregate(pipeline, allowDiskUse=True):
+            snapshot = row["snapshot"]
+            state[row["_id"]] = {
+                "inventory_id": row["_id"],
+                "item_name": snapshot.get("item_name"),
+                "category": snapshot.get("category"),
+                "project_id": snapshot.get("project_id"),
+                **{field: snapshot.get(field, 0) for field in INVENTORY_STOCK_FIELDS}
+            }
+
+    created_at = {"$lt": bound}
+    if cutoff:
+        created_at["$gte"] = cutoff
+    pipeline = [
+        {"$match": {**query, "created_at": created_at}},
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": "$inventory_id",
+            "item_name": {"$last": "$item_name"},
+            "category": {"$last": "$category"},
+            "project_id": {"$last": "$project_id"},
+            "events": {"$sum": 1},
+            **{field: {"$sum": f"${field}"} for field in INVENTORY_STOCK_FIELDS}
+        }}
+    ]
+    replayed = 0
+    async for row in db.inventory_events.aggregate(pipeline, allowDiskUse=True):
+        replayed += row["events"]
+        item = state.setdefault(row["_id"], {
+            "inventory_id": row["_id"],
+            **{field: 0 for field in INVENTORY_STOCK_FIELDS}
+        })
+        item.update({key: row[key] for key in ["item_name", "category", "project_id"] if row.get(key)})
+        for field in INVENTORY_STOCK_FIELDS:
+            item[field] += row[field]
+
+    return {"snapshot_at": cutoff, "events_replayed": replayed, "items": state}
+
+async def take_inventory_snapshots() -> int:
+    """Snapshot every inventory item with events since the previous run"""
+    bound = now_wib() - timedelta(seconds=INVENTORY_SNAPSHOT_LAG_SECONDS)
+    previous = await latest_snapshot_cutoff()
+    if previous and previous >= bound:
+        return 0
+
+    changed_query = {"created_at": {"$gte": previous, "$lt": bound}} if previous else {"created_at": {"$lt": bound}}
+    changed_ids = await db.inventory_events.distinct("inventory_id", changed_query)
+    if not changed_ids:
+        return 0
+
+    ledger = await fold_inventory_ledger(bound, {"inventory_id": {"$in": changed_ids}})
+    created_at = now_wib()
+    snapshots = [
+        {"id": str(uuid.uuid4()), **item, "as_of": bound, "created_at": created_at}
+        for item in ledger["items"].values()
+    ]
+    await db.inventory_snapshots.insert_many(snapshots, ordered=False)
+    return len(snapshots)
+
+async def backfill_inventory_ledger():
+    """Open the ledger with the current stock of items that have no events yet"""
+    try:
+        if await db.inventory_events.find_one({}, {"_id": 1}):
+            return
+        items = await db.inventory.find(
+            {}, {"_id": 0, "id": 1, "item_name": 1, "category": 1, "project_id": 1, "unit_price": 1, **{field: 1 for field in INVENTORY_STOCK_FIELDS}}
+        ).to_list(None)
+        await record_inventory_events([
+            inventory_event(item, "opening", after=item, unit_price=item.get("unit_price")) for item in items
+        ])
+        if items:
+            logger.info(f"Opened the inventory ledger for {len(items)} items")
+    except Exception as e:
+        logger.error(f"Inventory ledger backfill failed: {str(e)}")
+
+async def inventory_snapshot_loop():
+    """Background job that periodically snapshots the inventory ledger"""
+    while True:
+        await asyncio.sleep(INVENTORY_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            count = await take_inventory_snapshots()
+            if count:
+                logger.info(f"Inventory ledger snapshot written for {count} items")
+        except Exception as e:
+            logger.error(f"Inventory ledger snapshot failed: {str(e)}")
+
+# ============= INVENTORY VALUATION HELPERS =============
+
+def parse_valuation_period(period: Optional[str]) -> Dict[str, Any]:
+    """Resolve a YYYY-MM period (default: current month) to its exclusive end bound"""
+    today = now_wib().date()
+    if not period:
+        period = today.strftime("%Y-%m")
+    try:
+        start = datetime.strptime(period, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="period must be YYYY-MM")
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    bound = datetime(end.year, end.month, end.day, tzinfo=WIB)
+    return {"period": period, "bound": bound, "closed": end <= today}
+
+def previous_valuation_period(period: str) -> str:
+    """YYYY-MM of the month before period"""
+    return (datetime.strptime(period, "%Y-%m") - timedelta(days=1)).strftime("%Y-%m")
+
+def compute_inventory_valuation(
+    events: List[Dict[str, Any]],
+    fallback_prices: Dict[str, float],
+    opening: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Value every item's stock with FIFO and weighted average cost in one vectorized pass
+    - events must be sorted by (inventory_id, created_at); positive quantity deltas are purchases
+    - opening is the closing state of the previous period: its FIFO layers and unmatched withdrawals
+      are replayed ahead of the events and its purchase totals carried over
+    - Inflows without a price reuse the item's previous price (or its current inventory price)
+    - FIFO: withdrawals consume the oldest lots, so lot k keeps max(0, cum_in[k] - max(out, cum_in[k-1]))
+    - Weighted average: total purchase cost / total purchased quantity, applied to stock on hand
+    Returns the valued items and the closing state per item to resume the next period from
+    """
+    opening = opening or {}
+    opening_events = []
+    for inventory_id, state in opening.items():
+        base = {
+            "inventory_id": inventory_id, "item_name": state.get("item_name"),
+            "category": state.get("category"), "project_id": state.get("project_id"), "opening": True
+        }
+        opening_events.extend({**base, "quantity": quantity, "unit_price": price} for quantity, price in state["layers"])
+        if state["backorder"]:
+            opening_events.append({**base, "quantity": -state["backorder"], "unit_price": None})
+        # Zero-quantity marker: keeps the item when it has no lots and carries its last price forward
+        opening_events.append({**base, "quantity": 0, "unit_price": state["last_price"]})
+    if opening_events:
+        # Stable sort: within an item the opening state stays ahead of the period's own events
+        events = sorted(opening_events + events, key=lambda event: event["inventory_id"])
+
+    n = len(events)
+    if not n:
+        return [], {}
+
+    ids = np.array([event["inventory_id"] for event in events])
+    quantity = np.array([event.get("quantity") or 0 for event in events], dtype=float)
+    price = np.array([
+        np.nan if event.get("unit_price") is None else event["unit_price"] for event in events
+    ], dtype=float)
+    replayed = np.array([bool(event.get("opening")) for event in events])
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    group = np.repeat(np.arange(len(starts)), sizes)
+
+    # Forward-fill prices within each item; seeding group heads keeps the fill from leaking across items
+    heads = starts[np.isnan(price[starts])]
+    price[heads] = [fallback_prices.get(ids[idx], 0) or 0 for idx in heads]
+    filled = np.where(np.isnan(price), 0, np.arange(n))
+    np.maximum.accumulate(filled, out=filled)
+    price = price[filled]
+
+    inflow = np.where(quantity > 0, quantity, 0)
+    outflow = np.where(quantity < 0, -quantity, 0)
+    inflow_total = np.add.reduceat(inflow, starts)
+    outflow_total = np.add.reduceat(outflow, starts)
+    cost_total = np.add.reduceat(inflow * price, starts)
+
+    cum_in = np.cumsum(inflow)
+    cum_in -= np.repeat(cum_in[starts] - inflow[starts], sizes)
+    remaining = np.clip(cum_in - np.maximum(outflow_total[group], cum_in - inflow), 0, None)
+    fifo_value = np.add.reduceat(remaining * price, starts)
+
+    # Replayed lots aren't new purchases: swap them for the carried-over totals
+    carried = [opening.get(ids[start], {}) for start in starts]
+    purchased = inflow_total - np.add.reduceat(inflow * replayed, starts) + [state.get("purchased_quantity", 0) for state in carried]
+    withdrawn = outflow_total - np.add.reduceat(outflow * replayed, starts) + [state.get("withdrawn_quantity", 0) for state in carried]
+    purchase_cost = cost_total - np.add.reduceat(inflow * price * replayed, starts) + [state.get("purchase_cost", 0) for state in carried]
+
+    on_hand = inflow_total - outflow_total
+    average_cost = np.divide(purchase_cost, purchased, out=np.zeros_like(purchase_cost), where=purchased > 0)
+    average_value = np.maximum(on_hand, 0) * average_cost
+    fifo_cost = np.divide(fifo_value, on_hand, out=np.zeros_like(fifo_value), where=on_hand > 0)
+
+    layers = {}
+    for idx in np.flatnonzero(remaining > 0):
+        layers.setdefault(group[idx], []).append([float(remaining[idx]), float(price[idx])])
+
+    items = []
+    closing = {}
+    for g, start in enumerate(starts):
+        last = events[start + sizes[g] - 1]
+        items.append({
+            "inventory_id": last["inventory_id"],
+            "item_name": last.get("item_name"),
+            "category": last.get("category"),
+            "project_id": last.get("project_id"),
+            "purchased_quantity": float(purchased[g]),
+            "withdrawn_quantity": float(withdrawn[g]),
+            "quantity": float(on_hand[g]),
+            "fifo_unit_cost": round(float(fifo_cost[g]), 2),
+            "fifo_value": round(float(fifo_value[g]), 2),
+            "average_unit_cost": round(float(average_cost[g]), 2),
+            "average_value": round(float(average_value[g]), 2)
+        })
+        closing[last["inventory_id"]] = {
+            "inventory_id": last["inventory_id"],
+            "item_name": last.get("item_name"),
+            "category": last.get("category"),
+            "project_id": last.get("project_id"),
+            "purchased_quantity": float(purchased[g]),
+            "withdrawn_quantity": float(withdrawn[g]),
+            "purchase_cost": float(purchase_cost[g]),
+            "last_price": float(price[start + sizes[g] - 1]),
+            "backorder": float(max(outflow_total[g] - inflow_total[g], 0)),
+            "layers": layers.get(g, [])
+        }
+    return items, closing
+
+async def load_valuation_state(period: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Stored closing state of a closed period, or None when it hasn't been stored"""
+    if not await db.inventory_valuations.find_one({"period": period, "layers_stored": True}, {"_id": 1}):
+        return None
+    rows = await db.inventory_valuation_layers.find({"period": period}, {"_id": 0, "period": 0}).to_list(None)
+    return {row["inventory_id"]: row for row in rows}
+
+async def compute_period_valuation(resolved: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Valuation and closing state of a period, resumed from the previous month's closing state
+    - Only the period's own events are read; the previous month is computed (and stored) first if needed
+    - Closed periods are stored with their per-item state in inventory_valuation_layers
+    """
+    previous = parse_valuation_period(previous_valuation_period(resolved["period"]))
+    opening = {}
+    created_at = {"$lt": resolved["bound"]}
+    if await db.inventory_events.find_one({"created_at": {"$lt": previous["bound"]}}, {"_id": 1}):
+        opening = await load_valuation_state(previous["period"])
+        if opening is None:
+            _, opening = await compute_period_valuation(previous)
+        created_at["$gte"] = previous["bound"]
+
+    events = await db.inventory_events.find(
+        {"created_at": created_at},
+        {"_id": 0, "inventory_id": 1, "item_name": 1, "category": 1, "project_id": 1, "quantity": 1, "unit_price": 1}
+    ).sort([("inventory_id", 1), ("created_at", 1)]).to_list(None)
+    inventory_prices = await db.inventory.find({}, {"_id": 0, "id": 1, "unit_price": 1}).to_list(None)
+    items, closing = compute_inventory_valuation(
+        events, {item["id"]: item.get("unit_price") for item in inventory_prices}, opening
+    )
+    items = [item for item in items if item["quantity"] or item["purchased_quantity"]]
+
+    valuation = {
+        "period": resolved["period"],
+        "as_of": resolved["bound"],
+        "computed_at": now_wib(),
+        "items": items
+    }
+    if resolved["closed"]:
+        await db.inventory_valuation_layers.delete_many({"period": resolved["period"]})
+        rows = [{"period": resolved["period"], **state} for state in closing.values()]
+        for start in range(0, len(rows), 1000):
+            await db.inventory_valuation_layers.insert_many(rows[start:start + 1000], ordered=False)
+        # Flagged last, so a partially written state is never resumed from
+        await db.inventory_valuations.replace_one(
+            {"period": resolved["period"]}, {**valuation, "layers_stored": True}, upsert=True
+        )
+    return valuation, closing
+
+async def get_inventory_valuation(period: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Valuation of all inventory items at the end of a period
+    - Closed periods can't gain events any more, so their result is stored in inventory_valuations
+    - Other periods start from the last closed month's stored FIFO state and read only their own events
+    """
+    resolved = parse_valuation_period(period)
+    if resolved["closed"]:
+        cached = await db.inventory_valuations.find_one(
+            {"period": resolved["period"], "layers_stored": True}, {"_id": 0, "layers_stored": 0}
+        )
+        if cached:
+            return {**cached, "cached": True}
+
+    valuation, _ = await compute_period_valuation(resolved)
+    return {**valuation, "cached": False}
+
+# ============= LOW STOCK ALERT HELPERS =============
+
+# Roles that receive low-stock notifications
+LOW_STOCK_ALERT_ROLES = ["inventory", "admin"]
+# An item is not alerted again within this window
+LOW_STOCK_ALERT_WINDOW_HOURS = int(os.environ.get("LOW_STOCK_ALERT_WINDOW_HOURS", "24"))
+# Automatic reorder level = average daily usage over the usage window * lead time
+LOW_STOCK_USAGE_WINDOW_DAYS = 30
+LOW_STOCK_LEAD_TIME_DAYS = int(os.environ.get("LOW_STOCK_LEAD_TIME_DAYS", "7"))
+LOW_STOCK_THRESHOLD_INTERVAL_SECONDS = int(os.environ.get("LOW_STOCK_THRESHOLD_INTERVAL_SECONDS", "86400"))
+
+def reorder_level_of(item: Dict[str, Any]) -> Optional[float]:
+    """Manual reorder level wins over the precomputed one"""
+    if item.get("reorder_level") is not None:
+        return item["reorder_level"]
+    return item.get("auto_reorder_level")
+
+async def recompute_reorder_levels() -> int:
+    """Precompute auto_reorder_level for every item from its recent warehouse usage"""
+    since = now_wib() - timedelta(days=LOW_STOCK_USAGE_WINDOW_DAYS)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {"_id": "$inventory_id", "used": {"$sum": "$quantity"}}}
+    ]
+    levels = {
+        row["_id"]: round(row["used"] / LOW_STOCK_USAGE_WINDOW_DAYS * LOW_STOCK_LEAD_TIME_DAYS, 2)
+        async for row in db.warehouse_transactions.aggregate(pipeline)
+        if row["used"] > 0
+    }
+    if levels:
+        await db.inventory.bulk_write([
+            UpdateOne({"id": inventory_id}, {"$set": {"auto_reorder_level": level}})
+            for inventory_id, level in levels.items()
+        ], ordered=False)
+    await db.inventory.update_many(
+        {"auto_reorder_level": {"$exists": True}, "id": {"$nin": list(levels)}},
+        {"$unset": {"auto_reorder_level": ""}}
+    )
+    return len(levels)
+
+async def check_low_stock(inventory_ids: List[str]):
+    """
+    Alert procurement users about the given items if they dropped to their reorder level
+    - Only the items whose stock just changed are checked
+    - One notification per user lists every low item, written with a single insert_many
+    - Items alerted within LOW_STOCK_ALERT_WINDOW_HOURS are skipped
+    - Recipients hold an alert role as their primary role or in roles
+    - Failures propagate (items are only marked alerted after the notifications are written)
+    """
+    window_start = now_wib() - timedelta(hours=LOW_STOCK_ALERT_WINDOW_HOURS)
+    items = await db.inventory.find(
+        {
+            "id": {"$in": list(set(inventory_ids))},
+            "$or": [{"low_stock_alerted_at": {"$exists": False}}, {"low_stock_alerted_at": {"$lt": window_start}}]
+        },
+        {"_id": 0, "id": 1, "item_name": 1, "unit": 1, "quantity_in_warehouse": 1, "reorder_level": 1, "auto_reorder_level": 1}
+    ).to_list(None)
+    low_items = [
+        item for item in items
+        if reorder_level_of(item) is not None and item.get("quantity_in_warehouse", 0) <= reorder_level_of(item)
+    ]
+    if not low_items:
+        return
+
+    recipients = await db.users.find(
+        {"$or": [{"role": {"$in": LOW_STOCK_ALERT_ROLES}}, {"roles": {"$in": LOW_STOCK_ALERT_ROLES}}]},
+        {"_id": 0, "id": 1}
+    ).to_list(None)
+    details = ", ".join(
+        f"{item['item_name']} ({item.get('quantity_in_warehouse', 0):g} {item.get('unit', '')}, batas {reorder_level_of(item):g})"
+        for item in low_items
+    )
+    notifications = []
+    for recipient in recipients:
+        notif = Notification(
+            user_id=recipient["id"],
+            title="Stok Menipis",
+            message=f"{len(low_items)} item mencapai batas stok: {details}",
+            type="warning"
+        )
+        notif_dict = notif.model_dump()
+        notifications.append(notif_dict)
+    if notifications:
+        await db.notifications.insert_many(notifications, ordered=False)
+
+    await db.inventory.update_many(
+        {"id": {"$in": [item["id"] for item in low_items]}},
+        {"$set": {"low_stock_alerted_at": now_wib()}}
+    )
+
+async def low_stock_threshold_loop():
+    """Background job that refreshes the precomputed reorder levels"""
+    while True:
+        try:
+            count = await recompute_reorder_levels()
+            logger.info(f"Reorder levels recomputed for {count} items")
+        except Exception as e:
+            logger.error(f"Reorder level recomputation failed: {str(e)}")
+        await asyncio.sleep(LOW_STOCK_THRESHOLD_INTERVAL_SECONDS)
+
+# ============= TRANSACTION ENDPOINTS =============
 
 @api_router.post("/transactions")
 async def create_transaction(input: TransactionInput, user: User = Depends(get_current_user)):
@@ -1733,14 +4238,13 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
         unit=input.unit,
         status=input.status,
         receipt=input.receipt,
-        transaction_date=datetime.fromisoformat(input.transaction_date) if input.transaction_date else now_wib(),
+        transaction_date=as_wib_datetime(input.transaction_date) or now_wib(),
         created_by=user.id
     )
     
     trans_dict = transaction.model_dump()
-    trans_dict["transaction_date"] = trans_dict["transaction_date"].isoformat()
-    trans_dict["created_at"] = trans_dict["created_at"].isoformat()
     await db.transactions.insert_one(trans_dict)
+    await bump_collection_versions("transactions")
     
     # Auto-create inventory for 'bahan' or 'alat' category
     if input.category in ['bahan', 'alat']:
@@ -1748,6 +4252,9 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
         project = await db.projects.find_one({"id": input.project_id}, {"_id": 0, "type": 1})
         project_type = project.get("type", "arsitektur") if project else "arsitektur"
         
+        await index_transaction_items(trans_dict, project_type)
+        inventory_events = []
+        
         if input.items and len(input.items) > 0:
             # Handle multiple items (for 'bahan' with items array)
             for item in input.items:
@@ -1781,9 +4288,14 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
                             "quantity": new_total_quantity,
                             "total_value": new_total_value,
                             "unit_price": item.unit_price,
-                            "updated_at": now_wib().isoformat()
+                            "updated_at": now_wib()
                         }}
                     )
+                    inventory_events.append(inventory_event(
+                        existing, item_status, before=existing,
+                        after={"quantity_in_warehouse": new_qty_in_warehouse, "quantity_out_warehouse": new_qty_out_warehouse, "quantity": new_total_quantity},
+                        source={"transaction_id": transaction.id}, user_id=user.id, unit_price=item.unit_price
+                    ))
                 else:
                     # Create new inventory item
                     qty_in_warehouse = item.quantity if item_status == 'receiving' else 0
@@ -1804,9 +4316,12 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
                         status="Tersedia"
                     )
                     inv_dict = inventory.model_dump()
-                    inv_dict["created_at"] = inv_dict["created_at"].isoformat()
-                    inv_dict["updated_at"] = inv_dict["updated_at"].isoformat()
                     await db.inventory.insert_one(inv_dict)
+                    await invalidate_item_name_index()
+                    inventory_events.append(inventory_event(
+                        inv_dict, item_status, after=inv_dict,
+                        source={"transaction_id": transaction.id}, user_id=user.id, unit_price=item.unit_price
+                    ))
         elif input.quantity and input.unit:
             # Handle single item (for 'alat' or simple 'bahan')
             # Use status from input (default to receiving if not provided)
@@ -1840,9 +4355,14 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
                         "quantity": new_total_quantity,
                         "total_value": new_total_value,
                         "unit_price": unit_price,
-                        "updated_at": now_wib().isoformat()
+                        "updated_at": now_wib()
                     }}
                 )
+                inventory_events.append(inventory_event(
+                    existing, item_status, before=existing,
+                    after={"quantity_in_warehouse": new_qty_in_warehouse, "quantity_out_warehouse": new_qty_out_warehouse, "quantity": new_total_quantity},
+                    source={"transaction_id": transaction.id}, user_id=user.id, unit_price=unit_price
+                ))
             else:
                 # Create new inventory item
                 qty_in_warehouse = input.quantity if item_status == 'receiving' else 0
@@ -1863,9 +4383,14 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
                     status="Tersedia"
                 )
                 inv_dict = inventory.model_dump()
-                inv_dict["created_at"] = inv_dict["created_at"].isoformat()
-                inv_dict["updated_at"] = inv_dict["updated_at"].isoformat()
                 await db.inventory.insert_one(inv_dict)
+                await invalidate_item_name_index()
+                inventory_events.append(inventory_event(
+                    inv_dict, item_status, after=inv_dict,
+                    source={"transaction_id": transaction.id}, user_id=user.id, unit_price=unit_price
+                ))
+        
+        await record_inventory_events(inventory_events)
     
     # Notify accounting
     accountants = await db.users.find({"role": "accounting"}).to_list(100)
@@ -1877,7 +4402,6 @@ async def create_transaction(input: TransactionInput, user: User = Depends(get_c
             type="info"
         )
         notif_dict = notif.model_dump()
-        notif_dict["created_at"] = notif_dict["created_at"].isoformat()
         await db.notifications.insert_one(notif_dict)
     
     return {"message": "Transaction created", "id": transaction.id}
@@ -1901,9 +4425,13 @@ async def get_recent_transactions(user: User = Depends(get_current_user)):
 
 @api_router.patch("/transactions/{transaction_id}")
 async def update_transaction(transaction_id: str, updates: dict, user: User = Depends(get_current_user)):
-    result = await db.transactions.update_one({"id": transaction_id}, {"$set": updates})
+    result = await db.transactions.update_one({"id": transaction_id}, {"$set": coerce_timestamps(updates, "transactions")})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    await bump_collection_versions("transactions")
+    
+    if updates.keys() & {"items", "category", "project_id", "transaction_date"} or any(key.startswith("items.") for key in updates):
+        await reindex_transaction_items(transaction_id)
     return {"message": "Transaction updated"}
 
 @api_router.put("/transactions/{transaction_id}/item-status")
@@ -1930,6 +4458,7 @@ async def update_transaction_item_status(
         {"id": transaction_id},
         {"$set": {f"items.{item_index}.status": new_status}}
     )
+    await bump_collection_versions("transactions")
     
     # Sync with inventory
     inventory_item = await db.inventory.find_one({
@@ -1965,22 +4494,368 @@ async def update_transaction_item_status(
                 "quantity_in_warehouse": final_in_warehouse,
                 "quantity_out_warehouse": final_out_warehouse,
                 "quantity": final_total,
-                "updated_at": now_wib().isoformat()
+                "updated_at": now_wib()
             }}
         )
+        await record_inventory_events([inventory_event(
+            inventory_item, "status_change", before=inventory_item,
+            after={"quantity_in_warehouse": final_in_warehouse, "quantity_out_warehouse": final_out_warehouse, "quantity": final_total},
+            source={"transaction_id": transaction_id, "item_index": item_index}, user_id=user.id
+        )])
+        await check_low_stock([inventory_item["id"]])
     
     return {"message": "Item status updated and inventory synced"}
 
 @api_router.delete("/transactions/{transaction_id}")
 async def delete_transaction(transaction_id: str, user: User = Depends(get_current_user)):
     # Delete related inventory items
+    await record_inventory_removal({"transaction_id": transaction_id}, {"transaction_id": transaction_id}, user.id)
     await db.inventory.delete_many({"transaction_id": transaction_id})
+    await invalidate_item_name_index()
     
     result = await db.transactions.delete_one({"id": transaction_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    await bump_collection_versions("transactions")
+    await unindex_transaction_items({"transaction_id": transaction_id})
     return {"message": "Transaction deleted"}
 
+# ============= WAREHOUSE USAGE REPORT HELPERS =============
+
+MAX_USAGE_REPORT_PAGE_SIZE = 500
+
+def parse_report_date(value: Optional[str], field: str) -> Optional[datetime]:
+    """Validate an optional YYYY-MM-DD report bound (midnight WIB)"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:10], "%Y-%m-%d").replace(tzinfo=WIB)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+def usage_report_match(
+    project_id: Optional[str],
+    category: Optional[str],
+    from_date: Optional[str],
+    to_date: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Build the warehouse_transactions filter shared by the usage report endpoints
+    - from/to are inclusive WIB dates
+    """
+    match = {}
+    if project_id:
+        match["project_id"] = project_id
+    if category:
+        match["category"] = category
+    start = parse_report_date(from_date, "from")
+    end = parse_report_date(to_date, "to")
+    if start or end:
+        match["created_at"] = {}
+        if start:
+            match["created_at"]["$gte"] = start
+        if end:
+            match["created_at"]["$lt"] = end + timedelta(days=1)
+    return match
+
+async def iter_usage_report(match: Dict[str, Any]):
+    """Yield one project entry at a time from a per-(project, item) $group"""
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"project_id": "$project_id", "item_name": "$item_name"},
+            "project_name": {"$first": "$project_name"},
+            "unit": {"$first": "$unit"},
+            "usage_type": {"$first": "$usage_type"},
+            "total_quantity": {"$sum": "$quantity"},
+            "transaction_count": {"$sum": 1},
+            "first_used_at": {"$min": "$created_at"},
+            "last_used_at": {"$max": "$created_at"}
+        }},
+        {"$sort": {"_id.project_id": 1, "_id.item_name": 1}}
+    ]
+
+    project = None
+    async for row in db.warehouse_transactions.aggregate(pipeline, allowDiskUse=True):
+        if project is None or project["project_id"] != row["_id"]["project_id"]:
+            if project:
+                yield project
+            project = {
+                "project_id": row["_id"]["project_id"],
+                "project_name": row["project_name"],
+                "items": []
+            }
+        project["items"].append({
+            "item_name": row["_id"]["item_name"],
+            "total_quantity": row["total_quantity"],
+            "unit": row["unit"],
+            "usage_type": row["usage_type"],
+            "transaction_count": row["transaction_count"],
+            "first_used_at": row["first_used_at"],
+            "last_used_at": row["last_used_at"]
+        })
+    if project:
+        yield project
+
+async def iter_ndjson(rows):
+    """Encode an async iterator of dicts as newline-delimited JSON"""
+    async for row in rows:
+        yield json.dumps(row, default=to_wib_iso) + "\n"
+
+async def backfill_warehouse_transaction_categories():
+    """Copy the inventory category onto warehouse transactions created before it was stored"""
+    try:
+        for category in ["bahan", "alat"]:
+            if not await db.warehouse_transactions.find_one({"category": {"$exists": False}}, {"_id": 1}):
+                return
+            inventory_ids = await db.inventory.distinct("id", {"category": category})
+            if inventory_ids:
+                await db.warehouse_transactions.update_many(
+                    {"category": {"$exists": False}, "inventory_id": {"$in": inventory_ids}},
+                    {"$set": {"category": category}}
+                )
+    except Exception as e:
+        logger.error(f"Warehouse transaction category backfill failed: {str(e)}")
+
+# ============= WAREHOUSE WITHDRAWAL HELPERS =============
+
+MAX_WAREHOUSE_WITHDRAWAL_LINES = 200
+
+_mongo_supports_transactions = None
+
+async def mongo_supports_transactions() -> bool:
+    """Multi-document transactions need a replica set (or mongos); standalone servers don't have them"""
+    global _mongo_supports_transactions
+    if _mongo_supports_transactions is None:
+        try:
+            hello = await client.admin.command("hello")
+            _mongo_supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            logger.warning(f"Could not detect Mongo topology, withdrawals run without transactions: {str(e)}")
+            return False
+    return _mongo_supports_transactions
+
+WAREHOUSE_STOCK_CHANGED = "Stok berubah saat diproses, silakan coba lagi"
+
+def warehouse_stock_update(delta: float, updated_at: datetime) -> Dict[str, Any]:
+    """Move quantity_in_warehouse (and the total quantity) by delta"""
+    return {
+        "$inc": {"quantity_in_warehouse": delta, "quantity": delta},
+        "$set": {"updated_at": updated_at}
+    }
+
+async def apply_warehouse_withdrawal(
+    input: WarehouseWithdrawalInput,
+    project_name: str,
+    user: User,
+    session=None
+) -> List[str]:
+    """
+    Validate and book a whole material requisition
+    - Stock for every line is checked with one query (duplicate lines are summed)
+    - Every $inc is guarded by quantity_in_warehouse >= quantity, so a concurrent withdrawal can't go negative
+    - Inside a transaction the guarded decrements go in one bulk_write and a short match aborts the batch
+    - Without one they are applied line by line and the applied lines are put back if a later one is short
+    """
+    requested = {}
+    for line in input.items:
+        requested[line.inventory_id] = requested.get(line.inventory_id, 0) + line.quantity
+
+    inventory_items = await db.inventory.find(
+        {"id": {"$in": list(requested)}},
+        {"_id": 0, "id": 1, "item_name": 1, "unit": 1, "category": 1, "project_id": 1, "quantity_in_warehouse": 1},
+        session=session
+    ).to_list(None)
+    inventory_by_id = {item["id"]: item for item in inventory_items}
+
+    missing = [inventory_id for inventory_id in requested if inventory_id not in inventory_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Inventory item not found: {', '.join(missing)}")
+
+    shortages = [
+        f"{inventory_by_id[inventory_id]['item_name']} (Tersedia: {inventory_by_id[inventory_id].get('quantity_in_warehouse', 0)}, Diminta: {quantity})"
+        for inventory_id, quantity in requested.items()
+        if inventory_by_id[inventory_id].get("quantity_in_warehouse", 0) < quantity
+    ]
+    if shortages:
+        raise HTTPException(status_code=400, detail=f"Stok tidak cukup: {'; '.join(shortages)}")
+
+    updated_at = now_wib()
+    if session:
+        operations = [
+            UpdateOne(
+                {"id": inventory_id, "quantity_in_warehouse": {"$gte": quantity}},
+                warehouse_stock_update(-quantity, updated_at)
+            )
+            for inventory_id, quantity in requested.items()
+        ]
+        result = await db.inventory.bulk_write(operations, ordered=False, session=session)
+        if result.matched_count != len(operations):
+            raise HTTPException(status_code=409, detail=WAREHOUSE_STOCK_CHANGED)
+    else:
+        applied = []
+        for inventory_id, quantity in requested.items():
+            result = await db.inventory.update_one(
+                {"id": inventory_id, "quantity_in_warehouse": {"$gte": quantity}},
+                warehouse_stock_update(-quantity, updated_at)
+            )
+            if not result.matched_count:
+                for applied_id, applied_quantity in applied:
+                    await db.inventory.update_one({"id": applied_id}, warehouse_stock_update(applied_quantity, updated_at))
+                raise HTTPException(status_code=409, detail=WAREHOUSE_STOCK_CHANGED)
+            applied.append((inventory_id, quantity))
+
+    records = []
+    for line in input.items:
+        inventory = inventory_by_id[line.inventory_id]
+        warehouse_trans = WarehouseTransaction(
+            inventory_id=line.inventory_id,
+            item_name=inventory["item_name"],
+            quantity=line.quantity,
+            unit=inventory["unit"],
+            project_id=input.project_id,
+            project_name=project_name,
+            usage_type=line.usage_type or input.usage_type,
+            category=inventory.get("category"),
+            notes=line.notes if line.notes is not None else input.notes,
+            created_by=user.id
+        )
+        trans_dict = warehouse_trans.model_dump()
+        records.append(trans_dict)
+    await db.warehouse_transactions.insert_many(records, session=session)
+
+    # Withdrawn quantity expressed as the stock that leaves the warehouse
+    events = [
+        inventory_event(
+            inventory_by_id[record["inventory_id"]], "withdrawal",
+            before={"quantity_in_warehouse": record["quantity"], "quantity": record["quantity"]},
+            source={"warehouse_transaction_id": record["id"]}, user_id=user.id
+        )
+        for record in records
+    ]
+    await db.inventory_events.insert_many(events, ordered=False, session=session)
+
+    return [record["id"] for record in records]
+
+async def book_warehouse_withdrawal(input: WarehouseWithdrawalInput, project_name: str, user: User) -> List[str]:
+    """apply_warehouse_withdrawal inside a Mongo transaction where the deployment supports one"""
+    if await mongo_supports_transactions():
+        async with await client.start_session() as session:
+            # with_transaction reruns the whole batch on TransientTransactionError
+            return await session.with_transaction(
+                lambda session: apply_warehouse_withdrawal(input, project_name, user, session=session)
+            )
+    return await apply_warehouse_withdrawal(input, project_name, user)
+
+# ============= INVENTORY ITEM NAME INDEX =============
+
+ITEM_NAME_INDEX_TTL_SECONDS = int(os.environ.get("ITEM_NAME_INDEX_TTL_SECONDS", "300"))
+
+# Writes in any worker bump these, so every worker drops an index built before them
+ITEM_NAME_INDEX_COLLECTIONS = ["inventory"]
+
+_item_name_index = None
+_item_name_index_generation = 0
+_item_name_index_lock = asyncio.Lock()
+
+def build_item_name_index(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Group inventory item names per (category, project_type) for prefix lookups
+    - None in either position of the key means "any"
+    - Each group holds names sorted by their normalized form plus usage counts
+    """
+    groups = {}
+    for row in rows:
+        name = row["_id"]["item_name"]
+        key = normalize_text(name)
+        if not key:
+            continue
+        category = row["_id"].get("category")
+        project_type = row["_id"].get("project_type")
+        for group_key in {(category, project_type), (category, None), (None, project_type), (None, None)}:
+            group = groups.setdefault(group_key, {})
+            entry = group.setdefault(name, [key, 0])
+            entry[1] += row["count"]
+
+    index = {}
+    for group_key, group in groups.items():
+        ordered = sorted(group.items(), key=lambda entry: (entry[1][0], entry[0]))
+        index[group_key] = {
+            "keys": [entry[1][0] for entry in ordered],
+            "names": [entry[0] for entry in ordered],
+            "counts": [entry[1][1] for entry in ordered],
+            "alphabetical": sorted(group)
+        }
+    return {"groups": index, "loaded_at": time.monotonic()}
+
+async def get_item_name_index(version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the cached item-name index, loading it from Mongo when missing or stale
+    - version (from get_collection_versions) also reloads an index built before another worker's write
+    """
+    global _item_name_index
+
+    def is_fresh(index):
+        return (
+            index
+            and time.monotonic() - index["loaded_at"] < ITEM_NAME_INDEX_TTL_SECONDS
+            and (version is None or index["version"] == version)
+        )
+
+    index = _item_name_index
+    if is_fresh(index):
+        return index
+
+    async with _item_name_index_lock:
+        index = _item_name_index
+        if is_fresh(index):
+            return index
+
+        generation = _item_name_index_generation
+        if version is None:
+            version = await get_collection_versions(ITEM_NAME_INDEX_COLLECTIONS)
+        rows = await db.inventory.aggregate([
+            {"$group": {
+                "_id": {"category": "$category", "project_type": "$project_type", "item_name": "$item_name"},
+                "count": {"$sum": 1}
+            }}
+        ]).to_list(None)
+        index = build_item_name_index([row for row in rows if row["_id"].get("item_name")])
+        index["version"] = version
+        if generation == _item_name_index_generation:
+            _item_name_index = index
+        return index
+
+async def invalidate_item_name_index():
+    """Drop the cached item-name index after inventory inserts, renames and deletes, here and in other workers"""
+    global _item_name_index, _item_name_index_generation
+    _item_name_index_generation += 1
+    _item_name_index = None
+    await bump_collection_versions(*ITEM_NAME_INDEX_COLLECTIONS)
+
+def search_item_name_index(
+    index: Dict[str, Any],
+    q: Optional[str],
+    category: Optional[str] = None,
+    project_type: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[str]:
+    """Prefix-match item names ignoring case and accents, most used first"""
+    group = index["groups"].get((category, project_type))
+    if not group:
+        return []
+
+    prefix = normalize_text(q) if q else ""
+    if not prefix:
+        return group["alphabetical"][:limit] if limit else group["alphabetical"]
+
+    lo = bisect.bisect_left(group["keys"], prefix)
+    hi = bisect.bisect_left(group["keys"], prefix + "\uffff")
+    ranked = sorted(range(lo, hi), key=lambda idx: (-group["counts"][idx], group["keys"][idx]))
+    if limit:
+        ranked = ranked[:limit]
+    return [group["names"][idx] for idx in ranked]
+
 # ============= INVENTORY ENDPOINTS =============
 
 @api_router.get("/inventory/item-names")
@@ -1988,6 +4863,8 @@ async def get_inventory_item_names(
     category: Optional[str] = None, 
     project_id: Optional[str] = None,
     project_type: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
     user: User = Depends(get_current_user)
 ):
     """
@@ -1995,44 +4872,36 @@ async def get_inventory_item_names(
     - Filter by category (bahan/alat)
     - Filter by project_type (interior/arsitektur) - shared across projects of same type
     - project_id is deprecated, use project_type instead
+    - q: case/accent-insensitive prefix, results ranked by how often the name is used
     """
-    query = {}
-    if category:
-        query["category"] = category
-    
     # Use project_type for filtering (shared across projects of same type)
     # If project_id provided, get its type and filter by that
-    if project_type:
-        query["project_type"] = project_type
-    elif project_id:
+    if not project_type and project_id:
         # Get project type from project_id for backward compatibility
         project = await db.projects.find_one({"id": project_id}, {"_id": 0, "type": 1})
         if project:
-            query["project_type"] = project.get("type", "arsitektur")
+            project_type = project.get("type", "arsitektur")
     
-    # Get distinct item names
-    item_names = await db.inventory.distinct("item_name", query)
+    index = await get_item_name_index(await get_collection_versions(ITEM_NAME_INDEX_COLLECTIONS))
+    item_names = search_item_name_index(
+        index, q, category, project_type, max(1, min(limit, 1000)) if limit else None
+    )
     
-    return {"item_names": sorted(item_names)}
+    return {"item_names": item_names}
 
 @api_router.get("/inventory/suppliers")
-async def get_suppliers(user: User = Depends(get_current_user)):
-    """Get unique supplier names for autocomplete"""
-    # Get all transactions with items
-    transactions = await db.transactions.find(
-        {"category": {"$in": ["bahan", "alat"]}, "items": {"$exists": True}},
-        {"_id": 0, "items": 1}
-    ).to_list(10000)
-    
-    # Extract unique suppliers
-    suppliers = set()
-    for trans in transactions:
-        for item in trans.get("items", []):
-            supplier = item.get("supplier")
-            if supplier:
-                suppliers.add(supplier)
-    
-    return {"suppliers": sorted(list(suppliers))}
+async def get_suppliers(
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Get supplier names for autocomplete from the suppliers directory
+    - Without q: all suppliers alphabetically
+    - With q: suppliers whose name starts with q, most frequently used first
+    """
+    version = await get_collection_versions(["suppliers"])
+    return {"suppliers": await list_supplier_names(version, normalize_text(q), max(1, min(limit, 1000)) if limit else None)}
 
 @api_router.get("/inventory/price-comparison")
 async def get_price_comparison(
@@ -2040,79 +4909,216 @@ async def get_price_comparison(
     project_type: Optional[str] = None,
     user: User = Depends(get_current_user)
 ):
-    """Get price comparison for items across suppliers"""
-    # Get all transactions with items
-    query = {"category": "bahan", "items": {"$exists": True}}
-    transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
-    
-    # If project_type filter is provided, get project IDs of that type
-    project_ids_filter = None
+    """Get price comparison for items across suppliers (from supplier_price_history)"""
+    match = {"category": "bahan"}
+    if item_name:
+        match["item_name"] = item_name
     if project_type:
-        projects = await db.projects.find({"type": project_type}, {"_id": 0, "id": 1}).to_list(1000)
-        project_ids_filter = {p["id"] for p in projects}
-        # If project_type is provided but no projects found, return empty results
-        if not project_ids_filter:
-            return []
-    
-    # Build price comparison data
-    comparison = {}
-    
-    for trans in transactions:
-        # Filter by project_type if provided
-        if project_ids_filter is not None and trans.get("project_id") not in project_ids_filter:
-            continue
-            
-        for item in trans.get("items", []):
-            item_desc = item.get("description")
-            supplier = item.get("supplier", "Tidak ada nama toko")
-            unit_price = item.get("unit_price", 0)
-            unit = item.get("unit", "")
-            
-            # Filter by item_name if provided
-            if item_name and item_desc != item_name:
-                continue
-            
-            if item_desc not in comparison:
-                comparison[item_desc] = {
-                    "item_name": item_desc,
-                    "unit": unit,
-                    "suppliers": {}
-                }
-            
-            if supplier not in comparison[item_desc]["suppliers"]:
-                comparison[item_desc]["suppliers"][supplier] = {
-                    "supplier": supplier,
-                    "prices": []
-                }
-            
-            comparison[item_desc]["suppliers"][supplier]["prices"].append({
-                "price": unit_price,
-                "date": trans.get("transaction_date")
-            })
+        match["project_type"] = project_type
+    
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"item_name": 1, "supplier": 1, "date": -1}},
+        {"$group": {
+            "_id": {"item_name": "$item_name", "supplier": "$supplier"},
+            "unit": {"$first": "$unit"},
+            "latest_price": {"$first": "$unit_price"},
+            "average_price": {"$avg": "$unit_price"},
+            "transaction_count": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": "$_id.item_name",
+            "unit": {"$first": "$unit"},
+            "suppliers": {"$push": {
+                "supplier": "$_id.supplier",
+                "latest_price": "$latest_price",
+                "average_price": "$average_price",
+                "transaction_count": "$transaction_count"
+            }}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
     
-    # Calculate average and latest price for each supplier
     result = []
-    for item_desc, data in comparison.items():
-        suppliers_data = []
-        for supplier, supplier_info in data["suppliers"].items():
-            prices = supplier_info["prices"]
-            avg_price = sum(p["price"] for p in prices) / len(prices)
-            latest_price = sorted(prices, key=lambda x: x["date"], reverse=True)[0]["price"]
-            
-            suppliers_data.append({
-                "supplier": supplier,
-                "latest_price": latest_price,
-                "average_price": avg_price,
-                "transaction_count": len(prices)
-            })
-        
+    async for row in db.supplier_price_history.aggregate(pipeline):
         result.append({
-            "item_name": item_desc,
-            "unit": data["unit"],
-            "suppliers": sorted(suppliers_data, key=lambda x: x["latest_price"])
+            "item_name": row["_id"],
+            "unit": row["unit"],
+            "suppliers": sorted(row["suppliers"], key=lambda x: x["latest_price"])
         })
     
-    return sorted(result, key=lambda x: x["item_name"])
+    return result
+
+@api_router.post("/admin/rebuild-supplier-price-history")
+async def rebuild_supplier_price_history_endpoint(user: User = Depends(get_current_user)):
+    """Recreate supplier_price_history from transactions (admin only)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    
+    count = await rebuild_supplier_price_history()
+    return {"message": "Supplier price history rebuilt", "count": count}
+
+@api_router.post("/admin/inventory-snapshots")
+async def take_inventory_snapshots_endpoint(user: User = Depends(get_current_user)):
+    """Snapshot the inventory ledger now instead of waiting for the background job (admin only)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    
+    count = await take_inventory_snapshots()
+    return {"message": "Inventory snapshot taken", "count": count}
+
+# Static /inventory/... routes must be registered before /inventory/{inventory_id}
+@api_router.get("/inventory/usage-report")
+async def get_inventory_usage_report(
+    project_id: Optional[str] = None,
+    category: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    format: str = "json",
+    user: User = Depends(get_current_user)
+):
+    """
+    Get inventory usage report by project, aggregated per item
+    - from/to: inclusive YYYY-MM-DD range on the usage date
+    - format=ndjson streams one project per line instead of building a list
+    - Per-transaction detail is served by /inventory/usage-report/transactions
+    """
+    match = usage_report_match(project_id, category, from_date, to_date)
+    
+    if format == "ndjson":
+        return StreamingResponse(iter_ndjson(iter_usage_report(match)), media_type="application/x-ndjson")
+    
+    return [project async for project in iter_usage_report(match)]
+
+@api_router.get("/inventory/usage-report/transactions")
+async def get_inventory_usage_transactions(
+    project_id: Optional[str] = None,
+    category: Optional[str] = None,
+    item_name: Optional[str] = None,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    page: int = 1,
+    page_size: int = 100,
+    format: str = "json",
+    user: User = Depends(get_current_user)
+):
+    """
+    Get the warehouse transactions behind the usage report
+    - Same filters as the report plus item_name, newest first
+    - page/page_size paginate the JSON response; format=ndjson streams every match
+    """
+    match = usage_report_match(project_id, category, from_date, to_date)
+    if item_name:
+        match["item_name"] = item_name
+    projection = {"_id": 0, "created_by": 0}
+    
+    if format == "ndjson":
+        cursor = db.warehouse_transactions.find(match, projection).sort("created_at", -1)
+        return StreamingResponse(iter_ndjson(cursor), media_type="application/x-ndjson")
+    
+    page = max(1, page)
+    page_size = max(1, min(page_size, MAX_USAGE_REPORT_PAGE_SIZE))
+    total = await db.warehouse_transactions.count_documents(match)
+    transactions = await db.warehouse_transactions.find(match, projection).sort(
+        "created_at", -1
+    ).skip((page - 1) * page_size).limit(page_size).to_list(page_size)
+    
+    return {
+        "transactions": transactions,
+        "total": total,
+        "page": page,
+        "page_size": page_size
+    }
+
+@api_router.get("/inventory/stock-as-of")
+async def get_inventory_stock_as_of(
+    as_of: str,
+    project_id: Optional[str] = None,
+    category: Optional[str] = None,
+    inventory_id: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Get inventory stock at a point in time from the inventory ledger
+    - as_of: YYYY-MM-DD (end of that day, WIB) or an ISO datetime
+    - Starts from the nearest snapshot and replays only the events after it
+    """
+    query = {}
+    if project_id:
+        query["project_id"] = project_id
+    if category:
+        query["category"] = category
+    if inventory_id:
+        query["inventory_id"] = inventory_id
+    
+    ledger = await fold_inventory_ledger(parse_as_of(as_of), query)
+    items = sorted(
+        (item for item in ledger["items"].values() if any(item[field] for field in INVENTORY_STOCK_FIELDS)),
+        key=lambda item: (item.get("item_name") or "", item["inventory_id"])
+    )
+    
+    return {
+        "as_of": as_of,
+        "snapshot_at": ledger["snapshot_at"],
+        "events_replayed": ledger["events_replayed"],
+        "items": items
+    }
+
+@api_router.get("/inventory/valuation")
+async def get_inventory_valuation_report(
+    period: Optional[str] = None,
+    project_id: Optional[str] = None,
+    category: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Get FIFO and weighted-average valuation of inventory at the end of a month
+    - period: YYYY-MM, defaults to the current month
+    - book_value is the stored total_value (quantity * latest price) for comparison
+    """
+    valuation = await get_inventory_valuation(period)
+    items = valuation["items"]
+    if project_id:
+        items = [item for item in items if item.get("project_id") == project_id]
+    if category:
+        items = [item for item in items if item.get("category") == category]
+    
+    book_values = {}
+    if not parse_valuation_period(period)["closed"]:
+        inventory = await db.inventory.find({}, {"_id": 0, "id": 1, "total_value": 1}).to_list(None)
+        book_values = {item["id"]: item.get("total_value", 0) for item in inventory}
+    
+    items = [
+        {**item, "book_value": book_values.get(item["inventory_id"])} if book_values else item
+        for item in sorted(items, key=lambda item: (item.get("item_name") or "", item["inventory_id"]))
+    ]
+    
+    return {
+        "period": valuation["period"],
+        "as_of": valuation["as_of"],
+        "computed_at": valuation["computed_at"],
+        "cached": valuation["cached"],
+        "totals": {
+            "fifo_value": round(sum(item["fifo_value"] for item in items), 2),
+            "average_value": round(sum(item["average_value"] for item in items), 2)
+        },
+        "items": items
+    }
+
+@api_router.get("/inventory/low-stock")
+async def get_low_stock_inventory(category: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Get inventory items at or below their reorder level"""
+    query = {"$or": [{"reorder_level": {"$ne": None}}, {"auto_reorder_level": {"$exists": True}}]}
+    if category:
+        query["category"] = category
+    
+    items = await db.inventory.find(query, {"_id": 0}).to_list(None)
+    low_items = [
+        {**item, "effective_reorder_level": reorder_level_of(item)}
+        for item in items
+        if reorder_level_of(item) is not None and item.get("quantity_in_warehouse", 0) <= reorder_level_of(item)
+    ]
+    return sorted(low_items, key=lambda item: item.get("item_name", ""))
 
 @api_router.get("/inventory")
 async def get_inventory(category: Optional[str] = None, user: User = Depends(get_current_user)):
@@ -2141,6 +5147,14 @@ async def get_inventory_item(inventory_id: str, user: User = Depends(get_current
     
     return item
 
+@api_router.get("/inventory/{inventory_id}/ledger")
+async def get_inventory_ledger(inventory_id: str, limit: int = 200, user: User = Depends(get_current_user)):
+    """Get the stock events of an inventory item, newest first"""
+    events = await db.inventory_events.find(
+        {"inventory_id": inventory_id}, {"_id": 0}
+    ).sort("created_at", -1).limit(max(1, min(limit, 1000))).to_list(None)
+    return events
+
 @api_router.get("/inventory/{inventory_id}/breakdown-by-supplier")
 async def get_inventory_breakdown_by_supplier(inventory_id: str, user: User = Depends(get_current_user)):
     """Get inventory breakdown by supplier/store"""
@@ -2149,47 +5163,41 @@ async def get_inventory_breakdown_by_supplier(inventory_id: str, user: User = De
     if not item:
         raise HTTPException(status_code=404, detail="Inventory item not found")
     
-    # Find all transactions for this item
-    transactions = await db.transactions.find({
-        "category": item["category"],
-        "project_id": item["project_id"]
-    }, {"_id": 0}).to_list(1000)
-    
-    # Build breakdown by supplier
-    breakdown = {}
-    
-    for trans in transactions:
-        if trans.get("items"):
-            # Handle items array
-            for trans_item in trans["items"]:
-                if trans_item["description"] == item["item_name"]:
-                    supplier = trans_item.get("supplier") or "Tidak ada nama toko"
-                    status = trans_item.get("status", "receiving")
-                    quantity = trans_item["quantity"]
-                    
-                    if supplier not in breakdown:
-                        breakdown[supplier] = {
-                            "in_warehouse": 0,
-                            "out_warehouse": 0,
-                            "total": 0
-                        }
-                    
-                    if status == "receiving":
-                        breakdown[supplier]["in_warehouse"] += quantity
-                    else:
-                        breakdown[supplier]["out_warehouse"] += quantity
-                    
-                    breakdown[supplier]["total"] += quantity
+    # Sum the matching transaction lines per supplier inside Mongo
+    pipeline = [
+        {"$match": {
+            "project_id": item["project_id"],
+            "category": item["category"],
+            "items.description": item["item_name"]
+        }},
+        {"$project": {"_id": 0, "items": 1}},
+        {"$unwind": "$items"},
+        {"$match": {"items.description": item["item_name"]}},
+        {"$group": {
+            "_id": {"$cond": [
+                {"$gt": [{"$ifNull": ["$items.supplier", ""]}, ""]},
+                "$items.supplier",
+                NO_SUPPLIER_NAME
+            ]},
+            "in_warehouse": {"$sum": {"$cond": [
+                {"$eq": [{"$ifNull": ["$items.status", "receiving"]}, "receiving"]}, "$items.quantity", 0
+            ]}},
+            "out_warehouse": {"$sum": {"$cond": [
+                {"$eq": [{"$ifNull": ["$items.status", "receiving"]}, "receiving"]}, 0, "$items.quantity"
+            ]}},
+            "total": {"$sum": "$items.quantity"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
     
-    # Convert to list
     result = [
         {
-            "supplier": supplier,
-            "in_warehouse": data["in_warehouse"],
-            "out_warehouse": data["out_warehouse"],
-            "total": data["total"]
+            "supplier": row["_id"],
+            "in_warehouse": row["in_warehouse"],
+            "out_warehouse": row["out_warehouse"],
+            "total": row["total"]
         }
-        for supplier, data in breakdown.items()
+        async for row in db.transactions.aggregate(pipeline)
     ]
     
     return {
@@ -2213,13 +5221,14 @@ async def create_inventory(input: InventoryInput, user: User = Depends(get_curre
         total_value=total_value,
         project_id=input.project_id,
         transaction_id=input.transaction_id or "",
-        status=input.status
+        status=input.status,
+        reorder_level=input.reorder_level
     )
     
     inv_dict = inventory.model_dump()
-    inv_dict["created_at"] = inv_dict["created_at"].isoformat()
-    inv_dict["updated_at"] = inv_dict["updated_at"].isoformat()
     await db.inventory.insert_one(inv_dict)
+    await invalidate_item_name_index()
+    await record_inventory_events([inventory_event(inv_dict, "opening", after=inv_dict, user_id=user.id, unit_price=inv_dict["unit_price"])])
     
     return {"message": "Inventory item created", "id": inventory.id}
 
@@ -2240,6 +5249,8 @@ async def update_inventory(inventory_id: str, input: InventoryUpdateInput, user:
         updates["unit_price"] = input.unit_price
     if input.status is not None:
         updates["status"] = input.status
+    if input.reorder_level is not None:
+        updates["reorder_level"] = input.reorder_level
     
     # Recalculate total_value if quantity or unit_price changed
     if "quantity" in updates or "unit_price" in updates:
@@ -2247,131 +5258,82 @@ async def update_inventory(inventory_id: str, input: InventoryUpdateInput, user:
         unit_price = updates.get("unit_price", existing["unit_price"])
         updates["total_value"] = quantity * unit_price
     
-    updates["updated_at"] = now_wib().isoformat()
+    updates["updated_at"] = now_wib()
     
     await db.inventory.update_one({"id": inventory_id}, {"$set": updates})
+    if "item_name" in updates:
+        await invalidate_item_name_index()
+    if "quantity" in updates:
+        await record_inventory_events([inventory_event(
+            {**existing, **updates}, "adjustment",
+            before={"quantity": existing.get("quantity")}, after={"quantity": updates["quantity"]}, user_id=user.id
+        )])
+    if "reorder_level" in updates:
+        await check_low_stock([inventory_id])
     
     return {"message": "Inventory item updated"}
 
 @api_router.delete("/inventory/{inventory_id}")
 async def delete_inventory(inventory_id: str, user: User = Depends(get_current_user)):
+    await record_inventory_removal({"id": inventory_id}, user_id=user.id)
     result = await db.inventory.delete_one({"id": inventory_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Inventory item not found")
+    await invalidate_item_name_index()
     return {"message": "Inventory item deleted"}
 
 # ============= WAREHOUSE TRANSACTION ENDPOINTS =============
 
 @api_router.post("/inventory/warehouse-transaction")
 async def create_warehouse_transaction(input: WarehouseTransactionInput, user: User = Depends(get_current_user)):
-    """Create warehouse transaction for production usage"""
-    # Get inventory item
-    inventory = await db.inventory.find_one({"id": input.inventory_id}, {"_id": 0})
-    if not inventory:
-        raise HTTPException(status_code=404, detail="Inventory item not found")
-    
-    # Check if enough stock in warehouse
-    if inventory.get("quantity_in_warehouse", 0) < input.quantity:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Stok tidak cukup. Tersedia: {inventory.get('quantity_in_warehouse', 0)}, Diminta: {input.quantity}"
-        )
-    
-    # Get project name
+    """Create warehouse transaction for production usage (a one-line requisition, guarded the same way)"""
     project = await db.projects.find_one({"id": input.project_id}, {"_id": 0, "name": 1})
     project_name = project.get("name") if project else "Unknown Project"
-    
-    # Create warehouse transaction record
-    warehouse_trans = WarehouseTransaction(
-        inventory_id=input.inventory_id,
-        item_name=inventory["item_name"],
-        quantity=input.quantity,
-        unit=inventory["unit"],
+
+    withdrawal = WarehouseWithdrawalInput(
         project_id=input.project_id,
-        project_name=project_name,
-        usage_type=input.usage_type,
+        items=[WarehouseWithdrawalLine(inventory_id=input.inventory_id, quantity=input.quantity)],
         notes=input.notes,
-        created_by=user.id
+        usage_type=input.usage_type
     )
+    ids = await book_warehouse_withdrawal(withdrawal, project_name, user)
+    await check_low_stock([input.inventory_id])
     
-    trans_dict = warehouse_trans.model_dump()
-    trans_dict["created_at"] = trans_dict["created_at"].isoformat()
-    await db.warehouse_transactions.insert_one(trans_dict)
-    
-    # Update inventory - reduce quantity in warehouse
-    new_qty_in_warehouse = inventory.get("quantity_in_warehouse", 0) - input.quantity
-    new_total_qty = new_qty_in_warehouse + inventory.get("quantity_out_warehouse", 0)
-    
-    await db.inventory.update_one(
-        {"id": input.inventory_id},
-        {"$set": {
-            "quantity_in_warehouse": new_qty_in_warehouse,
-            "quantity": new_total_qty,
-            "updated_at": now_wib().isoformat()
-        }}
-    )
-    
-    return {"message": "Warehouse transaction created", "id": warehouse_trans.id}
+    return {"message": "Warehouse transaction created", "id": ids[0]}
 
-@api_router.get("/inventory/usage-report")
-async def get_inventory_usage_report(
-    project_id: Optional[str] = None,
-    category: Optional[str] = None,
-    user: User = Depends(get_current_user)
-):
-    """Get inventory usage report by project"""
-    query = {}
-    if project_id:
-        query["project_id"] = project_id
-    
-    # Get all warehouse transactions
-    transactions = await db.warehouse_transactions.find(query, {"_id": 0}).to_list(10000)
+@api_router.post("/inventory/warehouse-transaction/batch")
+async def create_warehouse_withdrawal(input: WarehouseWithdrawalInput, user: User = Depends(get_current_user)):
+    """
+    Withdraw several materials for one project in a single requisition
+    - All lines succeed or none do (atomic on replica sets via a Mongo transaction)
+    """
+    if not input.items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(input.items) > MAX_WAREHOUSE_WITHDRAWAL_LINES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_WAREHOUSE_WITHDRAWAL_LINES} items per withdrawal")
+    if any(line.quantity <= 0 for line in input.items):
+        raise HTTPException(status_code=400, detail="Quantity must be greater than 0")
     
-    # Group by project and item
-    report = {}
-    for trans in transactions:
-        proj_id = trans["project_id"]
-        proj_name = trans["project_name"]
-        item_name = trans["item_name"]
-        
-        if proj_id not in report:
-            report[proj_id] = {
-                "project_id": proj_id,
-                "project_name": proj_name,
-                "items": {}
-            }
-        
-        if item_name not in report[proj_id]["items"]:
-            report[proj_id]["items"][item_name] = {
-                "item_name": item_name,
-                "total_quantity": 0,
-                "unit": trans["unit"],
-                "usage_type": trans["usage_type"],
-                "transactions": []
-            }
-        
-        report[proj_id]["items"][item_name]["total_quantity"] += trans["quantity"]
-        report[proj_id]["items"][item_name]["transactions"].append({
-            "quantity": trans["quantity"],
-            "notes": trans.get("notes"),
-            "created_at": trans["created_at"]
-        })
+    project = await db.projects.find_one({"id": input.project_id}, {"_id": 0, "name": 1})
+    project_name = project.get("name") if project else "Unknown Project"
     
-    # Convert to list format
-    result = []
-    for proj_id, proj_data in report.items():
-        result.append({
-            "project_id": proj_data["project_id"],
-            "project_name": proj_data["project_name"],
-            "items": list(proj_data["items"].values())
-        })
+    ids = await book_warehouse_withdrawal(input, project_name, user)
+    await check_low_stock([line.inventory_id for line in input.items])
     
-    return result
+    return {"message": f"{len(ids)} warehouse transactions created", "ids": ids}
 
 # ============= FINANCIAL ENDPOINTS =============
 
 @api_router.get("/financial/summary")
-async def get_financial_summary(user: User = Depends(get_current_user)):
+async def get_financial_summary(request: Request, user: User = Depends(get_current_user)):
+    etag, not_modified = await conditional_etag(request, ["transactions", "projects"])
+    if not_modified:
+        return not_modified
+    return etag_response(await compute_financial_summary(etag), etag)
+
+@response_cache.cached("financial_summary", tags=["transactions", "projects"])
+async def compute_financial_summary(etag: str) -> Dict[str, Any]:
+    """Company-wide totals; etag keys the cache to the collection versions it was computed under"""
     # Get all transactions
     all_transactions = await db.transactions.find({}, {"_id": 0}).to_list(10000)
     
@@ -2435,14 +5397,13 @@ async def get_monthly_financial(user: User = Depends(get_current_user)):
     # Get transactions for last 6 months
     six_months_ago = now_wib() - timedelta(days=180)
     transactions = await db.transactions.find({
-        "transaction_date": {"$gte": six_months_ago.isoformat()}
+        "transaction_date": {"$gte": six_months_ago}
     }, {"_id": 0}).to_list(10000)
     
     # Group by month
     monthly_data = {}
     for trans in transactions:
-        trans_date = datetime.fromisoformat(trans['transaction_date']) if isinstance(trans['transaction_date'], str) else trans['transaction_date']
-        month_key = trans_date.strftime('%Y-%m')
+        month_key = trans['transaction_date'].strftime('%Y-%m')
         
         if month_key not in monthly_data:
             monthly_data[month_key] = {
@@ -2575,8 +5536,8 @@ async def create_schedule_item(input: TimeScheduleInput, user: User = Depends(ge
     )
     
     item_dict = item.model_dump()
-    item_dict["created_at"] = item_dict["created_at"].isoformat()
     await db.schedule_items.insert_one(item_dict)
+    await bump_collection_versions("schedule_items")
     
     return {"message": "Schedule item created", "id": item.id}
 
@@ -2599,7 +5560,7 @@ async def create_task(input: TaskInput, user: User = Depends(get_current_user)):
     if input.duration_days:
         due_date = start_date + timedelta(days=input.duration_days)
     elif input.due_date:
-        due_date = datetime.fromisoformat(input.due_date)
+        due_date = as_wib_datetime(input.due_date)
     
     task = Task(
         project_id=input.project_id,
@@ -2615,10 +5576,6 @@ async def create_task(input: TaskInput, user: User = Depends(get_current_user)):
     )
     
     task_dict = task.model_dump()
-    task_dict["created_at"] = task_dict["created_at"].isoformat()
-    task_dict["start_date"] = task_dict["start_date"].isoformat()
-    if task_dict.get("due_date"):
-        task_dict["due_date"] = task_dict["due_date"].isoformat()
     await db.tasks.insert_one(task_dict)
     
     # Notify assigned employee if assigned_to is provided
@@ -2630,7 +5587,6 @@ async def create_task(input: TaskInput, user: User = Depends(get_current_user)):
             type="info"
         )
         notif_dict = notif.model_dump()
-        notif_dict["created_at"] = notif_dict["created_at"].isoformat()
         await db.notifications.insert_one(notif_dict)
     
     return {"message": "Task created", "id": task.id}
@@ -2644,9 +5600,9 @@ async def get_tasks(assigned_to: Optional[str] = None, user: User = Depends(get_
 @api_router.patch("/tasks/{task_id}")
 async def update_task(task_id: str, updates: dict, user: User = Depends(get_current_user)):
     if updates.get('status') == 'completed' and 'completed_at' not in updates:
-        updates['completed_at'] = now_wib().isoformat()
+        updates['completed_at'] = now_wib()
     
-    result = await db.tasks.update_one({"id": task_id}, {"$set": updates})
+    result = await db.tasks.update_one({"id": task_id}, {"$set": coerce_timestamps(updates, "tasks")})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"message": "Task updated"}
@@ -2656,7 +5612,7 @@ async def update_task_status(task_id: str, data: dict, user: User = Depends(get_
     """Update task status"""
     updates = {"status": data.get("status")}
     if data.get("status") == "completed":
-        updates["completed_at"] = now_wib().isoformat()
+        updates["completed_at"] = now_wib()
     
     result = await db.tasks.update_one({"id": task_id}, {"$set": updates})
     if result.matched_count == 0:
@@ -2682,7 +5638,6 @@ async def create_work_report(task_id: str, input: WorkReportInput, user: User =
     )
     
     report_dict = report.model_dump()
-    report_dict["created_at"] = report_dict["created_at"].isoformat()
     await db.work_reports.insert_one(report_dict)
     
     # Update task progress
@@ -2765,7 +5720,6 @@ async def create_member(input: RegisterInput, user: User = Depends(get_current_u
     )
     
     user_dict = new_user.model_dump(by_alias=False)
-    user_dict["created_at"] = user_dict["created_at"].isoformat()
     await db.users.insert_one(user_dict)
     
     return {"message": "User created successfully", "id": new_user.id}
@@ -2874,6 +5828,250 @@ async def bulk_update_members(data: dict, user: User = Depends(get_current_user)
     
     return {"message": f"{result.modified_count} users updated successfully", "modified_count": result.modified_count}
 
+# ============= SLOW QUERY LOG HELPERS =============
+
+# Commands at or above this many milliseconds are logged and aggregated per shape (0 disables)
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "100"))
+# Run explain (queryPlanner) once for each new shape
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+# The recorder's own writes must not feed back into the log
+SLOW_QUERY_IGNORED_COLLECTIONS = {"slow_queries"}
+SLOW_QUERY_EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session/transaction fields that explain rejects or that belong to the original call only
+SLOW_QUERY_EXPLAIN_DROP_FIELDS = {
+    "lsid", "$db", "$clusterTime", "txnNumber", "autocommit", "startTransaction",
+    "$readPreference", "readConcern", "writeConcern"
+}
+
+# Explain output echoes the command's literal values (session tokens, emails, ...) in these fields
+SLOW_QUERY_EXPLAIN_DROP_KEYS = {"command", "originalCommand"}
+SLOW_QUERY_EXPLAIN_LITERAL_KEYS = {"parsedQuery", "filter", "indexBounds", "query", "q", "$match"}
+
+_slow_query_queue: Optional[asyncio.Queue] = None
+_slow_query_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def query_shape(value: Any) -> Any:
+    """Replace literal values with "?" so queries differing only in values share a shape"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    if isinstance(value, (re.Pattern, Regex)):
+        return "/?/"
+    return "?"
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Any:
+    """Filter/pipeline structure of a command, without values"""
+    if command_name == "find":
+        return {"filter": query_shape(command.get("filter", {})), "sort": dict(command.get("sort") or {})}
+    if command_name == "aggregate":
+        stages = []
+        for stage in command.get("pipeline", []):
+            name = next(iter(stage), "?")
+            stages.append({name: query_shape(stage[name]) if name == "$match" else "..."})
+        return {"pipeline": stages}
+    if command_name in ("count", "distinct"):
+        return {"query": query_shape(command.get("query", {})), "key": command.get("key")}
+    if command_name == "findAndModify":
+        return {"query": query_shape(command.get("query", {}))}
+    if command_name == "update":
+        return {"q": query_shape((command.get("updates") or [{}])[0].get("q", {}))}
+    if command_name == "delete":
+        return {"q": query_shape((command.get("deletes") or [{}])[0].get("q", {}))}
+    return {}
+
+def log_slow_query(command_name: str, collection: str, command: Dict[str, Any], database_name: str, seconds: float, route: str):
+    """
+    Called from the command listener (on Motor's executor threads)
+    - Logs right away and hands the record to slow_query_recorder_loop on the event loop
+    """
+    shape = command_shape(command_name, command)
+    shape_json = json_util.dumps(shape, sort_keys=True)
+    duration_ms = round(seconds * 1000, 2)
+    logger.warning(f"Slow Mongo {command_name} on {collection} ({duration_ms} ms) in {route}: {shape_json}")
+
+    if _slow_query_loop is None or _slow_query_queue is None:
+        return
+    record = {
+        "shape_id": hashlib.sha1(f"{command_name}|{collection}|{shape_json}".encode()).hexdigest(),
+        "command": command_name,
+        "collection": collection,
+        "shape": shape_json,
+        "duration_ms": duration_ms,
+        "route": route,
+        "database": database_name,
+        "explain_command": (
+            {key: value for key, value in command.items() if key not in SLOW_QUERY_EXPLAIN_DROP_FIELDS}
+            if SLOW_QUERY_EXPLAIN and command_name in SLOW_QUERY_EXPLAINABLE else None
+        )
+    }
+
+    def enqueue():
+        # Under a burst of slow queries, keep the log line and drop the aggregate update
+        if not _slow_query_queue.full():
+            _slow_query_queue.put_nowait(record)
+
+    _slow_query_loop.call_soon_threadsafe(enqueue)
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Winning plan stages and indexes, the part worth reading in a ranked report"""
+    planner = explain.get("queryPlanner") or {}
+    if not planner:
+        # Aggregations nest the planner under their $cursor stage
+        for stage in explain.get("stages", []):
+            planner = (stage.get("$cursor") or {}).get("queryPlanner") or {}
+            if planner:
+                break
+    stages = []
+    indexes = []
+    plan = planner.get("winningPlan") or {}
+    while plan:
+        plan = plan.get("queryPlan", plan)
+        stages.append(plan.get("stage"))
+        if plan.get("indexName"):
+            indexes.append(plan["indexName"])
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return {"stages": stages, "indexes": indexes, "collscan": "COLLSCAN" in stages}
+
+def redact_explain(value: Any, key: Optional[str] = None) -> Any:
+    """
+    Explain output with every literal from the original command replaced by "?"
+    - The echoed command is dropped; filters, parsed queries and index bounds keep only their shape
+    - Aggregation stages other than the $cursor one are reduced to their name
+    """
+    if key in SLOW_QUERY_EXPLAIN_LITERAL_KEYS:
+        return query_shape(value)
+    if isinstance(value, dict):
+        return {
+            item_key: redact_explain(item, item_key)
+            for item_key, item in value.items()
+            if item_key not in SLOW_QUERY_EXPLAIN_DROP_KEYS
+        }
+    if isinstance(value, list):
+        if key == "stages":
+            return [
+                redact_explain(stage) if "$cursor" in stage else {name: "..." for name in stage}
+                for stage in value if isinstance(stage, dict)
+            ]
+        return [redact_explain(item) for item in value]
+    return value
+
+async def record_slow_query(record: Dict[str, Any]):
+    """Fold one slow command into its shape's aggregate; explain the shape the first time it's seen"""
+    now = now_wib()
+    result = await db.slow_queries.update_one(
+        {"id": record["shape_id"]},
+        {
+            "$inc": {"count": 1, "total_ms": record["duration_ms"]},
+            "$max": {"max_ms": record["duration_ms"]},
+            "$set": {"last_seen": now, "last_route": record["route"]},
+            "$addToSet": {"routes": record["route"]},
+            "$setOnInsert": {
+                "command": record["command"],
+                "collection": record["collection"],
+                "shape": record["shape"],
+                "first_seen": now
+            }
+        },
+        upsert=True
+    )
+    if result.upserted_id is None or not record["explain_command"]:
+        return
+    try:
+        explain = await client[record["database"]].command(
+            {"explain": record["explain_command"], "verbosity": "queryPlanner"}
+        )
+        await db.slow_queries.update_one({"id": record["shape_id"]}, {"$set": {
+            "explain_summary": summarize_explain(explain),
+            "explain": json_util.dumps(redact_explain(explain))
+        }})
+    except Exception as e:
+        logger.error(f"Explain failed for slow {record['command']} on {record['collection']}: {str(e)}")
+
+async def slow_query_recorder_loop():
+    """Drain slow-query records from the command listener into slow_queries"""
+    global _slow_query_queue, _slow_query_loop
+    _slow_query_queue = asyncio.Queue(maxsize=1000)
+    _slow_query_loop = asyncio.get_running_loop()
+    while True:
+        record = await _slow_query_queue.get()
+        try:
+            await record_slow_query(record)
+        except Exception as e:
+            logger.error(f"Recording slow query failed: {str(e)}")
+
+# ============= SLOW QUERY ENDPOINTS =============
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    sort: str = "total",
+    limit: int = 20,
+    collection: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Slow Mongo query shapes, worst first
+    - sort: total (count x duration), max, avg or count
+    - Each shape lists the routes that issued it and, when explained, its winning plan
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    sort_fields = {"total": "total_ms", "max": "max_ms", "avg": "avg_ms", "count": "count"}
+    if sort not in sort_fields:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(sort_fields)}")
+
+    match = {"collection": collection} if collection else {}
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "explain": 0}},
+        {"$addFields": {"avg_ms": {"$divide": ["$total_ms", "$count"]}}},
+        {"$sort": {sort_fields[sort]: -1}},
+        {"$limit": max(1, min(limit, 200))}
+    ]
+    shapes = await db.slow_queries.aggregate(pipeline).to_list(None)
+    for shape in shapes:
+        shape["avg_ms"] = round(shape["avg_ms"], 2)
+    return {"threshold_ms": SLOW_QUERY_THRESHOLD_MS, "shapes": shapes}
+
+@api_router.get("/admin/slow-queries/{shape_id}")
+async def get_slow_query(shape_id: str, user: User = Depends(get_current_user)):
+    """One slow query shape with its full explain output"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    shape = await db.slow_queries.find_one({"id": shape_id}, {"_id": 0})
+    if not shape:
+        raise HTTPException(status_code=404, detail="Slow query shape not found")
+    if shape.get("explain"):
+        shape["explain"] = json.loads(shape["explain"])
+    return shape
+
+@api_router.delete("/admin/slow-queries")
+async def clear_slow_queries(user: User = Depends(get_current_user)):
+    """Reset the slow-query report (e.g. after adding an index)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    result = await db.slow_queries.delete_many({})
+    return {"message": "Slow query log cleared", "deleted": result.deleted_count}
+
+# ============= CACHE ADMIN ENDPOINTS =============
+
+@api_router.get("/admin/cache")
+async def get_cache_stats(user: User = Depends(get_current_user)):
+    """Read-through cache backend, size and hit/miss counters per namespace (this worker)"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    return await response_cache.snapshot()
+
+@api_router.delete("/admin/cache")
+async def clear_cache(namespace: Optional[str] = None, user: User = Depends(get_current_user)):
+    """Drop cached entries, optionally only one namespace"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    cleared = await response_cache.clear(namespace)
+    return {"message": "Cache cleared", "cleared": cleared}
+
 # ============= BACKUP & RESTORE ENDPOINTS =============
 
 @api_router.post("/admin/backup")
@@ -2895,7 +6093,7 @@ async def create_backup(user: User = Depends(get_current_user)):
         # Create backup document
         backup_doc = {
             "id": str(uuid.uuid4()),
-            "timestamp": now_wib().isoformat(),
+            "timestamp": now_wib(),
             "created_by": user.email,
             "data": backup_data,
             "collections_count": {name: len(backup_data[name]) for name in collections_to_backup}
@@ -2956,6 +6154,21 @@ async def restore_backup(backup_id: str, user: User = Depends(get_current_user))
                     await collection.insert_many(data)
                 restored_count[collection_name] = len(data)
         
+        # Backups taken before timestamps were BSON dates still hold ISO strings
+        await migrate_timestamps_to_dates(collections_to_restore)
+        
+        # Rebuild materialized collections derived from transactions
+        await rebuild_supplier_price_history()
+        await invalidate_item_name_index()
+        
+        # Restored quantities don't follow from the old ledger, so open a new one
+        await db.inventory_events.delete_many({})
+        await db.inventory_snapshots.delete_many({})
+        await db.inventory_valuations.delete_many({})
+        await db.inventory_valuation_layers.delete_many({})
+        await backfill_inventory_ledger()
+        await bump_collection_versions(*collections_to_restore)
+        
         # Don't restore users to prevent locking out current admin
         # But track the count
         restored_count['users'] = f"Skipped (current users preserved)"
@@ -2995,12 +6208,14 @@ async def clear_all_data(user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Access denied. Admin only.")
     
     try:
-        collections_to_clear = ['projects', 'transactions', 'inventory', 'rabs', 'rab_items', 'schedules', 'tasks']
+        collections_to_clear = ['projects', 'transactions', 'inventory', 'rabs', 'rab_items', 'schedules', 'tasks', 'supplier_price_history', 'suppliers', 'inventory_events', 'inventory_snapshots', 'inventory_valuations', 'inventory_valuation_layers']
         
         deleted_count = {}
         for collection_name in collections_to_clear:
             result = await db[collection_name].delete_many({})
             deleted_count[collection_name] = result.deleted_count
+        await invalidate_item_name_index()
+        await bump_collection_versions(*collections_to_clear)
         
         return {
             "message": "All data cleared successfully",
@@ -3019,11 +6234,6 @@ async def get_project_comments(project_id: str, user: User = Depends(get_current
         {"_id": 0}
     ).sort("created_at", 1).to_list(1000)
     
-    # Convert datetime to ISO string if needed
-    for comment in comments:
-        if comment.get("created_at") and not isinstance(comment["created_at"], str):
-            comment["created_at"] = comment["created_at"].isoformat()
-    
     return comments
 
 @api_router.post("/projects/{project_id}/comments")
@@ -3105,7 +6315,6 @@ async def create_project_comment(
     )
     
     comment_dict = comment.model_dump()
-    comment_dict["created_at"] = comment_dict["created_at"].isoformat()
     
     # Insert to database
     insert_dict = comment_dict.copy()
@@ -3124,7 +6333,6 @@ async def create_project_comment(
                 type="info"
             )
             notif_dict = notif.model_dump()
-            notif_dict["created_at"] = notif_dict["created_at"].isoformat()
             
             # Insert notification
             insert_notif = notif_dict.copy()
@@ -3194,12 +6402,6 @@ async def get_project_tasks(project_id: str, user: User = Depends(get_current_us
         {"_id": 0}
     ).sort("created_at", 1).to_list(1000)
     
-    for task in tasks:
-        if task.get("created_at") and not isinstance(task["created_at"], str):
-            task["created_at"] = task["created_at"].isoformat()
-        if task.get("completed_at") and not isinstance(task["completed_at"], str):
-            task["completed_at"] = task["completed_at"].isoformat()
-    
     return tasks
 
 @api_router.post("/projects/{project_id}/tasks")
@@ -3219,9 +6421,6 @@ async def create_project_task(
     )
     
     task_dict = task.model_dump()
-    task_dict["created_at"] = task_dict["created_at"].isoformat()
-    if task_dict.get("completed_at"):
-        task_dict["completed_at"] = task_dict["completed_at"].isoformat()
     
     insert_dict = task_dict.copy()
     await db.tasks.insert_one(insert_dict)
@@ -3246,7 +6445,7 @@ async def update_project_task(
     if completed is not None:
         update_data["completed"] = completed
         if completed:
-            update_data["completed_at"] = now_wib().isoformat()
+            update_data["completed_at"] = now_wib()
         else:
             update_data["completed_at"] = None
     
@@ -3276,9 +6475,378 @@ async def delete_project_task(
     await db.tasks.delete_one({"id": task_id})
     return {"message": "Task deleted"}
 
+# ============= REQUEST PROFILER =============
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", ROOT_DIR / "profiles"))
+PROFILE_MAX_COUNT = int(os.environ.get("PROFILE_MAX_COUNT", "200"))
+# Workers pick up toggles from other workers within this many seconds
+PROFILER_SETTINGS_TTL_SECONDS = 5
+PROFILER_SETTINGS_ID = "request_profiler"
+
+_profiler_settings = {"value": None, "loaded_at": 0.0}
+# Strong references to in-flight profile writes, the event loop only keeps weak ones
+_profile_save_tasks: set = set()
+
+async def get_profiler_settings() -> Optional[Dict[str, Any]]:
+    """Active profiler settings shared through Mongo, or None when profiling is off or expired"""
+    if time.monotonic() - _profiler_settings["loaded_at"] >= PROFILER_SETTINGS_TTL_SECONDS:
+        _profiler_settings["value"] = await db.profiler_settings.find_one({"id": PROFILER_SETTINGS_ID}, {"_id": 0})
+        _profiler_settings["loaded_at"] = time.monotonic()
+    settings = _profiler_settings["value"]
+    if not settings or not settings.get("enabled"):
+        return None
+    if settings.get("expires_at") and as_wib_datetime(settings["expires_at"]) <= now_wib():
+        return None
+    return settings
+
+def match_route_template(scope) -> Optional[str]:
+    """Route template for a request that hasn't been routed yet"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+def profile_route(scope, settings: Dict[str, Any]) -> Optional[str]:
+    """Route template to profile this request under, or None to run it unprofiled"""
+    route = match_route_template(scope)
+    if not route or route.startswith("/api/admin/profil"):
+        return None
+    selected = settings.get("routes") or []
+    if selected and route not in selected and f"{scope['method']} {route}" not in selected:
+        return None
+    if random.random() >= settings.get("sample_rate", 1.0):
+        return None
+    return route
+
+def profile_slug(route: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", route).strip("-") or "root"
+
+async def save_request_profile(profiler: Profiler, record: Dict[str, Any]):
+    """Render a finished profile to speedscope JSON and HTML on disk, then index it"""
+    stem = f"{record['created_at'].strftime('%Y%m%d-%H%M%S')}_{record['method']}_{profile_slug(record['route'])}_{record['id'][:8]}"
+
+    def write_files():
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        (PROFILE_DIR / f"{stem}.speedscope.json").write_text(profiler.output(SpeedscopeRenderer()))
+        (PROFILE_DIR / f"{stem}.html").write_text(profiler.output(HTMLRenderer()))
+
+    try:
+        await asyncio.to_thread(write_files)
+        record["files"] = {"speedscope": f"{stem}.speedscope.json", "html": f"{stem}.html"}
+        await db.request_profiles.insert_one(record)
+        await prune_request_profiles()
+    except Exception as e:
+        logger.error(f"Saving profile for {record['route']} failed: {str(e)}")
+
+async def delete_request_profiles(profiles: List[Dict[str, Any]]):
+    """Remove profile files and their index entries"""
+    for profile in profiles:
+        for filename in (profile.get("files") or {}).values():
+            (PROFILE_DIR / filename).unlink(missing_ok=True)
+    await db.request_profiles.delete_many({"id": {"$in": [profile["id"] for profile in profiles]}})
+
+async def prune_request_profiles():
+    """Keep only the newest PROFILE_MAX_COUNT profiles"""
+    stale = await db.request_profiles.find({}, {"_id": 0, "id": 1, "files": 1}).sort("created_at", -1).skip(PROFILE_MAX_COUNT).to_list(None)
+    if stale:
+        await delete_request_profiles(stale)
+
+class RequestProfilerMiddleware:
+    """
+    Samples the Python stack of selected requests while the admin profiler toggle is on
+    - pyinstrument in async mode: time a handler spends awaiting shows as <await>, other requests' work is excluded
+    - Sits innermost, so the profile covers routing, dependencies and the handler
+    - Profiles are written after the response went out
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            settings = await get_profiler_settings()
+        except Exception:
+            logger.exception("Profiler settings unavailable, serving request unprofiled")
+            _profiler_settings["value"] = None
+            _profiler_settings["loaded_at"] = time.monotonic()
+            settings = None
+        route = profile_route(scope, settings) if settings else None
+        if not route:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def status_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = Profiler(interval=settings.get("interval_ms", 1.0) / 1000, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, status_send)
+        finally:
+            profiler.stop()
+            task = asyncio.create_task(save_request_profile(profiler, {
+                "id": str(uuid.uuid4()),
+                "route": route,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "created_at": now_wib()
+            }))
+            _profile_save_tasks.add(task)
+            task.add_done_callback(_profile_save_tasks.discard)
+
+# ============= REQUEST PROFILER ENDPOINTS =============
+
+@api_router.get("/admin/profiler")
+async def get_profiler(user: User = Depends(get_current_user)):
+    """Current profiler toggle and how many profiles are stored"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    settings = await db.profiler_settings.find_one({"id": PROFILER_SETTINGS_ID}, {"_id": 0}) or {"enabled": False}
+    return {**settings, "active": await get_profiler_settings() is not None, "stored_profiles": await db.request_profiles.count_documents({})}
+
+@api_router.put("/admin/profiler")
+async def update_profiler(input: ProfilerSettingsInput, user: User = Depends(get_current_user)):
+    """
+    Turn request profiling on/off for all workers
+    - routes: profile only these route templates (e.g. "POST /api/transactions"); empty = every route
+    - sample_rate: fraction of matching requests profiled
+    """
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    known = {getattr(route, "path", None) for route in app.router.routes}
+    unknown = [entry for entry in input.routes if entry.split(" ")[-1] not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown routes: {', '.join(unknown)}")
+
+    settings = {
+        "id": PROFILER_SETTINGS_ID,
+        "enabled": input.enabled,
+        "routes": input.routes,
+        "sample_rate": input.sample_rate,
+        "interval_ms": input.interval_ms,
+        "expires_at": now_wib() + timedelta(minutes=input.duration_minutes) if input.enabled and input.duration_minutes else None,
+        "updated_by": user.email,
+        "updated_at": now_wib()
+    }
+    await db.profiler_settings.replace_one({"id": PROFILER_SETTINGS_ID}, settings, upsert=True)
+    # This worker applies it right away; the others within PROFILER_SETTINGS_TTL_SECONDS
+    _profiler_settings["loaded_at"] = 0.0
+    settings.pop("_id", None)
+    return {"message": "Profiler settings updated", **settings}
+
+@api_router.get("/admin/profiles")
+async def list_request_profiles(
+    route: Optional[str] = None,
+    limit: int = 50,
+    user: User = Depends(get_current_user)
+):
+    """Stored request profiles, newest first, optionally for one route template"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    query = {"route": route} if route else {}
+    return await db.request_profiles.find(query, {"_id": 0}).sort("created_at", -1).to_list(max(1, min(limit, PROFILE_MAX_COUNT)))
+
+@api_router.get("/admin/profiles/{profile_id}/download")
+async def download_request_profile(profile_id: str, format: str = "speedscope", user: User = Depends(get_current_user)):
+    """Download a profile: speedscope JSON (open in speedscope.app for a flamegraph) or pyinstrument HTML"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    filename = (profile.get("files") or {}).get(format)
+    if not filename:
+        raise HTTPException(status_code=400, detail="format must be speedscope or html")
+    file_path = PROFILE_DIR / filename
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    media_type = "application/json" if format == "speedscope" else "text/html"
+    return FileResponse(file_path, media_type=media_type, filename=filename)
+
+@api_router.delete("/admin/profiles/{profile_id}")
+async def delete_request_profile(profile_id: str, user: User = Depends(get_current_user)):
+    """Delete one stored profile"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin only.")
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    await delete_request_profiles([profile])
+    return {"message": "Profile deleted"}
+
+# ============= RESPONSE COMPRESSION =============
+
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1024"))
+# Media that is already compressed (or not worth it) goes out untouched
+COMPRESSION_SKIP_TYPES = (
+    "image/", "video/", "audio/", "application/pdf", "application/zip", "application/gzip",
+    "application/x-7z-compressed", "application/vnd.openxmlformats", "font/woff"
+)
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in ["br", "gzip"]:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+class StreamCompressor:
+    """Incremental gzip/brotli compressor that flushes after every chunk so streams stay live"""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=4)
+        else:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, negotiated via Accept-Encoding
+    - Bodies smaller than minimum_size are sent as they are
+    - Streaming responses are buffered up to minimum_size, then compressed chunk by chunk
+    - PDFs, images, spreadsheets and responses that already carry Content-Encoding are skipped
+    """
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        buffer = []
+        buffered = 0
+        compressor = None
+        passthrough = False
+
+        def compressed_start():
+            response_headers = [
+                (key, value) for key, value in start_message["headers"]
+                if key.lower() not in (b"content-length", b"content-encoding", b"vary")
+            ]
+            response_headers.append((b"content-encoding", encoding.encode()))
+            response_headers.append((b"vary", merge_vary(start_message["headers"], b"Accept-Encoding")))
+            return {**start_message, "headers": response_headers}
+
+        async def compressing_send(message):
+            nonlocal start_message, buffered, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1").lower()
+                if b"content-encoding" in response_headers or content_type.startswith(COMPRESSION_SKIP_TYPES):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor:
+                chunk = compressor.compress(body) if body else b""
+                if not more_body:
+                    chunk += compressor.finish()
+                if chunk or not more_body:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            buffer.append(body)
+            buffered += len(body)
+            if not more_body and buffered < self.minimum_size:
+                # Too small to be worth it: send the original response
+                await send(start_message)
+                await send({"type": "http.response.body", "body": b"".join(buffer), "more_body": False})
+                return
+            if more_body and buffered < self.minimum_size:
+                return
+
+            payload = b"".join(buffer)
+            buffer.clear()
+            start = compressed_start()
+            if not more_body:
+                compressed = brotli.compress(payload, quality=4) if encoding == "br" else gzip_compress(payload)
+                start["headers"].append((b"content-length", str(len(compressed)).encode()))
+                await send(start)
+                await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            compressor = StreamCompressor(encoding)
+            await send(start)
+            await send({"type": "http.response.body", "body": compressor.compress(payload), "more_body": True})
+
+        await self.app(scope, receive, compressing_send)
+
+def merge_vary(headers: List[Tuple[bytes, bytes]], field: bytes) -> bytes:
+    """Single Vary value holding the response's existing Vary fields plus field (unless already listed or *)"""
+    fields = [
+        token.strip() for key, value in headers if key.lower() == b"vary"
+        for token in value.split(b",") if token.strip()
+    ]
+    if not any(token == b"*" or token.lower() == field.lower() for token in fields):
+        fields.append(field)
+    return b", ".join(fields)
+
+def gzip_compress(data: bytes) -> bytes:
+    """One-shot gzip with the same settings as the streaming compressor"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+# Optional bearer token for scrapers; the session-based auth doesn't fit Prometheus
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus metrics for this deployment"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(RequestProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -3286,6 +6854,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -3293,6 +6863,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TIMESTAMP_MIGRATION_ID = "bson_dates"
+
+async def migrate_timestamps_to_dates(collection_names: Optional[List[str]] = None) -> int:
+    """
+    Rewrite ISO-string timestamps as BSON dates
+    - Without collection_names every collection is migrated once and the run is recorded
+    - With collection_names (e.g. after restoring an old backup) those are always checked
+    """
+    try:
+        full_run = collection_names is None
+        if full_run:
+            if await db.schema_migrations.find_one({"id": TIMESTAMP_MIGRATION_ID}, {"_id": 1}):
+                return 0
+            collection_names = [name for name in await db.list_collection_names() if not name.startswith("system.")]
+
+        converted = 0
+        touched = []
+        for name in collection_names:
+            before = converted
+            for field in timestamp_fields(name):
+                batch = []
+                async for doc in db[name].find({field: {"$type": "string"}}, {"_id": 1, field: 1}):
+                    try:
+                        value = as_wib_datetime(doc[field])
+                    except ValueError:
+                        continue
+                    batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: value}}))
+                    if len(batch) >= 1000:
+                        await db[name].bulk_write(batch, ordered=False)
+                        converted += len(batch)
+                        batch = []
+                if batch:
+                    await db[name].bulk_write(batch, ordered=False)
+                    converted += len(batch)
+            if converted > before:
+                touched.append(name)
+        if touched:
+            await bump_collection_versions(*touched)
+
+        if full_run:
+            await db.schema_migrations.insert_one({"id": TIMESTAMP_MIGRATION_ID, "converted": converted, "completed_at": now_wib()})
+        if converted:
+            logger.info(f"Converted {converted} string timestamps to BSON dates")
+        return converted
+    except Exception as e:
+        logger.error(f"Timestamp migration failed: {str(e)}")
+        return 0
+
+async def run_startup_backfills():
+    """Migrate timestamps first so the backfills below only ever see BSON dates"""
+    await migrate_timestamps_to_dates()
+    await backfill_supplier_price_history()
+    await backfill_warehouse_transaction_categories()
+    await backfill_inventory_ledger()
+
+async def ensure_indexes():
+    """Create the indexes the query paths above rely on (idempotent)"""
+    await db.rab_revisions.create_index([("rab_id", 1), ("revision", 1)], unique=True)
+    await db.rab_write_locks.create_index("rab_id", unique=True)
+    await ensure_unit_price_key_index()
+    await db.price_lists.create_index([("effective_date", -1), ("created_at", -1)])
+    await db.unit_price_versions.create_index([("price_list_id", 1), ("key", 1)])
+    await db.unit_price_versions.create_index([("price_list_id", 1), ("category", 1)])
+    await db.supplier_price_history.create_index([("item_name", 1), ("supplier", 1), ("date", -1)])
+    await db.supplier_price_history.create_index([("category", 1), ("project_type", 1), ("item_name", 1)])
+    await db.supplier_price_history.create_index("transaction_id")
+    await db.supplier_price_history.create_index([("supplier_key", 1), ("date", 1)])
+    await db.supplier_price_history.create_index("project_id")
+    await db.transactions.create_index([("project_id", 1), ("category", 1), ("items.description", 1)])
+    await db.warehouse_transactions.create_index([("project_id", 1), ("created_at", -1)])
+    await db.warehouse_transactions.create_index([("category", 1), ("created_at", -1)])
+    await db.warehouse_transactions.create_index("created_at")
+    await db.inventory_events.create_index([("inventory_id", 1), ("created_at", -1)])
+    await db.inventory_events.create_index("created_at")
+    await db.inventory_events.create_index([("project_id", 1), ("created_at", 1)])
+    await db.inventory_snapshots.create_index([("inventory_id", 1), ("as_of", -1)])
+    await db.inventory_snapshots.create_index("as_of")
+    await db.inventory_valuations.create_index("period", unique=True)
+    await db.inventory_valuation_layers.create_index([("period", 1), ("inventory_id", 1)], unique=True)
+    await db.suppliers.create_index("key", unique=True)
+    await db.suppliers.create_index([("purchase_count", -1), ("key", 1)])
+    await db.collection_versions.create_index("id", unique=True)
+    await db.slow_queries.create_index("id", unique=True)
+    await db.request_profiles.create_index([("created_at", -1)])
+    await db.request_profiles.create_index([("route", 1), ("created_at", -1)])
+    if CACHE_BACKEND == "mongo":
+        await db.cache_entries.create_index("id", unique=True)
+        await db.cache_entries.create_index("tags")
+        await db.cache_entries.create_index("expires_at", expireAfterSeconds=0)
+    # Expired sessions are removed by Mongo once expires_at is a BSON date
+    await db.user_sessions.create_index("expires_at", expireAfterSeconds=0)
+
+# Strong references to the startup backfills and background loops, cancelled on shutdown
+_background_tasks: set = set()
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+@app.on_event("startup")
+async def start_background_jobs():
+    await ensure_indexes()
+    # Range filters on dates skip string timestamps, so finish the one-time migration before serving
+    await migrate_timestamps_to_dates()
+    start_background_task(run_startup_backfills())
+    if INVENTORY_SNAPSHOT_INTERVAL_SECONDS > 0:
+        start_background_task(inventory_snapshot_loop())
+    if LOW_STOCK_THRESHOLD_INTERVAL_SECONDS > 0:
+        start_background_task(low_stock_threshold_loop())
+    if RAB_RECONCILE_INTERVAL_SECONDS > 0:
+        start_background_task(rab_totals_reconcile_loop())
+    if SLOW_QUERY_THRESHOLD_MS > 0:
+        start_background_task(slow_query_recorder_loop())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
     client.close()
\ No newline at end of file
@@ -0,0 +1,40 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "xonfinance_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """server.db swapped for an in-memory mongomock database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient(tz_aware=True, tzinfo=server.WIB)["xonfinance_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+@pytest.fixture
+def admin():
+    return server.User(id="admin-1", email="admin@example.com", name="Admin", role="admin")
+
+
+@pytest.fixture
+def client(db, admin):
+    """TestClient signed in as admin; startup jobs don't run"""
+    from fastapi.testclient import TestClient
+
+    server.app.dependency_overrides[server.get_current_user] = lambda: admin
+    yield TestClient(server.app)
+    server.app.dependency_overrides.pop(server.get_current_user, None)
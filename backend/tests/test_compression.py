@@ -0,0 +1,39 @@
+import zlib
+
+import brotli
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("GZIP", "gzip"),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("gzip;q=abc", None),
+    ("identity", None),
+    ("", None)
+])
+def test_negotiate_encoding(header, expected):
+    assert server.negotiate_encoding(header) == expected
+
+
+def test_merge_vary_adds_the_field_once():
+    assert server.merge_vary([], b"Accept-Encoding") == b"Accept-Encoding"
+    assert server.merge_vary([(b"vary", b"Origin")], b"Accept-Encoding") == b"Origin, Accept-Encoding"
+    assert server.merge_vary(
+        [(b"Vary", b"Origin"), (b"vary", b"accept-encoding, Cookie")], b"Accept-Encoding"
+    ) == b"Origin, accept-encoding, Cookie"
+    assert server.merge_vary([(b"vary", b"*")], b"Accept-Encoding") == b"*"
+
+
+def test_stream_compressor_round_trips():
+    chunks = [b"a" * 1000, b"b" * 500, b""]
+    for encoding, decompress in [("gzip", lambda data: zlib.decompress(data, 31)), ("br", brotli.decompress)]:
+        compressor = server.StreamCompressor(encoding)
+        data = b"".join(compressor.compress(chunk) for chunk in chunks) + compressor.finish()
+        assert decompress(data) == b"".join(chunks)
@@ -0,0 +1,35 @@
+import server
+
+
+def test_etag_matches():
+    etag = 'W/"abc"'
+    assert server.etag_matches('W/"abc"', etag)
+    assert server.etag_matches('"abc"', etag)
+    assert server.etag_matches('W/"old", W/"abc"', etag)
+    assert server.etag_matches("*", etag)
+    assert not server.etag_matches('W/"old"', etag)
+    assert not server.etag_matches(None, etag)
+
+
+def test_weak_etag_covers_versions_and_variant():
+    assert server.weak_etag("unit_prices:e:1", "struktur") == server.weak_etag("unit_prices:e:1", "struktur")
+    assert server.weak_etag("unit_prices:e:1", "struktur") != server.weak_etag("unit_prices:e:2", "struktur")
+    assert server.weak_etag("unit_prices:e:1", "struktur") != server.weak_etag("unit_prices:e:1", "dinding")
+
+
+def test_not_modified_until_a_write(client):
+    first = client.get("/api/unit-prices")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    cached = client.get("/api/unit-prices", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.content == b""
+
+    created = client.post("/api/unit-prices", params={"description": "Plesteran", "unit": "M2", "price": 65000, "category": "dinding"})
+    assert created.status_code == 200
+    changed = client.get("/api/unit-prices", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert [item["description"] for item in changed.json()] == ["Plesteran"]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+import server
+
+
+def event(inventory_id, quantity, unit_price, month, day=1):
+    return {
+        "inventory_id": inventory_id, "item_name": inventory_id, "category": "bahan", "project_id": "p1",
+        "quantity": quantity, "unit_price": unit_price,
+        "created_at": datetime(2025, month, day, 10, tzinfo=server.WIB)
+    }
+
+
+JANUARY = [
+    event("semen", 10, 100, 1, 5),
+    event("semen", 10, 120, 1, 20),
+    event("pasir", -5, None, 1, 10)
+]
+FEBRUARY = [
+    event("semen", -15, None, 2, 3),
+    event("semen", 5, 130, 2, 10),
+    event("pasir", 10, 100, 2, 12)
+]
+
+
+def by_item(items):
+    return {item["inventory_id"]: item for item in items}
+
+
+def ordered(events):
+    return sorted(events, key=lambda item: (item["inventory_id"], item["created_at"]))
+
+
+def test_fifo_resumes_across_a_month_boundary():
+    january, closing = server.compute_inventory_valuation(ordered(JANUARY), {})
+    assert by_item(january)["semen"]["fifo_value"] == 2200
+    assert closing["semen"]["layers"] == [[10.0, 100.0], [10.0, 120.0]]
+    assert closing["pasir"]["backorder"] == 5
+
+    february = by_item(server.compute_inventory_valuation(ordered(FEBRUARY), {}, closing)[0])
+    # 15 withdrawn from the January lots leaves 5 @ 120, plus the February lot of 5 @ 130
+    assert february["semen"]["quantity"] == 10
+    assert february["semen"]["fifo_value"] == 5 * 120 + 5 * 130
+    assert february["semen"]["purchased_quantity"] == 25
+    assert february["semen"]["average_value"] == pytest.approx(10 * (1000 + 1200 + 650) / 25, abs=0.01)
+    # The January backorder is settled from the first February lot
+    assert february["pasir"]["quantity"] == 5
+    assert february["pasir"]["fifo_value"] == 500
+
+    single_pass = by_item(server.compute_inventory_valuation(ordered(JANUARY + FEBRUARY), {})[0])
+    assert february == single_pass
+
+
+@pytest.mark.anyio
+async def test_closed_month_state_is_stored_and_resumed(db):
+    for index, item in enumerate(JANUARY + FEBRUARY):
+        await db.inventory_events.insert_one({**item, "id": f"event-{index}"})
+
+    february = await server.get_inventory_valuation("2025-02")
+    assert february["cached"] is False
+    assert {row["inventory_id"] for row in await db.inventory_valuation_layers.find({"period": "2025-01"}).to_list(None)} == {"semen", "pasir"}
+    assert await db.inventory_valuations.count_documents({"layers_stored": True}) == 2
+
+    single_pass = server.compute_inventory_valuation(ordered(JANUARY + FEBRUARY), {})[0]
+    assert by_item(february["items"]) == by_item(single_pass)
+    assert (await server.get_inventory_valuation("2025-02"))["cached"] is True
@@ -0,0 +1,78 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_rab(admin):
+    result = await server.create_rab(server.RABInput(project_name="Rumah Tinggal", project_type="interior"), user=admin)
+    return result["id"]
+
+
+def bulk_entry(item, **changes):
+    fields = {field: item[field] for field in ["id", "category", "item_number", "description", "unit", "volume", "unit_price", "is_category"]}
+    return server.RABItemBulkEntry(**{**fields, **changes})
+
+
+async def save_items(rab_id, admin, entries):
+    await server.bulk_upsert_rab_items(server.RABItemBulkInput(rab_id=rab_id, items=entries, replace=True), user=admin)
+    return await server.db.rab_items.find({"rab_id": rab_id}, {"_id": 0}).sort("item_number", 1).to_list(None)
+
+
+async def latest_revision(rab_id):
+    rab = await server.db.rabs.find_one({"id": rab_id}, {"_id": 0, "revision": 1})
+    return rab["revision"]
+
+
+async def test_revision_round_trip(db, admin):
+    rab_id = await create_rab(admin)
+    items = await save_items(rab_id, admin, [
+        server.RABItemBulkEntry(category="persiapan", item_number="A.1", description="Pembersihan lokasi", unit="LS", volume=1, unit_price=2500000),
+        server.RABItemBulkEntry(category="struktur", item_number="B.1", description="Pondasi batu kali", unit="M3", volume=4, unit_price=950000)
+    ])
+    after_insert = await latest_revision(rab_id)
+
+    items = await save_items(rab_id, admin, [bulk_entry(items[0], volume=2)])
+    after_update = await latest_revision(rab_id)
+
+    before = await server.load_rab_revision(rab_id, after_insert)
+    after = await server.load_rab_revision(rab_id, after_update)
+    assert {item["description"] for item in before["items"]} == {"Pembersihan lokasi", "Pondasi batu kali"}
+    assert before["rab"]["subtotal"] == 2500000 + 4 * 950000
+    assert [(item["id"], item["volume"]) for item in after["items"]] == [(items[0]["id"], 2)]
+    assert after["rab"]["subtotal"] == 5000000
+
+    revision_doc = await db.rab_revisions.find_one({"rab_id": rab_id, "revision": after_update}, {"_id": 0})
+    assert revision_doc["full"] is False
+    assert revision_doc["diff"]["changed"] == {items[0]["id"]: {"volume": 2, "total_price": 5000000}}
+
+
+async def test_snapshot_interval_rebuilds_the_same_state(db, admin, monkeypatch):
+    monkeypatch.setattr(server, "RAB_REVISION_SNAPSHOT_INTERVAL", 3)
+    rab_id = await create_rab(admin)
+    items = await save_items(rab_id, admin, [
+        server.RABItemBulkEntry(category="dinding", item_number="C.1", description="Plesteran", unit="M2", volume=10, unit_price=65000)
+    ])
+    for volume in range(11, 16):
+        items = await save_items(rab_id, admin, [bulk_entry(items[0], volume=volume)])
+
+    rebuilt = await server.load_rab_revision(rab_id, await latest_revision(rab_id))
+    assert rebuilt["items"][0]["volume"] == 15
+    assert await db.rab_revisions.count_documents({"rab_id": rab_id, "full": True}) > 1
+
+
+async def test_no_op_save_produces_an_empty_diff(db, admin):
+    rab_id = await create_rab(admin)
+    items = await save_items(rab_id, admin, [
+        server.RABItemBulkEntry(category="lantai", item_number="D.1", description="Keramik 60x60", unit="M2", volume=30, unit_price=185000)
+    ])
+    before = await latest_revision(rab_id)
+
+    unchanged = await save_items(rab_id, admin, [bulk_entry(item) for item in items])
+    after = await latest_revision(rab_id)
+
+    assert [item["id"] for item in unchanged] == [item["id"] for item in items]
+    assert after == before
+    diff = await server.diff_rab_revisions(rab_id, before, after, user=admin)
+    assert (diff["added"], diff["removed"], diff["changed"], diff["rab"]) == ([], [], [], {})
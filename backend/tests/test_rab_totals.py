@@ -0,0 +1,81 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_rab_item_line_total():
+    assert server.rab_item_line_total({"total_price": 150000}) == 150000.0
+    assert server.rab_item_line_total({"total_price": None}) == 0.0
+    assert server.rab_item_line_total({"total_price": 150000, "is_category": True}) == 0.0
+
+
+async def create_rab(admin, tax_percentage=11):
+    result = await server.create_rab(server.RABInput(project_name="Ruko", project_type="arsitektur"), user=admin)
+    await server.update_rab(result["id"], tax_percentage=tax_percentage, user=admin)
+    return result["id"]
+
+
+async def test_incremental_totals_match_reconcile(db, admin):
+    rab_id = await create_rab(admin)
+    created = []
+    for category, item_number, volume, unit_price in [
+        ("persiapan", "A.1", 1, 2500000),
+        ("dinding", "C.1", 40, 145000),
+        ("dinding", "C.2", 40, 65000)
+    ]:
+        result = await server.create_rab_item(server.RABItemInput(
+            rab_id=rab_id, category=category, item_number=item_number, description=item_number,
+            unit="M2", volume=volume, unit_price=unit_price, total_price=volume * unit_price
+        ), user=admin)
+        created.append(result["id"])
+    await server.create_rab_item(server.RABItemInput(
+        rab_id=rab_id, category="dinding", item_number="C", description="Dinding",
+        unit="", volume=0, unit_price=0, total_price=999, is_category=True
+    ), user=admin)
+
+    await server.update_rab_item(created[1], {"volume": 50}, user=admin)
+    await server.update_rab_item(created[2], {"category": "finishing"}, user=admin)
+    await server.delete_rab_item(created[0], user=admin)
+
+    rab = await db.rabs.find_one({"id": rab_id}, {"_id": 0})
+    subtotal = 50 * 145000 + 40 * 65000
+    assert rab["subtotal"] == pytest.approx(subtotal)
+    assert rab["tax_amount"] == pytest.approx(subtotal * 0.11)
+    assert rab["total_price"] == pytest.approx(subtotal * 1.11)
+    assert rab["category_totals"]["dinding"] == pytest.approx(50 * 145000)
+    assert rab["category_totals"]["finishing"] == pytest.approx(40 * 65000)
+
+    report = await server.reconcile_rab_totals([rab_id], fix=False)
+    assert report["mismatched"] == 0
+
+
+async def test_reconcile_rewrites_drifted_totals(db, admin):
+    rab_id = await create_rab(admin, tax_percentage=10)
+    await server.create_rab_item(server.RABItemInput(
+        rab_id=rab_id, category="lantai", item_number="D.1", description="Keramik 60x60",
+        unit="M2", volume=10, unit_price=185000, total_price=1850000
+    ), user=admin)
+    await db.rabs.update_one({"id": rab_id}, {"$inc": {"subtotal": 12345}})
+
+    report = await server.reconcile_rab_totals([rab_id])
+    assert report["mismatched"] == 1
+    rab = await db.rabs.find_one({"id": rab_id}, {"_id": 0})
+    assert rab["subtotal"] == pytest.approx(1850000)
+    assert rab["total_price"] == pytest.approx(1850000 * 1.1)
+    assert (await server.reconcile_rab_totals([rab_id], fix=False))["mismatched"] == 0
+
+
+async def test_tax_change_recomputes_tax_and_total(db, admin):
+    rab_id = await create_rab(admin, tax_percentage=0)
+    await server.create_rab_item(server.RABItemInput(
+        rab_id=rab_id, category="plafon", item_number="E.1", description="Gypsum board 9mm",
+        unit="M2", volume=20, unit_price=85000, total_price=1700000
+    ), user=admin)
+
+    await server.update_rab(rab_id, tax_percentage=11, user=admin)
+    rab = await db.rabs.find_one({"id": rab_id}, {"_id": 0})
+    assert rab["tax_percentage"] == 11
+    assert rab["tax_amount"] == pytest.approx(1700000 * 0.11)
+    assert rab["total_price"] == pytest.approx(1700000 * 1.11)
@@ -0,0 +1,48 @@
+import re
+
+from bson import Regex
+
+import server
+
+
+def test_query_shape_replaces_literals():
+    assert server.query_shape({"project_id": "p1", "amount": {"$gte": 100, "$lt": 500}}) == {
+        "project_id": "?", "amount": {"$gte": "?", "$lt": "?"}
+    }
+    assert server.query_shape({"id": {"$in": ["a", "b", "c"]}}) == {"id": {"$in": ["?"]}}
+    assert server.query_shape({"$or": [{"role": "admin"}, {"roles": {"$in": ["admin"]}}]}) == {
+        "$or": [{"role": "?"}, {"roles": {"$in": ["?"]}}]
+    }
+    assert server.query_shape({"key": {"$regex": "^sem"}}) == {"key": {"$regex": "?"}}
+    assert server.query_shape({"key": re.compile("^sem")}) == {"key": "/?/"}
+    assert server.query_shape({"key": Regex("^sem")}) == {"key": "/?/"}
+
+
+def test_queries_differing_only_in_values_share_a_shape():
+    first = server.command_shape("find", {"find": "transactions", "filter": {"project_id": "p1"}, "sort": {"created_at": -1}})
+    second = server.command_shape("find", {"find": "transactions", "filter": {"project_id": "p2"}, "sort": {"created_at": -1}})
+    assert first == second == {"filter": {"project_id": "?"}, "sort": {"created_at": -1}}
+
+    pipeline = server.command_shape("aggregate", {"aggregate": "inventory_events", "pipeline": [
+        {"$match": {"created_at": {"$lt": "2025-01-01"}}},
+        {"$group": {"_id": "$inventory_id", "total": {"$sum": "$quantity"}}}
+    ]})
+    assert pipeline == {"pipeline": [{"$match": {"created_at": {"$lt": "?"}}}, {"$group": "..."}]}
+    assert server.command_shape("update", {"updates": [{"q": {"id": "x"}, "u": {"$set": {"a": 1}}}]}) == {"q": {"id": "?"}}
+
+
+def test_redact_explain_keeps_no_literals():
+    explain = {
+        "command": {"find": "users", "filter": {"email": "someone@example.com"}},
+        "queryPlanner": {
+            "parsedQuery": {"email": {"$eq": "someone@example.com"}},
+            "winningPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "email_1", "indexBounds": {"email": ['["someone@example.com", "someone@example.com"]']}}
+            }
+        }
+    }
+    redacted = server.redact_explain(explain)
+    assert "someone@example.com" not in repr(redacted)
+    assert "command" not in redacted
+    assert server.summarize_explain(redacted) == {"stages": ["FETCH", "IXSCAN"], "indexes": ["email_1"], "collscan": False}
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def stock(db, inventory_id, quantity):
+    await db.inventory.insert_one({
+        "id": inventory_id, "item_name": inventory_id, "category": "bahan", "unit": "sak", "project_id": "p1",
+        "quantity_in_warehouse": float(quantity), "quantity_out_warehouse": 0.0, "quantity": float(quantity)
+    })
+
+
+def requisition(*lines):
+    return server.WarehouseWithdrawalInput(
+        project_id="p1", items=[server.WarehouseWithdrawalLine(inventory_id=inventory_id, quantity=quantity) for inventory_id, quantity in lines]
+    )
+
+
+async def on_hand(db, inventory_id):
+    return (await db.inventory.find_one({"id": inventory_id}))["quantity_in_warehouse"]
+
+
+async def test_concurrent_withdrawals_never_go_negative(db, admin):
+    await stock(db, "semen", 3)
+    results = await asyncio.gather(
+        *[server.apply_warehouse_withdrawal(requisition(("semen", 1)), "Proyek", admin) for _ in range(10)],
+        return_exceptions=True
+    )
+    booked = [result for result in results if not isinstance(result, Exception)]
+    assert len(booked) == 3
+    assert all(isinstance(result, HTTPException) for result in results if isinstance(result, Exception))
+    assert await on_hand(db, "semen") == 0
+    assert await db.warehouse_transactions.count_documents({}) == 3
+
+
+async def test_short_line_rolls_back_the_requisition(db, admin, monkeypatch):
+    await stock(db, "semen", 5)
+    await stock(db, "pasir", 5)
+    # Another withdrawal empties pasir between the stock check and the guarded decrement
+    update_one = type(db.inventory).update_one
+
+    async def update_after_competitor(self, filter, update, *args, **kwargs):
+        if filter.get("id") == "pasir" and "quantity_in_warehouse" in filter:
+            await update_one(self, {"id": "pasir"}, server.warehouse_stock_update(-5, server.now_wib()))
+        return await update_one(self, filter, update, *args, **kwargs)
+
+    monkeypatch.setattr(type(db.inventory), "update_one", update_after_competitor)
+    with pytest.raises(HTTPException) as error:
+        await server.apply_warehouse_withdrawal(requisition(("semen", 2), ("pasir", 3)), "Proyek", admin)
+    assert error.value.status_code == 409
+    assert await on_hand(db, "semen") == 5
+    assert await db.warehouse_transactions.count_documents({}) == 0
+
+
+async def test_duplicate_lines_are_summed_against_stock(db, admin):
+    await stock(db, "semen", 5)
+    with pytest.raises(HTTPException) as error:
+        await server.apply_warehouse_withdrawal(requisition(("semen", 3), ("semen", 3)), "Proyek", admin)
+    assert error.value.status_code == 400
+    assert await on_hand(db, "semen") == 5
@@ -231,37 +231,27 @@ const RABDetail = () => {
         rabId = createRes.data.id;
       }
 
-      // Update RAB with totals
+      // Totals are maintained by the backend from the items; only the tax rate is set here
       await api.patch(`/rabs/${rabId}`, {
-        tax_percentage: rabData.tax_percentage,
-        subtotal: rabData.subtotal,
-        tax_amount: rabData.tax_amount,
-        total_price: rabData.total_price
+        tax_percentage: rabData.tax_percentage
       });
 
-      // Delete all existing items
-      const existingItems = await api.get(`/rab-items?rab_id=${rabId}`);
-      await Promise.all(
-        existingItems.data.map(item => api.delete(`/rab-items/${item.id}`))
-      );
-
-      // Save all items
-      await Promise.all(
-        items.map(item => {
-          const itemData = {
-            rab_id: rabId,
-            category: item.category,
-            item_number: item.item_number,
-            description: item.description,
-            unit: item.unit,
-            volume: parseFloat(item.volume) || 0,
-            unit_price: parseFloat(item.unit_price) || 0,
-            total_price: parseFloat(item.total_price) || 0,
-            is_category: item.is_category || false
-          };
-          return api.post('/rab-items', itemData);
-        })
-      );
+      // Replace all items in a single bulk request; persisted rows keep their id so they are updated in place
+      await api.post('/rab-items/bulk', {
+        rab_id: rabId,
+        replace: true,
+        items: items.map(item => ({
+          ...(item.id && !String(item.id).startsWith('temp-') ? { id: item.id } : {}),
+          category: item.category,
+          item_number: item.item_number,
+          description: item.description,
+          unit: item.unit,
+          volume: parseFloat(item.volume) || 0,
+          unit_price: parseFloat(item.unit_price) || 0,
+          total_price: parseFloat(item.total_price) || 0,
+          is_category: item.is_category || false
+        }))
+      });
 
       toast.success('RAB berhasil disimpan');
       navigate('/planning/rab');